@@ -42,6 +42,9 @@ logger.addHandler(ch)
 from multiprocessing.dummy import Pool
 
 import synapseclient
+from synAnnotationUtils.cache import EntityCache
+from synAnnotationUtils.instrument import instrument
+from synAnnotationUtils.scheduler import RequestScheduler
 
 syn = synapseclient.Synapse(skip_checks=True)
 syn.login(silent=True)
@@ -187,12 +190,27 @@ def main():
     parser.add_argument("--metadata_cols", help="Columns to get from metadata table (must include column used for UID); None gets all columns [default: %(default)s]",
                         type=str, default=None, nargs="+")
     parser.add_argument("-t", "--threads", help="Number of threads to use [default: %(default)s].", type=int, default=2)
+    parser.add_argument("--rate", help="Maximum number of Synapse requests per second; None does not limit the rate [default: %(default)s]",
+                        type=float, default=None)
+    parser.add_argument("--max-retries", help="Number of times a throttled (HTTP 429/503) request is retried [default: %(default)s]",
+                        type=int, default=8)
+    parser.add_argument("--cache", help="SQLite file caching the Synapse entities between runs; entities whose etag did not change are not downloaded again [default: no cache]",
+                        type=str, default=None)
+    parser.add_argument("--cache-view", help="File view holding the updated files, queried once for their current etags so that cached entities are used without checking them one by one [default: %(default)s]",
+                        type=str, default=None)
+    parser.add_argument("--cache-size", help="Maximum size in MiB of the cache [default: %(default)s]",
+                        type=int, default=512)
+    parser.add_argument("--stats", help="Log the number, latency, errors and bytes of the Synapse calls per method at the end.",
+                        action="store_true", default=False)
     parser.add_argument("--dry-run", help="Perform the requested command without updating anything in Synapse.",
                         action="store_true", default=False)
 
 
     args = parser.parse_args()
 
+    global syn
+    syn = instrument(syn, enabled=args.stats)
+
     with file(args.config) as f:
         config = yaml.load(f)
 
@@ -203,6 +221,14 @@ def main():
 
     mp = Pool(args.threads)
 
+    # Threads share one scheduler, which lowers the number of requests in flight when Synapse throttles them
+    scheduler = RequestScheduler(rate=args.rate, concurrency=args.threads, maxRetries=args.max_retries)
+    workerSyn = scheduler.wrap(syn)
+    if args.cache:
+        workerSyn = EntityCache(args.cache, maxBytes=args.cache_size * 2 ** 20).wrap(workerSyn)
+        if args.cache_view:
+            workerSyn.primeEtags(args.cache_view)
+
     for dataType in dataTypes:
 
         # Metadata
@@ -233,10 +259,14 @@ def main():
         # Update the annotations
         if not args.dry_run:
             logger.info("Updating %s annotations" % dataType)
-            res = mp.map(lambda x: updateAnnots(syn, x, mergedDict2), mergedDict2.keys())
+            res = mp.map(lambda x: updateAnnots(workerSyn, x, mergedDict2), mergedDict2.keys())
+            logger.info("Scheduler: %s" % scheduler.stats())
         else:
             logger.info("Would have updated:")
             merged.to_csv(sys.stdout, sep="\t")
 
+    if args.stats:
+        logger.info("Synapse calls:\n%s" % syn.report())
+
 if __name__ == "__main__":
     main()
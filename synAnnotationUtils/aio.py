@@ -0,0 +1,211 @@
+"""asyncio interface to the annotation functions (Python 3.5+).
+
+synapseclient is a blocking client, so AsyncSynapse runs every call in a thread pool and awaits it. A semaphore
+bounds the number of calls in flight, which lets one process keep hundreds of requests going without the per-call
+threads of bin/update_annotations_from_table.py.
+
+Example:
+
+    import asyncio
+    import synapseclient
+    from synAnnotationUtils import aio
+
+    async def main():
+        asyn = aio.AsyncSynapse(synapseclient.login(), limit=200)
+        try:
+            summary = await aio.updateAnnoByDict(asyn, "syn12345", {"dataType": "testing"})
+        finally:
+            asyn.close()
+
+    asyncio.get_event_loop().run_until_complete(main())
+"""
+
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+
+from . import bulk
+from . import audit
+from . import changes
+from .metadata import MetadataIndex
+from .extensions import SuffixIndex
+
+
+class AsyncSynapse(object):
+    """
+    Awaitable wrappers of the Synapse calls used by this package.
+
+    :param syn:      A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param limit:    Maximum number of calls in flight. Default is 100
+    """
+
+    def __init__(self, syn, limit=100):
+        self.syn = syn
+        self.limit = limit
+        self._executor = ThreadPoolExecutor(max_workers=limit)
+        self._semaphore = None
+        self._loop = None
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking function in the thread pool once a slot is free and returns its result.
+        """
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            # a semaphore belongs to the event loop it is first used in
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get(self, entity, **kwargs):
+        return await self.run(self.syn.get, entity, **kwargs)
+
+    async def store(self, obj, **kwargs):
+        return await self.run(self.syn.store, obj, **kwargs)
+
+    async def getAnnotations(self, entity, **kwargs):
+        return await self.run(self.syn.getAnnotations, entity, **kwargs)
+
+    async def setAnnotations(self, entity, annotations=None, **kwargs):
+        return await self.run(self.syn.setAnnotations, entity, annotations or {}, **kwargs)
+
+    async def tableQuery(self, query, **kwargs):
+        return await self.run(self.syn.tableQuery, query, **kwargs)
+
+    async def storeEntity(self, synEntity, forceVersion=False):
+        """
+        Awaitable bulk.storeEntity, which also handles views.EntityRecord objects.
+        """
+        return await self.run(bulk.storeEntity, self.syn, synEntity, forceVersion)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+async def _entities(asyn, synId, backend, viewId):
+    """
+    Lists the items of bulk.resolveEntities (walking the container in the thread pool) and fetches the Synapse IDs
+    concurrently.
+    """
+    items = await asyn.run(lambda: list(bulk.resolveEntities(asyn.syn, synId, backend, viewId)))
+
+    async def _fetch(item):
+        if isinstance(item, six.string_types):
+            logging.info("Getting File %s ..." % item)
+            return await asyn.get(item, downloadFile=False)
+        return item
+
+    return await asyncio.gather(*[_fetch(item) for item in items])
+
+
+async def _runBulk(asyn, synId, backend, viewId, func):
+    """
+    Awaitable counterpart of bulk.runBulk: applies the coroutine function func to every entity concurrently and
+    returns the same summary dict.
+    """
+    items = await asyn.run(lambda: list(bulk.resolveEntities(asyn.syn, synId, backend, viewId)))
+
+    async def _work(item):
+        entityId = item if isinstance(item, six.string_types) else item.id
+        try:
+            if isinstance(item, six.string_types):
+                logging.info("Getting File %s ..." % item)
+                item = await asyn.get(item, downloadFile=False)
+            return entityId, await func(item), None
+        except Exception as e:
+            logging.error("%s failed: %s" % (entityId, e))
+            return entityId, "failed", e
+
+    summary = {"errors": []}
+    for entityId, status, error in await asyncio.gather(*[_work(item) for item in items]):
+        summary[status] = summary.get(status, 0) + 1
+        if error is not None:
+            summary["errors"].append((entityId, error))
+    return summary
+
+
+async def updateAnnoByDict(asyn, synId, annoDict, forceVersion=False, backend='walk', viewId=None):
+    """
+    Awaitable update.updateAnnoByDict.
+
+    :param asyn:           An AsyncSynapse object
+    :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
+    :param annoDict        A dict of annotations
+    :param forceVersion    Default is False
+    :param backend         'walk' or 'view', see bulk.resolveEntities
+    :param viewId          A Synapse ID of a file view for the 'view' backend
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
+    """
+
+    async def _update(synEntity):
+        changed = changes.diffAnnotations(synEntity.annotations, annoDict)
+        if not changed:
+            return "unchanged"
+        synEntity.annotations.update(changed)
+        await asyn.storeEntity(synEntity, forceVersion=forceVersion)
+        return "changed"
+
+    return await _runBulk(asyn, synId, backend, viewId, _update)
+
+
+async def delAnnoByKey(asyn, synId, keyList, backend='walk', viewId=None):
+    """
+    Awaitable delAnnoByKey.delAnnoByKey.
+
+    :param asyn:           An AsyncSynapse object
+    :param synId:          A Synapse ID of Project, Folder, or File or a list of Synapse IDs
+    :param keyList         A list of annotations keys that needs to be deleted
+    :param backend         'walk' or 'view', see bulk.resolveEntities
+    :param viewId          A Synapse ID of a file view for the 'view' backend
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
+    """
+
+    async def _delete(synEntity):
+        keys = [key for key in keyList if key in synEntity.annotations]
+        if not keys:
+            return "unchanged"
+        for key in keys:
+            synEntity.annotations.pop(key)
+        await asyn.storeEntity(synEntity)
+        return "changed"
+
+    return await _runBulk(asyn, synId, backend, viewId, _delete)
+
+
+async def auditCommonDict(asyn, synId, commonDict, backend='walk', viewId=None):
+    """
+    Awaitable audit.auditCommonDict.
+
+    :return:   entityMissAllAnno, incorrectAnnotated, missingAnno as yielded by audit.auditCommonDict
+    """
+    return audit._collectRecords([audit._helperAuditCommonDict(asyn.syn, synEntity, commonDict)
+                                  for synEntity in await _entities(asyn, synId, backend, viewId)], "missingAllAnno")
+
+
+async def auditAgainstMetadata(asyn, synId, metaDf, refCol, cols2Check, fileExts, backend='walk', viewId=None):
+    """
+    Awaitable audit.auditAgainstMetadata.
+
+    :return:   entityMissMetadata, incorrectAnnotated, missingAnno as yielded by audit.auditAgainstMetadata
+    """
+    metaIndex = MetadataIndex(metaDf, refCol, cols2Check, fileExts)
+    return audit._collectRecords([audit._helperAuditMetadata(asyn.syn, synEntity, metaIndex)
+                                  for synEntity in await _entities(asyn, synId, backend, viewId)], "missingMetadata")
+
+
+async def auditFormatTypeByFileName(asyn, synId, annoKey, annoDict, backend='walk', viewId=None):
+    """
+    Awaitable audit.auditFormatTypeByFileName.
+
+    :return:   The dict of "incorrect", "missingInAnno" and "missingInDict" lists yielded by
+               audit.auditFormatTypeByFileName
+    """
+    suffixIndex = SuffixIndex(annoDict)
+    return audit._collectFormatType([audit._helperAuditFormatTypeByFileName(asyn.syn, synEntity, annoKey, suffixIndex)
+                                     for synEntity in await _entities(asyn, synId, backend, viewId)])
@@ -1,9 +1,25 @@
+import re
+import time
+import logging
+import threading
+import six
 import yaml
-import synapseutils as synu
+import pandas
+from multiprocessing.dummy import Pool
+from . import bulk
+from .plan import RewriteTable, readCorrections
+from .views import EntityRecord
 
+# Queries of a table or view ("select ... from syn123 ...") as opposed to the query service ("... from file ...")
+_TABLE_QUERY = re.compile(r'^\s*select\s.+?\sfrom\s+syn\d+', re.IGNORECASE | re.DOTALL)
+# Queries whose number of rows the server can count: "select <columns> from <table> [where ...]"
+_PLAIN_QUERY = re.compile(r'^\s*select\s+(?!distinct\s)[^()]+?\s+from\s+(?P<table>\S+)(?P<where>\s+where\s.*)?$',
+                          re.IGNORECASE | re.DOTALL)
+_NOT_PLAIN = re.compile(r'\b(group\s+by|having|order\s+by|limit|offset)\b', re.IGNORECASE)
 
 
-def checkAgainstDict(syn, synId, annotDictId,verbose=True):	
+
+def checkAgainstDict(syn, synId, annotDictId,verbose=True,threads=1,backend='walk',viewId=None):	
 	"""
 	Compares annotations in use against dictionary.
 	Gets all annotation keys and values in use in a project and compares against those specified by a dictionary. Prints non-matching terms.
@@ -11,6 +27,9 @@ def checkAgainstDict(syn, synId, annotDictId,verbose=True):
 	:param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
 	:param synId:          A Synapse ID of Project or Folder
 	:param annotDictId     A Synapse ID of annotation dictionary in YAML
+	:param threads         Number of threads getting annotations with the 'walk' backend. Default is 1
+	:param backend         'walk' (default) walks the container and gets the annotations of every File, 'view' reads them in bulk from a file view (see bulk.resolveEntities)
+	:param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
 
 	Return:
 		If synId is an ID of a Project/Folder
@@ -26,23 +45,7 @@ def checkAgainstDict(syn, synId, annotDictId,verbose=True):
 	with open(yamlEnt.path) as f:
 		annotations = yaml.load(f)
 
-	allKeysInProject = set()
-	allValsInProject = set()
-
-	systemKeysToExclude = ['creationDate', 'etag', 'id', 'uri', 'accessControl']
-
-	directory = synu.walk(syn,synId)
-	for dirpath,dirname,files in directory:
-		for item in files:
-			temp = syn.getAnnotations(item[1])
-			for key in temp:
-				if key in systemKeysToExclude: continue
-				allKeysInProject.add(key)
-				if isinstance(temp[key], list):
-					for val in temp[key]:
-						allValsInProject.add(str(val))
-				else:
-					allValsInProject.add(str(temp[key]))
+	allKeysInProject, allValsInProject = collectAnnotations(syn, synId, threads, backend, viewId)
 
 	print 'Number of key terms in project: %d' % len(allKeysInProject)
 	print 'Number of value terms in project: %d' % len(allValsInProject)
@@ -73,9 +76,96 @@ def checkAgainstDict(syn, synId, annotDictId,verbose=True):
 
 
 
-def countQueryResults(sql,syn):
-	'''Counts number of entities returned by a query.'''
+def collectAnnotations(syn, synId, threads=1, backend='walk', viewId=None, progressEvery=1000):
+	"""
+	Gets all annotation keys and values in use in a Project or Folder.
+	Each worker thread adds the annotations it gets to its own sets, which are merged at the end. Progress and throughput are logged every progressEvery Files.
+
+	:param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+	:param synId:          A Synapse ID of Project or Folder
+	:param threads         Number of threads getting annotations with the 'walk' backend. Default is 1
+	:param backend         'walk' (default) walks the container and gets the annotations of every File, 'view' reads them in bulk from a file view (see bulk.resolveEntities)
+	:param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+	:param progressEvery   Number of Files between two progress messages
+
+	Return:
+		allKeysInProject:  A set of annotation keys in use
+		allValsInProject:  A set of annotation values in use, as strings
 
+	"""
+
+	systemKeysToExclude = ['creationDate', 'etag', 'id', 'uri', 'accessControl']
+
+	workerSets = []
+	local = threading.local()
+	lock = threading.Lock()
+	progress = {'files': 0}
+	started = time.time()
+
+	def _collect(syn, item):
+		if not hasattr(local, 'sets'):
+			local.sets = (set(), set())
+			with lock:
+				workerSets.append(local.sets)
+		keys, values = local.sets
+		temp = syn.getAnnotations(item) if isinstance(item, six.string_types) else item.annotations
+		for key in temp:
+			if key in systemKeysToExclude: continue
+			keys.add(key)
+			if isinstance(temp[key], list):
+				for val in temp[key]:
+					values.add(str(val))
+			else:
+				values.add(str(temp[key]))
+		with lock:
+			progress['files'] += 1
+			if progress['files'] % progressEvery == 0:
+				logging.info('Collected annotations of %d files (%.1f files/s)' % (progress['files'], progress['files'] / (time.time() - started)))
+
+	summary = bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _collect, threads=threads, fetch=False)
+	if summary['errors']:
+		raise summary['errors'][0][1]
+
+	elapsed = time.time() - started
+	logging.info('Collected annotations of %d files in %.1f s (%.1f files/s)' % (progress['files'], elapsed, progress['files'] / elapsed if elapsed else 0.0))
+
+	allKeysInProject = set()
+	allValsInProject = set()
+	for keys, values in workerSets:
+		allKeysInProject |= keys
+		allValsInProject |= values
+	return allKeysInProject, allValsInProject
+
+
+
+def _plainQuery(sql):
+	'''Splits a plain "select <columns> from <table> [where ...]" query into its table and where clause, None for any other query.'''
+
+	match = _PLAIN_QUERY.match(sql.strip().rstrip(';'))
+	if match is None or _NOT_PLAIN.search(match.group('where') or ''):
+		return None
+	return match.group('table'), match.group('where') or ''
+
+
+
+def countQueryResults(sql,syn,serverCount=True):
+	'''Counts number of entities returned by a query.
+
+	Asks the server for the count only when the query is a plain "select <columns> from <table> [where ...]": a table query (i.e. against a file view, "select id from syn123 where ...") is run as "select count(*) ...", a query of the query service is run with a limit of one row and its totalNumberOfResults is read. Other queries (distinct, group by, limit, ...), queries the server cannot count, or serverCount False, are paged through and counted.'''
+
+	plain = _plainQuery(sql) if serverCount else None
+	if plain is not None:
+		table, where = plain
+		try:
+			if _TABLE_QUERY.match(sql):
+				countSql = 'select count(*) from %s%s' % (table, where)
+				return int(syn.tableQuery(countSql, resultsAs='rowset').asDataFrame().iloc[0, 0])
+			return int(syn.query('%s limit 1 offset 1' % sql.strip().rstrip(';'))['totalNumberOfResults'])
+		except Exception as e:
+			logging.warning('Counting "%s" on the server failed (%s), paging through the results.' % (sql, e))
+
+	if _TABLE_QUERY.match(sql):
+		return len(syn.tableQuery(sql, resultsAs='rowset').asDataFrame())
 	results = syn.chunkedQuery(sql)
 	count = 0
 	for i in results:
@@ -83,6 +173,23 @@ def countQueryResults(sql,syn):
 	return count
 
 
+
+def countQueryResultsBatch(sqls,syn,threads=4,serverCount=True):
+	'''Counts number of entities returned by each query of a list, running threads queries at a time.
+
+	Returns the list of counts, in the order of sqls.'''
+
+	if threads <= 1:
+		return [countQueryResults(sql, syn, serverCount) for sql in sqls]
+	pool = Pool(threads)
+	try:
+		return pool.map(lambda sql: countQueryResults(sql, syn, serverCount), sqls)
+	finally:
+		pool.close()
+		pool.join()
+
+
+
 def countPerAnnot(annotDictSynID, project, syn, grouping=None):
 	'''Counts instances of key-value pairs.
 
@@ -120,6 +227,67 @@ def countPerAnnot(annotDictSynID, project, syn, grouping=None):
 
 
 
+def _dictionaryPairs(annotations):
+	'''Lists the (key, value) pairs of an annotation dictionary, values as strings.'''
+
+	pairs = []
+	for key in annotations:
+		values = annotations[key] if isinstance(annotations[key], list) else [annotations[key]]
+		for val in values:
+			pairs.append((key, str(val)))
+	return pairs
+
+
+
+def countPerAnnotFrame(annotDictSynID, project, syn, grouping=None, backend='walk', viewId=None):
+	"""
+	Counts instances of key-value pairs like countPerAnnot, from one read of the annotations.
+	The annotations of every File are read once (or read in bulk from a file view) instead of one query per key-value pair, and all the counts are computed in a single pass over a data frame of (id, key, value) rows.
+
+	:param annotDictSynID  A Synapse ID of annotation dictionary in YAML
+	:param project         A Synapse ID of Project or Folder
+	:param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+	:param grouping        An annotation key of the dictionary to stratify the counts by
+	:param backend         'walk' (default) walks the container and gets every File, 'view' reads the Files and their annotations in bulk from a file view (see bulk.resolveEntities)
+	:param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one in the project
+
+	Return:
+		A data frame indexed by (key, value) for every key-value pair of the dictionary, with a 'count' column of the number of Files annotated with the pair, or with grouping one column per value of the grouping key.
+
+	Example:
+		counts = countPerAnnotFrame("syn45678","syn12345",syn,grouping="dataType",backend="view",viewId="syn23456")
+
+	"""
+
+	yamlEnt = syn.get(annotDictSynID)
+	with open(yamlEnt.path) as f:
+		annotations = yaml.safe_load(f)
+
+	ids = []
+	keys = []
+	values = []
+	for synEntity in bulk.iterEntities(syn, bulk.resolveEntities(syn, project, backend, viewId)):
+		for key, vl in synEntity.annotations.items():
+			if key not in annotations: continue
+			for val in (vl if isinstance(vl, list) else [vl]):
+				ids.append(synEntity.id)
+				keys.append(key)
+				values.append(str(val))
+	inUse = pandas.DataFrame({'id': ids, 'key': keys, 'value': values}).drop_duplicates()
+
+	pairs = pandas.MultiIndex.from_tuples(_dictionaryPairs(annotations), names=['key', 'value'])
+	if grouping is None:
+		counts = inUse.groupby(['key', 'value']).size()
+		return pandas.DataFrame({'count': counts.reindex(pairs, fill_value=0)})
+
+	groups = inUse.loc[inUse['key'] == grouping, ['id', 'value']].rename(columns={'value': grouping})
+	grouped = inUse.merge(groups, on='id')
+	counts = grouped.groupby(['key', 'value', grouping]).size().unstack(grouping)
+	groupValues = [val for key, val in _dictionaryPairs({grouping: annotations[grouping]})]
+	return counts.reindex(index=pairs, columns=groupValues).fillna(0).astype(int)
+
+
+
 def updateKey(oldKey,newKey,inAnnot):
 	'''Replaces oldKey with newKey.
 	
@@ -132,42 +300,47 @@ def updateKey(oldKey,newKey,inAnnot):
 
 
 
-def correctAnnot(syn,synId,projSynId,correctionsFile):
+def _helperCorrectAnnot(syn, item, table):
+	'''Applies a plan.RewriteTable to one File, writing its annotations once if any rule changed them.'''
+
+	if isinstance(item, EntityRecord):
+		corrected = table.apply(item.annotations)
+		if corrected is item.annotations or corrected == item.annotations: return 'unchanged'
+		item.annotations = corrected
+		bulk.storeEntity(syn, item)
+		return 'corrected'
+
+	entityId = item if isinstance(item, six.string_types) else item.id
+	temp = syn.getAnnotations(entityId)
+	corrected = table.apply(temp)
+	if corrected is temp or corrected == temp: return 'unchanged'
+	syn.setAnnotations(entityId, corrected)
+	return 'corrected'
+
+
+
+def correctAnnot(syn,synId,projSynId,correctionsFile,threads=1,backend='walk',viewId=None):
 	"""
 	Propagates annotation changes based on tab-delimited input.
-	Given a tab-separated file containing annotations to be updated, changes annotations across a project. File contains one line per key-value pair, if line has two entries, they are assumed to be oldKey and newKey, if three entries, they are assumed to be key, oldValue, newValue.'''
+	Given a tab-separated file containing annotations to be updated, changes annotations across a project. File contains one line per key-value pair, if line has two entries, they are assumed to be oldKey and newKey, if three entries, they are assumed to be key, oldValue, newValue.
+	The corrections are compiled into a plan.RewriteTable and applied, in file order, in a single traversal of synId: each File is read once and its annotations are written at most once, whatever the number of matching corrections.
 
 	:param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
 	:param synId:          A Synapse ID of Project or Folder
-	:param projSynId:      A Synapse ID of Project (possibly duplicate of synId).
+	:param projSynId:      A Synapse ID of Project (possibly duplicate of synId). Not used anymore: value corrections apply to the Files of synId like key renames.
 	:param correctionsFile Path to a tab-delimited file of old and new annotation values.
+	:param threads         Number of threads correcting Files. Default is 1
+	:param backend         'walk' (default) walks the container and gets the annotations of every File, 'view' reads them in bulk from a file view and writes only the corrected Files (see bulk.resolveEntities)
+	:param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+
+	Return:
+		A dict with the number of Files "corrected" and "unchanged", and an "errors" list of (Synapse ID, exception) tuples (see bulk.runBulk)
 
 	Example:
 		correctAnnot(syn,"syn12345","syn45678","annotation_corrections.txt")
 
 	"""
 
-	with open(correctionsFile) as toChange:
-		for line in toChange:
-			items = line.strip().split('\t')
-			if len(items) == 2: # update keys
-				old = items[0]
-				new = items[1]
-				directory = synu.walk(syn,synId)
-				for dirpath,dirname,files in directory:
-					for item in files:
-						temp = syn.getAnnotations(item[1])
-						if old not in temp: continue
-						correctedAnnotations = updateKey(oldKey=old,newKey=new,inAnnot=temp)
-						savedAnnotations = syn.setAnnotations(result['file.id'],correctedAnnotations)
-			elif len(items) > 2: # update values
-				kKey = items.pop(0)
-				old = items.pop(0)
-				sql = 'select id,%s from file where projectId=="%s" and file.%s=="%s"' % (kKey,projSynId,kKey,old)
-				results = syn.chunkedQuery(sql)
-				for result in results:
-					temp = syn.getAnnotations(result['file.id'])
-					if kKey not in temp: continue
-					temp[kKey] = items
-					savedAnnotations = syn.setAnnotations(result['file.id'],temp)
-
+	table = RewriteTable(readCorrections(correctionsFile))
+	logging.info('Applying %d corrections in one traversal of %s' % (len(table), synId))
+	return bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _helperCorrectAnnot, args=(table,), threads=threads, fetch=False)
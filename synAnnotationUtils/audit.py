@@ -1,13 +1,133 @@
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from array import array
 import logging
+import pandas
+from . import bulk
+from .metadata import MetadataIndex
+from .extensions import SuffixIndex
+
+# The result of auditing one entity, as yielded by the iterAudit* generators. status is "pass", "fail" (a key is
+# incorrect or missing), "missingAllAnno" (no annotations at all), "missingMetadata" (auditAgainstMetadata) or
+# "missingInDict" (auditFormatTypeByFileName). incorrect and missing are tuples of annotation keys
+AuditRecord = namedtuple('AuditRecord',['id','status','incorrect','missing','entity'])
+
+def auditRecordRow(record):
+    """
+    Turns an AuditRecord into a flat dict (without the entity) for csv.DictWriter or a data frame
+    """
+    return {'id':record.id,'status':record.status,'incorrect':','.join(record.incorrect),
+            'missing':','.join(record.missing)}
+
+try:
+    array('q')
+    ID_TYPECODE = 'q'
+except ValueError:  # Python 2 has no long long arrays
+    ID_TYPECODE = 'l'
+
+def _numericId(synId):
+    if not synId.startswith('syn') or not synId[3:].isdigit():
+        raise ValueError("%r is not a Synapse ID" % synId)
+    return int(synId[3:])
+
+class LazyEntities(object):
+    """
+    A list of Synapse IDs that gets each entity only when it is iterated over, which is how the update functions
+    (i.e. update.updateAnnoByIdDictFromDict) read the lists of an audit result
+    """
+
+    def __init__(self, syn, synIds):
+        self.syn = syn
+        self.synIds = synIds
+
+    def __len__(self):
+        return len(self.synIds)
+
+    def __iter__(self):
+        for synId in self.synIds:
+            yield self.syn.get(synId,downloadFile=False)
+
+class CompactAuditResult(object):
+    """
+    The outcome of an audit as numeric Synapse IDs in arrays, one array per (status or "incorrect"/"missing",
+    annotation key), instead of lists of entities. Memory stays at 8 bytes per flagged entity and key, and every
+    key string is held once.
+
+    Example:
+       result = CompactAuditResult.fromRecords(iterAuditCommonDict(syn,"syn12345",{"dataType":"testing"}))
+       result.ids("missing","dataType")
+       updateAnnoByIdDictFromDict(syn,result.rehydrate(syn,"incorrect"),{"dataType":"testing"})
+
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self.audited = 0
+
+    @classmethod
+    def fromRecords(cls, records):
+        """
+        Builds a result from a stream of AuditRecords, dropping each entity once it is recorded
+        """
+        result = cls()
+        for record in records:
+            result.add(record)
+        return result
+
+    def _append(self, category, key, numericId):
+        ids = self._ids.get((category,key))
+        if ids is None:
+            ids = self._ids[(category,key)] = array(ID_TYPECODE)
+        ids.append(numericId)
+
+    def add(self, record):
+        numericId = _numericId(record.id)
+        self.audited += 1
+        if record.status not in ("pass","fail"):
+            self._append(record.status,None,numericId)
+        for key in record.incorrect:
+            self._append("incorrect",key,numericId)
+        for key in record.missing:
+            self._append("missing",key,numericId)
+
+    def keys(self, category):
+        """
+        :return:   The annotation keys with entities under "incorrect" or "missing"
+        """
+        return sorted(key for cat,key in self._ids if cat == category)
+
+    def ids(self, category, key=None):
+        """
+        :param category:   "incorrect" or "missing" with a key, or a status (i.e. "missingAllAnno") without
+        :return:           A list of Synapse IDs
+        """
+        return ['syn%d' % numericId for numericId in self._ids.get((category,key),())]
+
+    def idDict(self, category):
+        """
+        :return:   A dict of annotation key to list of Synapse IDs for "incorrect" or "missing"
+        """
+        return dict((key,self.ids(category,key)) for key in self.keys(category))
+
+    def rehydrate(self, syn, category, key=None):
+        """
+        :return:   For "incorrect" or "missing" without a key, a dict of annotation key to LazyEntities, in the shape
+                   the update functions take; otherwise the LazyEntities of one category and key
+        """
+        if category in ("incorrect","missing") and key is None:
+            return dict((key,LazyEntities(syn,self.ids(category,key))) for key in self.keys(category))
+        return LazyEntities(syn,self.ids(category,key))
 
 # Audit common dictionary
-def auditCommonDict(syn, synId, commonDict):
+def auditCommonDict(syn, synId, commonDict, backend='walk', viewId=None, compact=False):
     """
     Audit entity annotations against common dictionary shared among all enities
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
     :param synId:          A Synapse ID of Project, Folder, or File
     :param annoDict        A dict of annotations shared among entities
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param compact         If True, the generator yields a CompactAuditResult of Synapse IDs instead
     
     A generator that contains:
         entityMissAllAnno:     A list of Synapse IDs that have not been annotatd
@@ -22,61 +142,141 @@ def auditCommonDict(syn, synId, commonDict):
 
     """
 
-    entityMissAllAnno = []
+    records = iterAuditCommonDict(syn,synId,commonDict,backend,viewId)
+    if compact:
+        yield CompactAuditResult.fromRecords(records)
+        return
+    yield _collectRecords(records,"missingAllAnno")
+
+def iterAuditCommonDict(syn, synId, commonDict, backend='walk', viewId=None):
+    """
+    Streaming auditCommonDict: yields an AuditRecord per entity as soon as it is audited
+    (same arguments as auditCommonDict)
+
+    Example:
+       for record in iterAuditCommonDict(syn,"syn12345",{"dataType":"testing"}):
+           writer.writerow(auditRecordRow(record))
+
+    """
+    logging.info("Check annotations against common dictionary.")
+    for synEntity in bulk.iterEntities(syn,bulk.resolveEntities(syn,synId,backend,viewId)):
+        yield _helperAuditCommonDict(syn,synEntity,commonDict)
+
+def _collectRecords(records, missingStatus):
+    """
+    Builds the result of auditCommonDict/auditAgainstMetadata from a stream of AuditRecords
+    """
+    entityMissing = []
     incorrectAnnotated = defaultdict(list)
     missingAnno = defaultdict(list)
-    logging.info("Check annotations against common dictionary.")
-    synObj = syn.get(synId,downloadFile = False)
-    if not is_container(synObj):
-        logging.info("%s is a File" % synId)
-        tempEntityMissAllAnno,tempIncorrectAnnotated,tempMissingAnno = _helperAuditCommonDict(syn,synObj,annoDict)
-        entityMissAllAnno.append(tempEntityMissAllAnno)
-        incorrectAnnotated.update(tempIncorrectAnnotated)
-        missingAnno.update(tempMissingAnno)
-    else:
-        directory = synu.walk(syn,synId)
-        for dirpath,dirname,filename in directory:
-            for i in filename:
-                ent = syn.get(i[1],downloadFile = False)
-                logging.info("Getting file %s ..." % i[1])
-                tempEntityMissAllAnno,tempIncorrectAnnotated,tempMissingAnno = _helperAuditCommonDict(syn,synObj,annoDict)
-                entityMissAllAnno.append(tempEntityMissAllAnno)
-                incorrectAnnotated.update(tempIncorrectAnnotated)
-                missingAnno.update(tempMissingAnno)
-    
-    yield entityMissAllAnno,incorrectAnnotated,missingAnno
-                
+    for record in records:
+        if record.status == missingStatus:
+            entityMissing.append(record.entity)
+        for key in record.incorrect:
+            incorrectAnnotated[key].append(record.entity)
+        for key in record.missing:
+            missingAnno[key].append(record.entity)
+    return entityMissing,incorrectAnnotated,missingAnno
+
 def _helperAuditCommonDict(syn, synEntity, commonDict):
     logging.info("Checking...")
 
-    entityMissAllAnno = []
-    incorrectAnnotated = defaultdict(list)
-    missingAnno = defaultdict(list)
-    
-    if synEntity.annotations:
-        novel, missing, modified = dict_compare(synEntity.annotations, commonDict)
-        # Check if any annotation keys only found in entity annotations
-        if novel > 0:
-            logging.info("Keys: found ONLY in entity annotations")
-            logging.info(", ".join(str(x) for x in novel))
-        # Check if any annotation keys are not found in entity annotations
-        if missing > 0:
-            for x in missing:
-                missingAnno[x].append(synEntity)
-            logging.info("Keys: NOT found in entity annotations")
-            logging.info(", ".join(str(x) for x in missing))
-        # Check if any annotation keys were annotated incorrectly
-        if modified > 0:
-            for x in modified:
-                incorrectAnnotated[x].append(synEntity)
-            logging.info("Values: incorrect in entity annotations")
-            logging.info(", ".join(str(x) for x in modified))
-        if len(added)+len(removed)+len(modified) == 0:
-            logging.info("Pass.")
-    else:
+    if not synEntity.annotations:
         logging.info("Annotations: missing")
-        entityMissAllAnno.append(synEntity)
-    return entityMissAllAnno,incorrectAnnotated,missingAnno
+        return AuditRecord(synEntity.id,"missingAllAnno",(),(),synEntity)
+
+    novel, missing, modified = dict_compare(synEntity.annotations, commonDict)
+    # Check if any annotation keys only found in entity annotations
+    if novel:
+        logging.info("Keys: found ONLY in entity annotations")
+        logging.info(", ".join(str(x) for x in novel))
+    # Check if any annotation keys are not found in entity annotations
+    if missing:
+        logging.info("Keys: NOT found in entity annotations")
+        logging.info(", ".join(str(x) for x in missing))
+    # Check if any annotation keys were annotated incorrectly
+    if modified:
+        logging.info("Values: incorrect in entity annotations")
+        logging.info(", ".join(str(x) for x in modified))
+    if len(missing)+len(modified) == 0:
+        logging.info("Pass.")
+        return AuditRecord(synEntity.id,"pass",(),(),synEntity)
+    return AuditRecord(synEntity.id,"fail",tuple(modified),tuple(missing),synEntity)
+
+def annotationFrame(syn, synId, backend='walk', viewId=None):
+    """
+    Loads the annotations of entities into a data frame for auditCommonDictFrame
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view, much faster for large containers but without
+                           viewId a temporary view is created in the project (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+
+    Return:
+        A data frame indexed by Synapse ID with one column per annotation key. A cell holds the annotation values
+        joined into a string, or NaN if the entity does not have the key
+
+    """
+    ids = []
+    rows = []
+    for synEntity in bulk.iterEntities(syn,bulk.resolveEntities(syn,synId,backend,viewId)):
+        ids.append(synEntity.id)
+        rows.append(dict((key,_joinValues(value)) for key,value in synEntity.annotations.items()))
+    return pandas.DataFrame.from_records(rows,index=pandas.Index(ids,name='id'))
+
+def _joinValues(value):
+    if isinstance(value,(list,tuple)):
+        return ''.join(str(x) for x in value)
+    return str(value)
+
+def auditCommonDictFrame(annoDf, commonDict):
+    """
+    Vectorized auditCommonDict: audits the annotations loaded by annotationFrame (or the annotation columns of an
+    entity-view data frame indexed by Synapse ID) against a common dictionary, one column at a time
+    :param annoDf          A data frame indexed by Synapse ID with one column of annotation values per key, NaN or
+                           '' where an entity does not have the key
+    :param commonDict      A dict of annotations shared among entities
+
+    Return:
+        A dict of boolean masks aligned on annoDf.index:
+        entityMissAllAnno:     A series, True for entities without any annotation
+        missing:               A data frame with a column per key of commonDict, True where the key is missing
+        incorrect:             A data frame with a column per key of commonDict, True where the value differs
+        novel:                 A data frame with a column per other key of annoDf, True where the entity has it
+        Use maskIds to turn them into lists of Synapse IDs
+
+    Example:
+       annoDf = annotationFrame(syn,"syn12345",backend="view",viewId="syn45678")
+       result = auditCommonDictFrame(annoDf,{"dataType":"testing","projectName":"foo"})
+       missingAnno = maskIds(result["missing"])
+
+    """
+    present = annoDf.notnull() & (annoDf.astype(object) != '')
+    entityMissAllAnno = ~present.any(axis=1)
+
+    missing = pandas.DataFrame(index=annoDf.index)
+    incorrect = pandas.DataFrame(index=annoDf.index)
+    for key,value in commonDict.items():
+        if key not in annoDf.columns:
+            missing[key] = ~entityMissAllAnno
+            incorrect[key] = False
+            continue
+        missing[key] = ~present[key] & ~entityMissAllAnno
+        incorrect[key] = present[key] & (annoDf[key].astype(str) != _joinValues(value))
+
+    novelKeys = [key for key in annoDf.columns if key not in commonDict]
+    return {'entityMissAllAnno':entityMissAllAnno,'missing':missing,'incorrect':incorrect,
+            'novel':present[novelKeys]}
+
+def maskIds(mask):
+    """
+    Turns a boolean mask returned by auditCommonDictFrame into Synapse IDs: a list for a series, a dict of key to
+    list (keys without any True left out) for a data frame
+    """
+    if isinstance(mask,pandas.Series):
+        return list(mask.index[mask.values])
+    return dict((key,list(mask.index[mask[key].values])) for key in mask.columns if mask[key].any())
 
 def dict_compare(d1, d2):
     d1_keys = set(d1.keys())
@@ -85,9 +285,9 @@ def dict_compare(d1, d2):
     novel = d1_keys - d2_keys
     missing = d2_keys - d1_keys
     modified = [o for o in intersect_keys if ''.join(d1[o]) != d2[o]]
-    return added, missing, modified
+    return novel, missing, modified
 
-def auditAgainstMetadata(syn, synId, metaDf, refCol, cols2Check,fileExts):
+def auditAgainstMetadata(syn, synId, metaDf, refCol, cols2Check,fileExts,backend='walk',viewId=None,compact=False):
     """
     Audit entity annotations against metadata
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
@@ -96,6 +296,10 @@ def auditAgainstMetadata(syn, synId, metaDf, refCol, cols2Check,fileExts):
     :param refCol          A name of the column in metaDf that matching one of the entity attributes
     :param cols2Check      A list of columns in metaDf need to be audited with entity annotations 
     :param fileExts        A list of all file extensions (PsychENCODE ONLY!!!) 
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param compact         If True, the generator yields a CompactAuditResult of Synapse IDs instead
     
     A generator that contains:
       If synId is an ID of a Project/Folder
@@ -110,76 +314,70 @@ def auditAgainstMetadata(syn, synId, metaDf, refCol, cols2Check,fileExts):
        entityMissMetadata,incorrectAnnotated, missingAnno = result.next()
        
     """
-    entityMissMetadata = []
-    incorrectAnnotated = defaultdict(list)
-    missingAnno = defaultdict(list)
+    records = iterAuditAgainstMetadata(syn,synId,metaDf,refCol,cols2Check,fileExts,backend,viewId)
+    if compact:
+        yield CompactAuditResult.fromRecords(records)
+        return
+    yield _collectRecords(records,"missingMetadata")
+
+def iterAuditAgainstMetadata(syn, synId, metaDf, refCol, cols2Check, fileExts, backend='walk', viewId=None):
+    """
+    Streaming auditAgainstMetadata: yields an AuditRecord per entity as soon as it is audited
+    (same arguments as auditAgainstMetadata)
+    """
     logging.info("Check annotations against metadata.")
-    synEntity = syn.get(synId,downloadFile = False)
-    if not is_container(synEntity):
-        logging.info("%s is a File" % synId)
-        tempEntityMissMetadata,tempIncorrectAnnotated,tempMissingAnno = _helperAuditMetadata(syn,synEntity,metaDf,refCol,cols2Check,fileExts)
-        entityMissMetadata.append(tempEntityMissMetadata)
-        incorrectAnnotated.update(tempIncorrectAnnotated)
-        missingAnno.update(tempMissingAnno)
-    else:
-        directory = synu.walk(syn,synId)
-        for dirpath,dirname,filename in directory:
-            for i in filename:
-                synEntity = syn.get(i[1],downloadFile = False)
-                logging.info("Getting File %s ..." % i[1])
-                tempEntityMissMetadata,tempIncorrectAnnotated,tempMissingAnno = _helperAuditMetadata(syn,synEntity,metaDf,refCol,cols2Check,fileExts)
-                ntityMissMetadata.append(tempEntityMissMetadata)
-                incorrectAnnotated.update(tempIncorrectAnnotated)
-                missingAnno.update(tempMissingAnno)
-
-    yield entityMissMetadata,incorrectAnnotated,missingAnno
-
-def _helperAuditMetadata(syn,synEntity,metaDf,refCol,cols2Check,fileExts):
+    metaIndex = MetadataIndex(metaDf,refCol,cols2Check,fileExts)
+    for synEntity in bulk.iterEntities(syn,bulk.resolveEntities(syn,synId,backend,viewId)):
+        yield _helperAuditMetadata(syn,synEntity,metaIndex)
+
+def _helperAuditMetadata(syn,synEntity,metaIndex):
     """
     This helper function is built for PsychENCODE project data release. 
-    The entity name without extension is map to a column in the metadata data frame
+    The entity name without extension is map to a column in the metadata data frame,
+    prepared as a metadata.MetadataIndex.
        
     """
     
     logging.info("Checking annotations against metadata...")
 
-    entityMissMetadata = []
-    incorrectAnnotated = defaultdict(list)
-    missingAnno = defaultdict(list)
-
     entityDict = synEntity.annotations
-    
-    exts = ')|('.join(fileExts)
-    exts = r'(' + exts + ')'
-    entityName = re.sub(exts,"",synEntity.name)
-    
-    if entityDict:
-        row = metaDf.loc[metaDf[refCol] == entityName]
-        if row.empty:
-            entityMissMetadata.append(synEntity)
-            logging.info("missing metadata")
+    if not entityDict:
+        return AuditRecord(synEntity.id,"missingAllAnno",(),(),synEntity)
+
+    row = metaIndex.lookup(synEntity.name)
+    if row is None:
+        logging.info("missing metadata")
+        return AuditRecord(synEntity.id,"missingMetadata",(),(),synEntity)
+
+    incorrect = []
+    missing = []
+    for colName in metaIndex.columns:
+        logging.info("%s checking..." % colName)
+        if colName in entityDict.keys():
+            if row[colName] != synEntity[colName][0]:
+                incorrect.append(colName)
+                logging.info("incorrect")
+            else:
+                logging.info("Passed!")
         else:
-            for colName in cols2Check:
-                logging.info("%s checking..." % colName)
-                if colName in entityDict.keys():
-                    if map(str,row[colName])[0] != synEntity[colName][0]:
-                        incorrectAnnotated[colName].append(synEntity)
-                        logging.info("incorrect")
-                    else:
-                        logging.info("Passed!")
-                else:
-                    missingAnno[colName].append(synEntity)
-                    logging.info("missing")
-    return entityMissMetadata,incorrectAnnotated,missingAnno
-
-def auditFormatTypeByFileName(syn,synId,annoKey,annoDict):
+            missing.append(colName)
+            logging.info("missing")
+    return AuditRecord(synEntity.id,"fail" if incorrect or missing else "pass",tuple(incorrect),tuple(missing),
+                       synEntity)
+
+def auditFormatTypeByFileName(syn,synId,annoKey,annoDict,backend='walk',viewId=None,compact=False):
     """
     Audit entity file type annotations by checking file name with file type annotation
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
     :param synId:          A Synapse ID of Project, Folder, or File
     :param annoKey:        The annotation key for file type. (i.e. "fileType", "fileFormat", or "formatType")
     :param annoDict        A dict where key is the extension of the filename, 
-                           value is the corresponding file type value in entity annotations
+                           value is the corresponding file type value in entity annotations.
+                           The longest extension matching the file name is used
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param compact         If True, the generator yields a CompactAuditResult of Synapse IDs instead
     
     A generator that contains:
         A dict with 3 keys and each value is a list of File Synapse ID 
@@ -192,44 +390,172 @@ def auditFormatTypeByFileName(syn,synId,annoKey,annoDict):
 
     """
     
+    records = iterAuditFormatTypeByFileName(syn,synId,annoKey,annoDict,backend,viewId)
+    if compact:
+        yield CompactAuditResult.fromRecords(records)
+        return
+    yield _collectFormatType(records)
+
+def iterAuditFormatTypeByFileName(syn,synId,annoKey,annoDict,backend='walk',viewId=None):
+    """
+    Streaming auditFormatTypeByFileName: yields an AuditRecord per entity as soon as it is audited
+    (same arguments as auditFormatTypeByFileName)
+    """
+    suffixIndex = SuffixIndex(annoDict)
+    for synEntity in bulk.iterEntities(syn,bulk.resolveEntities(syn,synId,backend,viewId)):
+        yield _helperAuditFormatTypeByFileName(syn,synEntity,annoKey,suffixIndex)
+
+def _collectFormatType(records):
+    """
+    Builds the result of auditFormatTypeByFileName from a stream of AuditRecords
+    """
     auditResult = defaultdict(list)
-    
-    synEntity = syn.get(synId,downloadFile = False)
-    if not is_container(synEntity):
-        logging.info("%s is a File" % synId)
-        tempAuditResult = _helperAuditFormatTypeByFileName(syn,synEntity,annoKey,annoDict)
-        auditResult.update(tempAuditResult)
-
-    else:
-        directory = synu.walk(syn,synId)
-        for dirpath,dirname,filename in directory:
-            for i in filename:
-                temp = syn.get(i[1],downloadFile = False)
-                logging.info("Getting File %s ..." % i[1])
-                tempAuditResult = _helperAuditFormatTypeByFileName(syn,synEntity,annoKey,annoDict)
-                auditResult.update(tempAuditResult)
-    yield needAnnotated
-
-def _helperAuditFormatTypeByFileName(syn,synEntity,annoKey,annoDict):
+    for record in records:
+        if record.status == "missingInDict":
+            auditResult["missingInDict"].append(record.entity)
+        elif record.incorrect:
+            auditResult["incorrect"].append(record.entity)
+        elif record.missing:
+            auditResult["missingInAnno"].append(record.entity)
+    return auditResult
+
+def _helperAuditFormatTypeByFileName(syn,synEntity,annoKey,suffixIndex):
     logging.info("Checking %s..." % annoKey)
-    auditResult = defaultdict(list)
 
-    entityName = synEntity.name
-    entityType = ""
-    for ext in annoDict.keys():
-        if entityName.endswith(ext):
-            entityType = annoDict[ext]
-            if annoKey in synEntity.annotations.keys():
-                if synEntity[annoKey][0] != entityType:
-                    auditResult["incorrect"].append(synEntity)
-                    logging.info("Incorrect")
-                else:
-                    logging.info("Passed!")
-            else:
-                auditResult["missingInAnno"].append(synEntity)
-                logging.info("Missing in entity annotations")
-            break
-    if entityType == "":
-        auditResult["missingInDict"].append(synEntity)
+    match = suffixIndex.match(synEntity.name)
+    if match is None:
         logging.info("Missing file types dictionary")
-    return auditResult
+        return AuditRecord(synEntity.id,"missingInDict",(),(),synEntity)
+
+    entityType = match[1]
+    if annoKey not in synEntity.annotations.keys():
+        logging.info("Missing in entity annotations")
+        return AuditRecord(synEntity.id,"fail",(),(annoKey,),synEntity)
+    if synEntity[annoKey][0] != entityType:
+        logging.info("Incorrect")
+        return AuditRecord(synEntity.id,"fail",(annoKey,),(),synEntity)
+    logging.info("Passed!")
+    return AuditRecord(synEntity.id,"pass",(),(),synEntity)
+
+def _helperAuditVocabulary(syn,synEntity,vocabulary):
+    logging.info("Checking values against vocabulary...")
+
+    if not synEntity.annotations:
+        logging.info("Annotations: missing")
+        return AuditRecord(synEntity.id,"missingAllAnno",(),(),synEntity)
+
+    incorrect = [key for key in vocabulary if key in synEntity.annotations
+                 and any(value not in vocabulary[key] for value in synEntity[key])]
+    if incorrect:
+        logging.info("Values: not in vocabulary")
+        logging.info(", ".join(str(x) for x in incorrect))
+        return AuditRecord(synEntity.id,"fail",tuple(incorrect),(),synEntity)
+    logging.info("Pass.")
+    return AuditRecord(synEntity.id,"pass",(),(),synEntity)
+
+# Rules of auditRules, each one auditing an entity like one of the audit functions above
+class CommonDictRule(object):
+    """
+    The audit of auditCommonDict, collected in its result shape
+    """
+
+    def __init__(self, commonDict):
+        self.commonDict = commonDict
+
+    def audit(self, syn, synEntity):
+        return _helperAuditCommonDict(syn,synEntity,self.commonDict)
+
+    def collect(self, records):
+        return _collectRecords(records,"missingAllAnno")
+
+class MetadataRule(object):
+    """
+    The audit of auditAgainstMetadata (same arguments), collected in its result shape
+    """
+
+    def __init__(self, metaDf, refCol, cols2Check, fileExts):
+        self.metaIndex = MetadataIndex(metaDf,refCol,cols2Check,fileExts)
+
+    def audit(self, syn, synEntity):
+        return _helperAuditMetadata(syn,synEntity,self.metaIndex)
+
+    def collect(self, records):
+        return _collectRecords(records,"missingMetadata")
+
+class FormatTypeRule(object):
+    """
+    The audit of auditFormatTypeByFileName (same arguments), collected in its result shape
+    """
+
+    def __init__(self, annoKey, annoDict):
+        self.annoKey = annoKey
+        self.suffixIndex = SuffixIndex(annoDict)
+
+    def audit(self, syn, synEntity):
+        return _helperAuditFormatTypeByFileName(syn,synEntity,self.annoKey,self.suffixIndex)
+
+    def collect(self, records):
+        return _collectFormatType(records)
+
+class VocabularyRule(object):
+    """
+    Checks that every value of the listed annotation keys is one of the allowed values. Keys an entity is not
+    annotated with are not checked. Collected in the shape of auditCommonDict, with no missing keys.
+
+    :param vocabulary      A dict where key is the annotation key and value is a list of allowed values
+    """
+
+    def __init__(self, vocabulary):
+        self.vocabulary = dict((key,frozenset(values)) for key,values in vocabulary.items())
+
+    def audit(self, syn, synEntity):
+        return _helperAuditVocabulary(syn,synEntity,self.vocabulary)
+
+    def collect(self, records):
+        return _collectRecords(records,"missingAllAnno")
+
+def auditRules(syn, synId, rules, backend='walk', viewId=None, compact=False):
+    """
+    Audit entity annotations against several rules in one pass, getting each File once
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File
+    :param rules           A list of CommonDictRule, MetadataRule, FormatTypeRule or VocabularyRule
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param compact         If True, the result of every rule is a CompactAuditResult of Synapse IDs instead
+
+    A generator that contains:
+        A list with the result of each rule, in the order of rules and in the shape of the matching audit function
+        (i.e. (entityMissAllAnno, incorrectAnnoated, missingAnno) for a CommonDictRule)
+
+    Example:
+       rules = [CommonDictRule({"dataType":"testing"}),
+                FormatTypeRule("fileType",{".bam":"bam"}),
+                VocabularyRule({"assay":["rnaSeq","wgs"]})]
+       commonResult, formatResult, vocabularyResult = auditRules(syn,"syn12345",rules).next()
+
+    """
+    records = iterAuditRules(syn,synId,rules,backend,viewId)
+    if compact:
+        results = [CompactAuditResult() for rule in rules]
+        for entityRecords in records:
+            for result,record in zip(results,entityRecords):
+                result.add(record)
+        yield results
+        return
+
+    ruleRecords = [[] for rule in rules]
+    for entityRecords in records:
+        for recordList,record in zip(ruleRecords,entityRecords):
+            recordList.append(record)
+    yield [rule.collect(recordList) for rule,recordList in zip(rules,ruleRecords)]
+
+def iterAuditRules(syn, synId, rules, backend='walk', viewId=None):
+    """
+    Streaming auditRules: yields, per entity, a tuple with the AuditRecord of each rule
+    (same arguments as auditRules)
+    """
+    logging.info("Check annotations against %d rules." % len(rules))
+    for synEntity in bulk.iterEntities(syn,bulk.resolveEntities(syn,synId,backend,viewId)):
+        yield tuple(rule.audit(syn,synEntity) for rule in rules)
@@ -0,0 +1,183 @@
+import six
+import logging
+import threading
+import synapseutils
+from multiprocessing.dummy import Pool
+from synapseclient.entity import is_container
+from .views import EntityRecord, iterViewRecords
+from .journal import openJournal
+
+
+def iterFileIds(syn, synId):
+    """
+    Walks a Project or Folder and yields the Synapse ID of every File found in it.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project or Folder
+    """
+    directory = synapseutils.walk(syn, synId)
+    for dirpath, dirname, filename in directory:
+        for i in filename:
+            yield i[1]
+
+
+def resolveEntities(syn, synId, backend='walk', viewId=None):
+    """
+    Turns the synId argument accepted by the update functions into the items handed to runBulk.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
+    :param backend:        How the Files of a container are enumerated: 'walk' walks the container and yields
+                           Synapse IDs that are fetched one by one, 'view' reads ids, names, etags and annotations in
+                           bulk from a file view and yields views.EntityRecord objects
+    :param viewId:         A Synapse ID of a file view to use with the 'view' backend, see views.iterViewRecords
+    :return:               The list itself, a one element list holding the File, or a generator of File
+                           Synapse IDs or EntityRecords for containers
+    """
+    if backend not in ('walk', 'view'):
+        raise ValueError("Unknown backend %r, use 'walk' or 'view'." % backend)
+
+    if type(synId) is list:  # Output from audit functions
+        logging.info("Input is a list of Synapse Objects")
+        return synId
+
+    logging.info("Input is a Synpase ID")
+    synEntity = syn.get(synId, downloadFile=False)
+    if not is_container(synEntity):
+        logging.info("%s is a File" % synId)
+        return [synEntity]
+    if backend == 'view':
+        return iterViewRecords(syn, synId, viewId=viewId)
+    return iterFileIds(syn, synId)
+
+
+def iterEntities(syn, items):
+    """
+    Yields the items returned by resolveEntities as entities, getting the Synapse IDs one by one.
+    """
+    for item in items:
+        if isinstance(item, six.string_types):
+            logging.info("Getting File %s ..." % item)
+            item = syn.get(item, downloadFile=False)
+        yield item
+
+
+def storeEntity(syn, synEntity, forceVersion=False):
+    """
+    Stores an entity. For a views.EntityRecord only the annotations changed since it was read from the view are
+    written, on top of the entity's current annotations, after checking its etag did not change in the meantime.
+
+    :return:    The stored entity or record
+    """
+    if isinstance(synEntity, EntityRecord):
+        updated, removed = synEntity.changedAnnotations()
+        annotations = syn.getAnnotations(synEntity.id)
+        if annotations.get('etag') != synEntity.etag:
+            raise ValueError("%s was modified after it was read from the file view." % synEntity.id)
+        for key in removed:
+            annotations.pop(key, None)
+        annotations.update(updated)
+        stored = syn.setAnnotations(synEntity.id, annotations)
+        synEntity.markStored(stored.get('etag', synEntity.etag))
+        return synEntity
+    return syn.store(synEntity, forceVersion=forceVersion)
+
+
+def _itemId(item):
+    if isinstance(item, six.string_types):
+        return item
+    return item.id
+
+
+def runBulk(syn, items, func, args=(), threads=1, maxInFlight=None, synFactory=None, fetch=True, journal=None):
+    """
+    Applies func(syn, synEntity, *args) to every item with a bounded number of workers.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param items:          An iterable of Synapse IDs and/or Synapse Objects
+    :param func:           Called once per entity. Its return value is tallied as the entity status, None counts
+                           as "processed"
+    :param args:           Extra positional arguments passed on to func
+    :param threads:        Number of worker threads. Default is 1 which runs serially in the calling thread
+    :param maxInFlight:    Maximum number of items handed to the workers but not finished yet.
+                           Default is twice the number of threads
+    :param synFactory:     A callable returning a logged in Synapse object. When given, each worker thread calls
+                           it once and uses its own session instead of sharing syn
+    :param fetch:          If True, Synapse IDs are fetched with syn.get(downloadFile=False) before calling func
+    :param journal:        A journal.Journal or the path of a journal file. Entities processed without error are
+                           recorded in it, and entities already in it are skipped (counted as "skipped") without
+                           being fetched, so an interrupted run can be resumed
+    :return:               A dict with the number of entities per status and an "errors" list of
+                           (Synapse ID, exception) tuples
+
+    Example:
+
+       summary = runBulk(syn, iterFileIds(syn, "syn12345"), _helperUpdateAnnoByDict,
+                         args=({"dataType": "testing"}, False), threads=8)
+
+    """
+    sessions = threading.local()
+
+    def _session():
+        if synFactory is None:
+            return syn
+        if not hasattr(sessions, "syn"):
+            logging.info("Starting Synapse session for %s" % threading.current_thread().name)
+            sessions.syn = synFactory()
+        return sessions.syn
+
+    def _work(item):
+        entityId = _itemId(item)
+        try:
+            session = _session()
+            if fetch and isinstance(item, six.string_types):
+                logging.info("Getting File %s ..." % item)
+                item = session.get(item, downloadFile=False)
+            status = func(session, item, *args)
+            return entityId, status or "processed", None
+        except Exception as e:
+            logging.error("%s failed: %s" % (entityId, e))
+            return entityId, "failed", e
+
+    summary = {"errors": []}
+
+    with openJournal(journal) as done:
+
+        def _tally(result):
+            entityId, status, error = result
+            summary[status] = summary.get(status, 0) + 1
+            if error is not None:
+                summary["errors"].append((entityId, error))
+            elif done is not None:
+                done.record(entityId, status)
+
+        def _pending():
+            for item in items:
+                if done is not None and _itemId(item) in done:
+                    summary["skipped"] = summary.get("skipped", 0) + 1
+                    continue
+                yield item
+
+        if threads <= 1:
+            for item in _pending():
+                _tally(_work(item))
+        else:
+            inFlight = threading.BoundedSemaphore(maxInFlight or 2 * threads)
+
+            def _bounded():
+                for item in _pending():
+                    inFlight.acquire()
+                    yield item
+
+            pool = Pool(threads)
+            try:
+                for result in pool.imap_unordered(_work, _bounded()):
+                    inFlight.release()
+                    _tally(result)
+            finally:
+                pool.close()
+                pool.join()
+
+    logging.info("Finished: %s" % ", ".join("%s %d" % (k, v) for k, v in sorted(summary.items())
+                                            if k != "errors"))
+    return summary
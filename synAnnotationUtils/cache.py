@@ -0,0 +1,206 @@
+import six
+import time
+import pickle
+import logging
+import sqlite3
+import threading
+import synapseclient
+from synapseclient.utils import id_of
+
+# Keys of the annotation dicts of getAnnotations and setAnnotations which are not annotations
+ANNOTATION_PROPERTIES = ('id', 'etag', 'uri', 'creationDate')
+
+
+class EntityCache(object):
+    """
+    An on-disk (SQLite) cache of entities, i.e. their properties and annotations, keyed by Synapse ID and
+    validated by etag. Entries are evicted least recently used first once they take more than maxBytes.
+
+    The cache is opt-in: functions use it when they are given a CachedSynapse (see wrap) instead of syn, and a
+    cache file can be shared by runs of the functions and the bin/ scripts.
+
+    :param path:           Path of the SQLite database, created if it does not exist
+    :param maxBytes:       Maximum size of the cached entities. Default is 512 MiB
+
+    Example:
+
+       cache = EntityCache("annotations.db")
+       syn = cache.wrap(synapseclient.login())
+       result = auditCommonDict(syn, "syn12345", {"dataType": "testing"})
+
+    """
+
+    def __init__(self, path, maxBytes=512 * 2 ** 20):
+        self.path = path
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entities "
+                         "(id TEXT PRIMARY KEY, etag TEXT, data BLOB, size INTEGER, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entities_accessed ON entities (accessed)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entities").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, entityId, etag):
+        """
+        :return:   The cached entity if its etag is etag, else None (and a stale entry is dropped)
+        """
+        with self._lock:
+            row = self._db.execute("SELECT etag, data FROM entities WHERE id = ?", (entityId,)).fetchone()
+            if row is None or row[0] != etag:
+                self.misses += 1
+                if row is not None:
+                    self._delete(entityId)
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE entities SET accessed = ? WHERE id = ?", (time.time(), entityId))
+            self._db.commit()
+        properties, annotations, localState = pickle.loads(bytes(row[1]))
+        return synapseclient.Entity.create(properties, annotations, localState)
+
+    def put(self, entity):
+        """
+        Caches an entity under its id and etag.
+        """
+        data = pickle.dumps((dict(entity.properties), dict(entity.annotations), entity.local_state()), 2)
+        with self._lock:
+            self._delete(entity.id)
+            self._db.execute("INSERT INTO entities VALUES (?, ?, ?, ?, ?)",
+                             (entity.id, entity.etag, sqlite3.Binary(data), len(data), time.time()))
+            self._size += len(data)
+            self._evict()
+            self._db.commit()
+
+    def invalidate(self, entityId):
+        with self._lock:
+            self._delete(entityId)
+            self._db.commit()
+
+    def _delete(self, entityId):
+        row = self._db.execute("SELECT size FROM entities WHERE id = ?", (entityId,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM entities WHERE id = ?", (entityId,))
+            self._size -= row[0]
+
+    def _evict(self):
+        if self._size <= self.maxBytes:
+            return
+        evicted = []
+        for entityId, size in self._db.execute("SELECT id, size FROM entities ORDER BY accessed"):
+            if self._size <= self.maxBytes:
+                break
+            evicted.append((entityId,))
+            self._size -= size
+        self._db.executemany("DELETE FROM entities WHERE id = ?", evicted)
+        logging.info("Evicted %d entities from %s" % (len(evicted), self.path))
+
+    def wrap(self, syn):
+        """
+        :return:   A CachedSynapse getting entities through this cache
+        """
+        return CachedSynapse(syn, self)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedSynapse(object):
+    """
+    A Synapse object whose get(downloadFile=False) and getAnnotations answer from an EntityCache when the entity's
+    etag did not change. Writes made through it (store, setAnnotations, delete) refresh or invalidate the cached
+    entities, so that the next run finds them up to date.
+
+    The current etag of an entity comes from the etags handed to setEtags or primeEtags (one file-view query for
+    a whole tree), or else from a GET /entity/{id}, which is smaller than the bundle syn.get requests.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param cache:          An EntityCache
+    """
+
+    def __init__(self, syn, cache):
+        self.syn = syn
+        self.cache = cache
+        self._etags = {}
+
+    def __getattr__(self, name):
+        return getattr(self.syn, name)
+
+    def setEtags(self, etags):
+        """
+        :param etags:      A dict of Synapse ID to current etag, e.g. read from a file view
+        """
+        self._etags.update(etags)
+
+    def primeEtags(self, viewId, clause=None):
+        """
+        Reads the current etags of the entities in a file view.
+
+        :param viewId:     A Synapse ID of a file view
+        :param clause:     An optional where clause, i.e. "where projectId = 'syn12345'"
+        """
+        df = self.syn.tableQuery("select id, etag from %s %s" % (viewId, clause or "")).asDataFrame()
+        self.setEtags(dict(zip(df['id'], df['etag'])))
+
+    def _etag(self, entityId):
+        etag = self._etags.get(entityId)
+        if etag is None:
+            etag = self.syn.restGET('/entity/%s' % entityId)['etag']
+            self._etags[entityId] = etag
+        return etag
+
+    def get(self, entity, downloadFile=True, **kwargs):
+        if downloadFile or kwargs.get('version') is not None:
+            return self.syn.get(entity, downloadFile=downloadFile, **kwargs)
+        entityId = id_of(entity)
+        cached = self.cache.get(entityId, self._etag(entityId))
+        if cached is not None:
+            return cached
+        synEntity = self.syn.get(entity, downloadFile=False, **kwargs)
+        self.cache.put(synEntity)
+        self._etags[entityId] = synEntity.etag
+        return synEntity
+
+    def store(self, obj, **kwargs):
+        stored = self.syn.store(obj, **kwargs)
+        if isinstance(stored, synapseclient.Entity):
+            self.cache.put(stored)
+            self._etags[stored.id] = stored.etag
+        return stored
+
+    def getAnnotations(self, entity, version=None):
+        if version is not None:
+            return self.syn.getAnnotations(entity, version=version)
+        synEntity = self.get(id_of(entity), downloadFile=False)
+        return dict(synEntity.annotations, id=synEntity.id, etag=synEntity.etag)
+
+    def setAnnotations(self, entity, annotations=None, **kwargs):
+        entityId = id_of(entity)
+        stored = self.syn.setAnnotations(entity, annotations or {}, **kwargs)
+        if isinstance(entity, synapseclient.Entity) and 'etag' in stored:
+            # the response holds the new etag and all the annotations, the properties did not change
+            self.cache.put(synapseclient.Entity.create(
+                dict(entity.properties, etag=stored['etag']),
+                dict((key, value) for key, value in stored.items() if key not in ANNOTATION_PROPERTIES),
+                entity.local_state()))
+            self._etags[entityId] = stored['etag']
+        else:
+            self.cache.invalidate(entityId)
+            self._etags.pop(entityId, None)
+        return stored
+
+    def delete(self, obj, **kwargs):
+        if isinstance(obj, (synapseclient.Entity,) + six.string_types):
+            self.cache.invalidate(id_of(obj))
+            self._etags.pop(id_of(obj), None)
+        return self.syn.delete(obj, **kwargs)
@@ -0,0 +1,34 @@
+def normalizeAnnoValue(value):
+    """
+    Synapse returns every annotation value as a list, while users usually pass scalars.
+    Converts a value to the list form so both can be compared.
+
+    :param value:   An annotation value, a list of annotation values or None
+    :return:        A list of annotation values, empty for None
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def diffAnnotations(current, desired):
+    """
+    Finds the annotation keys whose requested value differs from the current one.
+
+    :param current:   A dict of the entity annotations as returned by Synapse
+    :param desired:   A dict of annotations that should be set on the entity
+    :return:          A dict with the keys and values of desired that would change the entity
+
+    Example:
+
+       diffAnnotations({"dataType": ["bam"], "center": ["labA"]}, {"dataType": "bam", "center": "labB"})
+       {"center": "labB"}
+
+    """
+    changed = {}
+    for key, value in desired.items():
+        if key not in current or normalizeAnnoValue(current[key]) != normalizeAnnoValue(value):
+            changed[key] = value
+    return changed
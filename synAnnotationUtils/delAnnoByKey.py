@@ -1,13 +1,17 @@
 import synapseclient
-from synapseclient.entity import is_container
-import synapseutils as synu
+from . import bulk
 
-def delAnnoByKey(syn,synId,keyList):
+def delAnnoByKey(syn,synId,keyList,backend='walk',viewId=None,journal=None):
     """
     Delete annotations by key for a Synapse object
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
     :param synId:          A Synapse ID of Project, Folder, or File or a list of Synapse IDs
     :param keyList         A list of annotations keys that needs to be deleted
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view (see bulk.resolveEntities)
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param journal         A journal.Journal or the path of a journal file recording the processed entities. Rerunning
+                           with the same journal skips them without fetching them
    
     Example:
     
@@ -19,25 +23,8 @@ def delAnnoByKey(syn,synId,keyList):
 
     print "Delte entity annotations by key(s) - \n %s" % "\n".join(keyList)
     
-    if type(synId) is list:
-        print "Input is a list of Synapse IDs \n"
-        for synID in synId:
-            print "Getting File %s ..." % synID
-            temp = syn.get(synID,downloadFile = False)
-            _helperDelAnnoByKey(syn,temp,keyList)
-    else:
-        print "Input is a Synpase ID \n"
-        starting = syn.get(synId,downloadFile = False)
-        if not is_container(starting):
-            print "%s is a File \n" % synId
-            _helperDelAnnoByKey(syn,starting,keyList)
-        else:
-            directory = synu.walk(syn,synId)
-            for dirpath,dirname,filename in directory:
-                for i in filename:
-                    temp = syn.get(i[1],downloadFile = False)
-                    print "Getting File %s ..." % i[1]
-                    _helperDelAnnoByKey(syn,temp,keyList)
+    return bulk.runBulk(syn,bulk.resolveEntities(syn,synId,backend,viewId),_helperDelAnnoByKey,args=(keyList,),
+                        journal=journal)
         
 def _helperDelAnnoByKey(syn,temp,keyList):
     annoDict = temp.annotations
@@ -49,7 +36,10 @@ def _helperDelAnnoByKey(syn,temp,keyList):
                 print "> %s" % key
                 annoDict.pop(key)
         temp.annotations = annoDict
-        temp = syn.store(temp,forceVersion = False)
+        temp = bulk.storeEntity(syn,temp,forceVersion = False)
+        status = "changed"
     else:
         print "Pass."
-    print ""
\ No newline at end of file
+        status = "unchanged"
+    print ""
+    return status
\ No newline at end of file
@@ -0,0 +1,44 @@
+class SuffixIndex(object):
+    """
+    Matches file names against a dict of file extensions, returning the longest matching extension
+    (i.e. ".vcf.gz" wins over ".gz" for "calls.vcf.gz" whatever the order of the dict).
+
+    Extensions are bucketed by length, so a lookup is one slice and one dict lookup per distinct extension length
+    not longer than the name, instead of an endswith call per extension.
+
+    :param annoDict        A dict where key is the extension of the filename,
+                           value is the corresponding file type value in entity annotations
+
+    Example:
+
+       suffixIndex = SuffixIndex({".gz": "gzip", ".vcf.gz": "vcf"})
+       suffixIndex.match("calls.vcf.gz")
+       (".vcf.gz", "vcf")
+
+    """
+
+    def __init__(self, annoDict):
+        self._buckets = {}
+        for ext, value in annoDict.items():
+            self._buckets.setdefault(len(ext), {})[ext] = value
+        self._lengths = sorted(self._buckets, reverse=True)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def match(self, name):
+        """
+        Finds the longest extension the name ends with.
+
+        :param name:   A file name
+        :return:       An (extension, value) tuple, or None if no extension matches
+        """
+        size = len(name)
+        for length in self._lengths:
+            if length > size:
+                continue
+            ext = name[size - length:]
+            bucket = self._buckets[length]
+            if ext in bucket:
+                return ext, bucket[ext]
+        return None
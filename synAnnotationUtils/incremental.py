@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import hashlib
+import logging
+import six
+from . import audit
+from . import bulk
+from .metadata import MetadataIndex
+
+# Number of audited entities between two commits of the state database
+COMMIT_EVERY = 1000
+
+
+def _rowHash(metaIndex, row):
+    """
+    :return:   An md5 hex digest of the audited columns of a metadata row (None if there is no row)
+    """
+    values = None if row is None else [row[colName] for colName in metaIndex.columns]
+    return hashlib.md5(json.dumps([metaIndex.columns, values]).encode('utf-8')).hexdigest()
+
+
+class AuditState(object):
+    """
+    The outcome of the last audit of each entity with the etag and metadata row hash it was made with, in a SQLite
+    database. Entities are stored under the root (Project, Folder or File) they were audited from, so that one
+    database can keep the audits of several roots.
+
+    :param path:           Path of the SQLite database, created if it does not exist
+    :param root:           The Synapse ID of the audited root, '' for entities audited from lists
+    """
+
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS audit (root TEXT, id TEXT, etag TEXT, rowHash TEXT, "
+                         "status TEXT, incorrect TEXT, missing TEXT, PRIMARY KEY (root, id))")
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM audit WHERE root = ?", (self.root,)).fetchone()[0]
+
+    def get(self, entityId):
+        """
+        :return:   (etag, rowHash, AuditRecord without entity) of the last audit of the entity, or None
+        """
+        row = self._db.execute("SELECT etag, rowHash, status, incorrect, missing FROM audit WHERE root = ? AND id = ?",
+                               (self.root, entityId)).fetchone()
+        if row is None:
+            return None
+        etag, rowHash, status, incorrect, missing = row
+        return etag, rowHash, audit.AuditRecord(entityId, status, tuple(json.loads(incorrect)),
+                                                tuple(json.loads(missing)), None)
+
+    def put(self, etag, rowHash, record):
+        self._db.execute("INSERT OR REPLACE INTO audit VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (self.root, record.id, etag, rowHash, record.status, json.dumps(list(record.incorrect)),
+                          json.dumps(list(record.missing))))
+
+    def prune(self, seen):
+        """
+        Forgets the entities of the root that are not in seen, i.e. deleted or moved out of the audited container.
+        """
+        stale = [(self.root, entityId) for (entityId,) in
+                 self._db.execute("SELECT id FROM audit WHERE root = ?", (self.root,)) if entityId not in seen]
+        self._db.executemany("DELETE FROM audit WHERE root = ? AND id = ?", stale)
+        return len(stale)
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+
+def iterAuditAgainstMetadataIncremental(syn, synId, metaDf, refCol, cols2Check, fileExts, statePath,
+                                        backend='walk', viewId=None):
+    """
+    Incremental audit.iterAuditAgainstMetadata: only entities whose etag or audited metadata row changed since the
+    last run with the same statePath are audited again, the others get the verdict of the last run.
+
+    With the 'walk' backend, the etag and name of each File are read with a GET /entity/{id}, which is lighter than
+    the entity bundle syn.get requests, and changed Files are then fetched. With the 'view' backend the etags come
+    with the file-view rows and nothing is fetched.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
+    :param metaDf          A pandas data frame of entity metadata
+    :param refCol          A name of the column in metaDf that matching one of the entity attributes
+    :param cols2Check      A list of columns in metaDf need to be audited with entity annotations
+    :param fileExts        A list of all file extensions (PsychENCODE ONLY!!!)
+    :param statePath       Path of the SQLite database keeping the last audit of each entity. Audits of different
+                           synIds are kept apart, so one database can be shared between them
+    :param backend         'walk' (default) or 'view', see bulk.resolveEntities
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+
+    A generator of audit.AuditRecord, one per entity. Records carried over from the last run have no entity.
+    audit.CompactAuditResult.fromRecords builds the complete report.
+
+    Example:
+       records = iterAuditAgainstMetadataIncremental(syn,"syn12345",metadata,"id",["dataType"],[".bam"],"audit.db")
+       result = audit.CompactAuditResult.fromRecords(records)
+
+    """
+    metaIndex = MetadataIndex(metaDf, refCol, cols2Check, fileExts)
+    isRoot = isinstance(synId, six.string_types)
+    state = AuditState(statePath, synId if isRoot else '')
+    seen = set()
+    audited = 0
+    try:
+        for item in bulk.resolveEntities(syn, synId, backend, viewId):
+            if isinstance(item, six.string_types):
+                header = syn.restGET('/entity/%s' % item)
+                entityId, name, etag, synEntity = item, header['name'], header['etag'], None
+            else:
+                entityId, name, etag, synEntity = item.id, item.name, item.etag, item
+            seen.add(entityId)
+            rowHash = _rowHash(metaIndex, metaIndex.lookup(name))
+
+            previous = state.get(entityId)
+            if previous is not None and previous[0] == etag and previous[1] == rowHash:
+                yield previous[2]
+                continue
+
+            if synEntity is None:
+                synEntity = syn.get(entityId, downloadFile=False)
+            record = audit._helperAuditMetadata(syn, synEntity, metaIndex)
+            state.put(synEntity.etag, rowHash, record)
+            audited += 1
+            if audited % COMMIT_EVERY == 0:
+                state.commit()
+            yield record
+
+        # entities audited from lists are never forgotten, the next list may hold other entities
+        pruned = state.prune(seen) if isRoot else 0
+        logging.info("Audited %d entities, %d unchanged since the last audit, %d forgotten."
+                     % (audited, len(seen) - audited, pruned))
+    finally:
+        state.close()
@@ -0,0 +1,211 @@
+import time
+import logging
+import threading
+import contextlib
+import functools
+import types
+
+# Upper bounds in seconds of the latency histogram buckets, the last one catches everything slower
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+
+class MethodStats(object):
+    """
+    Call count, errors, bytes and latency histogram of one Synapse method.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, seconds, error):
+        self.calls += 1
+        self.errors += error
+        self.seconds += seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.histogram[i] += 1
+                break
+
+    def percentile(self, fraction):
+        """
+        :return:   The upper bound of the histogram bucket holding the given fraction of the calls
+        """
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.maxSeconds)
+        return self.maxSeconds
+
+    def summary(self):
+        return {'calls': self.calls, 'errors': self.errors, 'seconds': self.seconds,
+                'mean': self.seconds / self.calls if self.calls else 0.0, 'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95), 'max': self.maxSeconds, 'bytesSent': self.bytesSent,
+                'bytesReceived': self.bytesReceived,
+                'histogram': dict((bound, count) for bound, count in zip(LATENCY_BUCKETS, self.histogram) if count)}
+
+
+class InstrumentedSynapse(object):
+    """
+    A Synapse object that times every public method call and counts calls, errors and bytes per method. Methods
+    returning generators (getChildren, used by synapseutils.walk, and chunkedQuery) are timed until the generator
+    is exhausted. Bytes are the Content-Length of the HTTP requests and responses, seen through a hook on the
+    requests session of syn, and are attributed to the method being called in the thread.
+
+    Use instrument() to create one, which returns syn itself when instrumentation is disabled.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    """
+
+    def __init__(self, syn):
+        self.syn = syn
+        self.started = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._current = threading.local()
+        self._session = getattr(syn, '_requests_session', None)
+        if self._session is not None:
+            self._session.hooks.setdefault('response', []).append(self._countBytes)
+
+    def __getattr__(self, name):
+        attr = getattr(self.syn, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        wrapped = self._wrap(name, attr)
+        # later lookups find the wrapper without going through __getattr__
+        self.__dict__[name] = wrapped
+        return wrapped
+
+    def _stat(self, method):
+        stats = self._stats.get(method)
+        if stats is None:
+            stats = self._stats.setdefault(method, MethodStats())
+        return stats
+
+    def _record(self, method, started, error):
+        seconds = time.time() - started
+        with self._lock:
+            self._stat(method).record(seconds, error)
+
+    def _countBytes(self, response, *args, **kwargs):
+        method = getattr(self._current, 'method', None) or 'other'
+        sent = len(response.request.body or b'') if response.request is not None else 0
+        received = int(response.headers.get('Content-Length') or 0)
+        with self._lock:
+            stats = self._stat(method)
+            stats.bytesSent += sent
+            stats.bytesReceived += received
+        return response
+
+    def _iterate(self, name, generator, started):
+        error = False
+        try:
+            while True:
+                # the generator makes its requests while it is advanced
+                previous = getattr(self._current, 'method', None)
+                self._current.method = name
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    self._current.method = previous
+                yield item
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record(name, started, error)
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        def _call(*args, **kwargs):
+            previous = getattr(self._current, 'method', None)
+            self._current.method = name
+            started = time.time()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self._record(name, started, True)
+                raise
+            finally:
+                self._current.method = previous
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(name, result, started)
+            self._record(name, started, False)
+            return result
+        return _call
+
+    def summary(self):
+        """
+        :return:   A dict of method name to a dict of calls, errors, seconds, mean, p50, p95, max, bytesSent,
+                   bytesReceived and histogram (bucket upper bound to count)
+        """
+        with self._lock:
+            return dict((method, stats.summary()) for method, stats in self._stats.items())
+
+    def report(self):
+        """
+        :return:   The summary as a table, slowest methods first
+        """
+        lines = ['%-20s %8s %7s %10s %9s %9s %9s %12s %12s' % ('method', 'calls', 'errors', 'seconds', 'mean',
+                                                               'p95', 'max', 'sent', 'received')]
+        for method, stats in sorted(self.summary().items(), key=lambda item: -item[1]['seconds']):
+            lines.append('%-20s %8d %7d %10.2f %9.3f %9.3f %9.3f %12d %12d' %
+                         (method, stats['calls'], stats['errors'], stats['seconds'], stats['mean'], stats['p95'],
+                          stats['max'], stats['bytesSent'], stats['bytesReceived']))
+        lines.append('wall clock: %.2f seconds' % (time.time() - self.started))
+        return '\n'.join(lines)
+
+    def uninstall(self):
+        """
+        Removes the bytes hook from the requests session of syn.
+        """
+        if self._session is not None and self._countBytes in self._session.hooks.get('response', []):
+            self._session.hooks['response'].remove(self._countBytes)
+
+
+def instrument(syn, enabled=True):
+    """
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param enabled:        If False, syn itself is returned and nothing is measured
+    :return:               An InstrumentedSynapse wrapping syn, or syn
+
+    Example:
+
+       syn = instrument(synapseclient.login())
+       updateEntityView(syn, "syn12345", "view.csv")
+       print(syn.report())
+
+    """
+    if not enabled:
+        return syn
+    return InstrumentedSynapse(syn)
+
+
+@contextlib.contextmanager
+def instrumented(syn, enabled=True, log=logging.info):
+    """
+    Yields instrument(syn, enabled) and logs its report on exit when enabled.
+
+    Example:
+
+       with instrumented(syn) as isyn:
+           checkAgainstDict(isyn, "syn12345", "syn45678")
+
+    """
+    wrapped = instrument(syn, enabled)
+    try:
+        yield wrapped
+    finally:
+        if wrapped is not syn:
+            log(wrapped.report())
+            wrapped.uninstall()
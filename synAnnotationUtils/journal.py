@@ -0,0 +1,105 @@
+import os
+import six
+import time
+import logging
+import threading
+import contextlib
+
+
+class Journal(object):
+    """
+    An append-only file of the entities a bulk update has processed, one "<Synapse ID>\t<status>" line each, so
+    that a rerun of the update can skip them without fetching them again.
+
+    Lines are written as entities finish, but the file is fsynced only every syncEvery entities or syncInterval
+    seconds, so journaling costs next to nothing. A crash loses at most the entities recorded since the last sync,
+    which are processed again on resume. A last line torn by a crash is dropped.
+
+    :param path:           Path of the journal file, created if it does not exist and read if it does
+    :param syncEvery:      Number of recorded entities between two fsyncs
+    :param syncInterval:   Maximum number of seconds between two fsyncs
+
+    Example:
+
+       updateAnnoByMetadata(syn, "syn12345", metadata, "id", ["dataType"], [".bam"], journal="update.journal")
+       # after a crash, the same call skips the entities of update.journal
+
+    """
+
+    def __init__(self, path, syncEvery=1000, syncInterval=5.0):
+        self.path = path
+        self.syncEvery = syncEvery
+        self.syncInterval = syncInterval
+        self._done = set()
+        if os.path.exists(path):
+            complete = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    complete += len(line)
+                    self._done.add(line.decode('utf-8').split('\t', 1)[0])
+            if complete < os.path.getsize(path):
+                # drop a line torn by a crash so that the next record starts on a line of its own
+                with open(path, 'r+b') as f:
+                    f.truncate(complete)
+            logging.info("Resuming from %s: %d entities already processed." % (path, len(self._done)))
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+        self._pending = 0
+        self._synced = time.time()
+
+    def __contains__(self, entityId):
+        return entityId in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def record(self, entityId, status):
+        """
+        Appends a processed entity to the journal.
+        """
+        with self._lock:
+            self._file.write("%s\t%s\n" % (entityId, status))
+            self._done.add(entityId)
+            self._pending += 1
+            if self._pending >= self.syncEvery or time.time() - self._synced >= self.syncInterval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._synced = time.time()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+
+@contextlib.contextmanager
+def openJournal(journal):
+    """
+    Yields a Journal for the journal argument of the update functions: None, a Journal (synced on exit) or the
+    path of a journal file (closed on exit).
+    """
+    if journal is None or isinstance(journal, Journal):
+        try:
+            yield journal
+        finally:
+            if journal is not None:
+                journal.sync()
+        return
+    if not isinstance(journal, six.string_types):
+        raise TypeError("journal must be a Journal or a path, not %r" % (journal,))
+    opened = Journal(journal)
+    try:
+        yield opened
+    finally:
+        opened.close()
@@ -0,0 +1,60 @@
+import re
+import logging
+
+
+class MetadataIndex(object):
+    """
+    A metadata data frame prepared once for repeated lookups by entity name.
+
+    The entity name without extension is map to the refCol column of the metadata data frame (PsychENCODE project
+    data release). Rows are stored in a dict keyed on the stringified refCol value with the requested columns
+    already converted to strings, so matching an entity costs one regex substitution and one dict lookup instead
+    of a scan of the whole data frame.
+
+    :param metaDf          A pandas data frame of entity metadata
+    :param refCol          A name of the column in metaDf that matching one of the entity attributes
+    :param columns         A list of columns in metaDf whose values are looked up
+    :param fileExts        A list of all file extensions (PsychENCODE ONLY!!!)
+
+    Example:
+
+       metaIndex = MetadataIndex(metadata, "id", ["dataType", "tester"], [".bam", ".csv"])
+       row = metaIndex.lookup("sample1.bam")
+
+    """
+
+    def __init__(self, metaDf, refCol, columns, fileExts):
+        self.refCol = refCol
+        self.columns = list(columns)
+        self._stripper = re.compile(r'(' + ')|('.join(fileExts) + ')') if fileExts else None
+
+        keys = metaDf[refCol].astype(str)
+        duplicated = keys.duplicated(keep=False)
+        self.duplicates = sorted(set(keys[duplicated]))
+        if self.duplicates:
+            logging.warning("%d %s values appear more than once in the metadata, the first row is used: %s"
+                            % (len(self.duplicates), refCol, ", ".join(self.duplicates)))
+
+        first = ~keys.duplicated(keep='first')
+        values = metaDf.loc[first.values, self.columns].astype(str).to_dict('records')
+        self._rows = dict(zip(keys[first], values))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def strip(self, name):
+        """
+        Removes the file extensions from an entity name.
+        """
+        if self._stripper is None:
+            return name
+        return self._stripper.sub("", name)
+
+    def lookup(self, name):
+        """
+        Finds the metadata row of an entity.
+
+        :param name:   An entity name, including its file extension
+        :return:       A dict of column name to string value, or None if no row matches
+        """
+        return self._rows.get(self.strip(name))
@@ -0,0 +1,298 @@
+import json
+import heapq
+import logging
+import pandas
+from . import bulk
+from . import changes
+
+# One row per changed annotation key of an entity. old and new hold the JSON list of values, '' when the key is
+# absent (old) or removed (new)
+PLAN_COLUMNS = ['id', 'etag', 'key', 'old', 'new']
+
+
+# Encoded values are memoized since plans repeat the same few values over many entities
+ENCODED_CACHE_SIZE = 100000
+_encoded = {}
+
+
+def _encode(value):
+    if value is None:
+        return ''
+    values = changes.normalizeAnnoValue(value)
+    try:
+        # types are part of the key so that True and 1 are encoded apart
+        cacheKey = tuple((type(x), x) for x in values)
+        return _encoded[cacheKey]
+    except TypeError:
+        return json.dumps(values, default=str)
+    except KeyError:
+        text = json.dumps(values, default=str)
+        if len(_encoded) < ENCODED_CACHE_SIZE:
+            _encoded[cacheKey] = text
+        return text
+
+
+def _decode(text):
+    if text == '':
+        return None
+    return json.loads(text)
+
+
+def _frame(rows):
+    plan = pandas.DataFrame(rows, columns=PLAN_COLUMNS)
+    plan['key'] = plan['key'].astype('category')
+    return plan
+
+
+def _rows(synEntity, updated, removed=()):
+    """
+    :return:   The plan rows of an entity, given the annotations to set and the keys to remove
+    """
+    annotations = synEntity.annotations
+    rows = [(synEntity.id, synEntity.etag, key, _encode(annotations.get(key)), _encode(value))
+            for key, value in updated.items()]
+    rows.extend((synEntity.id, synEntity.etag, key, _encode(annotations[key]), '')
+                for key in removed if key in annotations)
+    return rows
+
+
+def _plan(syn, synId, backend, viewId, threads, planner, args):
+    rows = []
+
+    def _collect(syn, synEntity, *args):
+        entityRows = planner(synEntity, *args)
+        rows.extend(entityRows)
+        return "planned" if entityRows else "unchanged"
+
+    summary = bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _collect, args=args,
+                           threads=threads)
+    if summary.get("failed"):
+        logging.warning("%d entities could not be read and are not in the plan." % summary["failed"])
+    return _frame(rows)
+
+
+def planAnnoByDict(syn, synId, annoDict, threads=1, backend='walk', viewId=None):
+    """
+    Plans update.updateAnnoByDict without changing anything in Synapse.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
+    :param annoDict        A dict of annotations
+    :param threads         Number of threads reading the entities
+    :param backend         'walk' or 'view', see bulk.resolveEntities. 'view' plans a large tree in a few queries
+    :param viewId          A Synapse ID of a file view for the 'view' backend
+    :return:               A plan data frame with the PLAN_COLUMNS columns, see applyPlan
+
+    Example:
+
+       plan = planAnnoByDict(syn, "syn12345", {"dataType": "testing"}, backend="view")
+       writePlan(plan, "dataType.plan.csv.gz")
+
+    """
+    return _plan(syn, synId, backend, viewId, threads,
+                 lambda synEntity: _rows(synEntity, changes.diffAnnotations(synEntity.annotations, annoDict)), ())
+
+
+def planAnnoByIdDictFromDict(idDict, annoDict):
+    """
+    Plans update.updateAnnoByIdDictFromDict, i.e. the output of an audit function.
+
+    :param idDict:         A dict.Key is the annotations key, value is a list of Synapse Objects
+    :param annoDict        A dict of annotations
+    :return:               A plan data frame with the PLAN_COLUMNS columns, see applyPlan
+    """
+    rows = []
+    for key in idDict:
+        for synEntity in idDict[key]:
+            rows.extend(_rows(synEntity, changes.diffAnnotations(synEntity.annotations, {key: annoDict[key]})))
+    return _frame(rows)
+
+
+def planDelAnnoByKey(syn, synId, keyList, threads=1, backend='walk', viewId=None):
+    """
+    Plans delAnnoByKey.delAnnoByKey without changing anything in Synapse.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project, Folder, or File or a list of Synapse IDs
+    :param keyList         A list of annotations keys that needs to be deleted
+    :return:               A plan data frame with the PLAN_COLUMNS columns, see applyPlan
+    """
+    return _plan(syn, synId, backend, viewId, threads, lambda synEntity: _rows(synEntity, {}, keyList), ())
+
+
+def readCorrections(correctionsFile):
+    """
+    Reads the tab-delimited corrections file of annotationsYaml.correctAnnot: two entries per line (oldKey,
+    newKey) rename a key, three or more (key, oldValue, newValue...) replace the values of a key holding oldValue.
+
+    :return:   A list of (oldKey, newKey) and (key, oldValue, [newValues]) tuples, in file order
+    """
+    corrections = []
+    with open(correctionsFile) as toChange:
+        for line in toChange:
+            items = line.strip().split('\t')
+            if len(items) == 2:
+                corrections.append((items[0], items[1]))
+            elif len(items) > 2:
+                corrections.append((items[0], items[1], items[2:]))
+    return corrections
+
+
+def correctAnnotations(annotations, corrections):
+    """
+    Applies the corrections read by readCorrections to a dict of annotations, in order.
+
+    :return:   A corrected copy of annotations
+    """
+    corrected = dict(annotations)
+    for correction in corrections:
+        if len(correction) == 2:
+            oldKey, newKey = correction
+            if oldKey in corrected:
+                corrected[newKey] = corrected.pop(oldKey)
+        else:
+            key, oldValue, newValues = correction
+            if key in corrected and oldValue in [str(x) for x in changes.normalizeAnnoValue(corrected[key])]:
+                corrected[key] = list(newValues)
+    return corrected
+
+
+class RewriteTable(object):
+    """
+    The corrections read by readCorrections compiled for applying them to many entities: the rules are indexed by
+    the key they read, so only the rules of keys an entity has (or gets from a rename) are evaluated, still in file
+    order. apply gives the same result as correctAnnotations.
+
+    :param corrections:    A list of (oldKey, newKey) and (key, oldValue, [newValues]) tuples
+
+    Example:
+
+       table = RewriteTable(readCorrections("annotation_corrections.txt"))
+       corrected = table.apply(syn.getAnnotations("syn12345"))
+
+    """
+
+    def __init__(self, corrections):
+        self.corrections = list(corrections)
+        self._rules = {}
+        for i, correction in enumerate(self.corrections):
+            self._rules.setdefault(correction[0], []).append(i)
+
+    def __len__(self):
+        return len(self.corrections)
+
+    def apply(self, annotations):
+        """
+        :return:   A corrected copy of annotations, or annotations itself when no rule reads any of its keys
+        """
+        pending = [i for key in annotations for i in self._rules.get(key, ())]
+        if not pending:
+            return annotations
+        heapq.heapify(pending)
+        corrected = dict(annotations)
+        last = None
+        while pending:
+            i = heapq.heappop(pending)
+            if i == last:
+                continue
+            last = i
+            correction = self.corrections[i]
+            if len(correction) == 2:
+                oldKey, newKey = correction
+                if oldKey in corrected:
+                    corrected[newKey] = corrected.pop(oldKey)
+                    # later rules of the new key now apply to this entity
+                    for j in self._rules.get(newKey, ()):
+                        if j > i:
+                            heapq.heappush(pending, j)
+            else:
+                key, oldValue, newValues = correction
+                if key in corrected and oldValue in [str(x) for x in changes.normalizeAnnoValue(corrected[key])]:
+                    corrected[key] = list(newValues)
+        return corrected
+
+
+def _planCorrections(synEntity, table):
+    annotations = synEntity.annotations
+    corrected = table.apply(annotations)
+    return _rows(synEntity, changes.diffAnnotations(annotations, corrected),
+                 [key for key in annotations if key not in corrected])
+
+
+def planCorrectAnnot(syn, synId, correctionsFile, threads=1, backend='walk', viewId=None):
+    """
+    Plans annotationsYaml.correctAnnot in one traversal of synId, every correction of the file applied to each
+    entity.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project or Folder
+    :param correctionsFile Path to a tab-delimited file of old and new annotation values
+    :return:               A plan data frame with the PLAN_COLUMNS columns, see applyPlan
+    """
+    return _plan(syn, synId, backend, viewId, threads, _planCorrections,
+                 (RewriteTable(readCorrections(correctionsFile)),))
+
+
+def writePlan(plan, path):
+    """
+    Saves a plan as csv, gzip compressed if path ends with .gz.
+    """
+    plan.to_csv(path, index=False, columns=PLAN_COLUMNS, compression='gzip' if path.endswith('.gz') else None)
+
+
+def readPlan(path):
+    """
+    Reads a plan saved by writePlan.
+    """
+    plan = pandas.read_csv(path, dtype=str, keep_default_na=False, na_filter=False,
+                           compression='gzip' if path.endswith('.gz') else None)
+    plan['key'] = plan['key'].astype('category')
+    return plan
+
+
+def _helperApplyPlan(syn, entityId, edits):
+    etag, entityEdits = edits[entityId]
+    annotations = syn.getAnnotations(entityId)
+    if annotations.get('etag') != etag:
+        if all(_encode(annotations.get(key)) == new for key, new in entityEdits):
+            logging.info("%s is already up to date." % entityId)
+            return "unchanged"
+        raise ValueError("%s was modified after the plan was made." % entityId)
+
+    for key, new in entityEdits:
+        if new == '':
+            annotations.pop(key, None)
+        else:
+            annotations[key] = _decode(new)
+    syn.setAnnotations(entityId, annotations)
+    return "changed"
+
+
+def applyPlan(syn, plan, threads=1, maxInFlight=None, synFactory=None):
+    """
+    Writes the changes of a plan. An entity is only changed if its etag is still the one planned, so changes
+    made after planning are not overwritten. Entities already in their planned state are skipped, so a plan
+    can be applied again after an interruption.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param plan:           A plan data frame, or the path of a plan saved by writePlan
+    :param threads:        Number of worker threads, see bulk.runBulk
+    :param maxInFlight:    See bulk.runBulk
+    :param synFactory:     See bulk.runBulk
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
+
+    Example:
+
+       summary = applyPlan(syn, "dataType.plan.csv.gz", threads=8)
+
+    """
+    if not isinstance(plan, pandas.DataFrame):
+        plan = readPlan(plan)
+
+    edits = {}
+    for entityId, etag, key, old, new in plan[PLAN_COLUMNS].itertuples(index=False):
+        edits.setdefault(entityId, (etag, []))[1].append((key, new))
+
+    return bulk.runBulk(syn, list(edits), _helperApplyPlan, args=(edits,), threads=threads,
+                        maxInFlight=maxInFlight, synFactory=synFactory, fetch=False)
@@ -0,0 +1,190 @@
+import time
+import random
+import logging
+import functools
+import threading
+
+# HTTP status codes Synapse answers with when a client sends requests too fast
+THROTTLE_STATUS = (429, 503)
+
+# Synapse methods that make requests and go through the scheduler, everything else is passed through
+SCHEDULED_METHODS = ('get', 'store', 'delete', 'getAnnotations', 'setAnnotations', 'tableQuery', 'chunkedQuery',
+                     'query', 'restGET', 'restPOST', 'restPUT', 'restDELETE')
+
+
+def _statusCode(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retryAfter(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler(object):
+    """
+    Paces the Synapse calls made by any number of threads.
+
+    Calls wait for a token of a token bucket refilled at rate tokens per second, and for one of concurrency slots.
+    A call throttled by Synapse (HTTP 429 or 503) is retried after a jittered exponential backoff, or after the
+    Retry-After delay the server asks for, and halves the number of slots (multiplicative decrease). Each window of
+    successful calls gives back one slot (additive increase), up to maxConcurrency.
+
+    :param rate:              Maximum number of calls started per second. Default None does not limit the rate
+    :param burst:             Number of calls that can start at once after an idle period. Default is one second
+                              worth of calls
+    :param concurrency:       Number of calls in flight allowed at the start
+    :param minConcurrency:    Lowest number of calls in flight throttling can bring the limit down to
+    :param maxConcurrency:    Highest number of calls in flight the limit can grow back to. Default is concurrency
+    :param maxRetries:        Number of times a throttled call is retried before its error is raised
+    :param baseDelay:         Upper bound in seconds of the first backoff, doubled at each retry
+    :param maxDelay:          Upper bound in seconds of any backoff
+    :param decrease:          Factor applied to the concurrency limit when a call is throttled
+
+    Example:
+
+       scheduler = RequestScheduler(rate=20, concurrency=16)
+       syn = scheduler.wrap(synapseclient.login())
+       updateAnnoByDict(syn, "syn12345", {"dataType": "testing"}, threads=16)
+       scheduler.stats()
+
+    """
+
+    def __init__(self, rate=None, burst=None, concurrency=4, minConcurrency=1, maxConcurrency=None, maxRetries=8,
+                 baseDelay=1.0, maxDelay=60.0, decrease=0.5):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.minConcurrency = minConcurrency
+        self.maxConcurrency = maxConcurrency or concurrency
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.decrease = decrease
+
+        self._lock = threading.Lock()
+        self._slots = threading.Condition(self._lock)
+        self._window = float(concurrency)
+        self._inFlight = 0
+        self._tokens = self.burst
+        self._refilled = time.time()
+        self._decreased = 0.0
+        self._started = time.time()
+
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def concurrency(self):
+        """
+        The current limit of calls in flight.
+        """
+        return int(self._window)
+
+    def _takeToken(self):
+        if self.rate is None:
+            return
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def _acquire(self):
+        with self._slots:
+            while self._inFlight >= int(self._window):
+                self._slots.wait()
+            self._inFlight += 1
+            self.calls += 1
+
+    def _release(self, started, throttled):
+        with self._slots:
+            self._inFlight -= 1
+            if throttled:
+                self.throttled += 1
+                # calls sent before the last decrease were throttled at the old limit, count them once
+                if started >= self._decreased:
+                    self._window = max(self.minConcurrency, self._window * self.decrease)
+                    self._decreased = time.time()
+                    logging.warning("Throttled by Synapse, concurrency lowered to %d" % self.concurrency)
+            else:
+                self._window = min(self.maxConcurrency, self._window + 1.0 / self._window)
+            self._slots.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) once a token and a slot are available, retrying it while it is throttled.
+        """
+        attempt = 0
+        while True:
+            self._takeToken()
+            self._acquire()
+            started = time.time()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                status = _statusCode(e)
+                throttled = status in THROTTLE_STATUS
+                self._release(started, throttled)
+                if not throttled or attempt >= self.maxRetries:
+                    with self._lock:
+                        self.errors += 1
+                    raise
+                delay = _retryAfter(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** attempt))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                logging.info("HTTP %d, retry %d of %d in %.1f seconds" % (status, attempt, self.maxRetries, delay))
+                time.sleep(delay)
+            else:
+                self._release(started, False)
+                return result
+
+    def wrap(self, syn):
+        """
+        :return:   A ScheduledSynapse sending the requests of syn through this scheduler
+        """
+        return ScheduledSynapse(syn, self)
+
+    def stats(self):
+        """
+        :return:   A dict with the rate limit, current concurrency limit, calls in flight, observed calls per second
+                   and the calls, retries, throttled and errors counters
+        """
+        with self._lock:
+            elapsed = time.time() - self._started
+            return {'rate': self.rate, 'concurrency': self.concurrency, 'inFlight': self._inFlight,
+                    'throughput': self.calls / elapsed if elapsed > 0 else 0.0, 'calls': self.calls,
+                    'retries': self.retries, 'throttled': self.throttled, 'errors': self.errors}
+
+
+class ScheduledSynapse(object):
+    """
+    A Synapse object whose request methods (see SCHEDULED_METHODS) go through a RequestScheduler. It can be passed
+    to any function of this package in place of syn, and shared by threads.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param scheduler:      A RequestScheduler
+    """
+
+    def __init__(self, syn, scheduler):
+        self.syn = syn
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self.syn, name)
+        if name in SCHEDULED_METHODS:
+            return functools.partial(self.scheduler.call, attr)
+        return attr
@@ -1,55 +1,76 @@
+import os
 import re
 import six
-import csv
+import json
 import pandas
+import hashlib
+import threading
 import logging
 import synapseclient
-import synapseutils
-from synapseclient.entity import is_container
+from multiprocessing.dummy import Pool
+from . import bulk
+from . import changes
+from . import extensions
+from . import metadata
+
+
+def _storeIfChanged(syn, synEntity, annoDict, forceVersion):
+    """
+    Stores the entity with the given annotations only if at least one of them differs from its current value.
+
+    :return:    "changed" if the entity was stored, "unchanged" otherwise
+    """
+    changed = changes.diffAnnotations(synEntity.annotations, annoDict)
+    if not changed:
+        logging.info("%s is already up to date." % synEntity.id)
+        return "unchanged"
+
+    logging.info("%s: changing %s" % (synEntity.id, ", ".join(sorted(changed))))
+    synEntity.annotations.update(changed)
+    bulk.storeEntity(syn, synEntity, forceVersion=forceVersion)
+    return "changed"
 
 
 def _helperUpdateAnnoByDict(syn, synEntity, annoDict, forceVersion):
-    logging.info("Updating annotations...")
-    synEntity.annotations.update(annoDict)
-    synEntity = syn.store(synEntity, forceVersion=forceVersion)
-    logging.info("Completed.")
+    logging.info("Updating annotations of %s..." % synEntity.id)
+    status = _storeIfChanged(syn, synEntity, annoDict, forceVersion)
+    logging.info("Completed %s." % synEntity.id)
+    return status
 
 
 ## by dict
-def updateAnnoByDict(syn, synId, annoDict, forceVersion=False):
+def updateAnnoByDict(syn, synId, annoDict, forceVersion=False, threads=1, maxInFlight=None, synFactory=None,
+                     backend='walk', viewId=None, journal=None):
     """
     Update annotations by giving a dict
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
     :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synpase Objects
     :param annoDict        A dict of annotations
     :param forceVersion    Default is False
+    :param threads         Number of entities fetched and stored in parallel. Default is 1
+    :param maxInFlight     Maximum number of entities queued to the workers. Default is twice the threads
+    :param synFactory      A callable returning a logged in Synapse object, used to give each worker its own session
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view and stores annotations only
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param journal         A journal.Journal or the path of a journal file recording the processed entities. Rerunning
+                           with the same journal skips them without fetching them ("skipped" in the result)
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
 
     Example:
 
        updateAnnoByDict(syn,"syn12345",{"dataType":"testing","projectName":"foo"})
        OR
        updateAnnoByDict(syn,["syn1","syn2"],{"dataType":"testing","projectName":"foo"})
+       OR
+       updateAnnoByDict(syn,"syn12345",{"dataType":"testing"},threads=8,synFactory=synapseclient.login)
 
     """
 
-    if type(synId) is list:  # Output from audit functions
-        logging.info("Input is a list of Synapse Objects")
-        for synEntity in synId:
-            logging.info("Accessing File %s ..." % synEntity.id)
-            _helperUpdateAnnoByDict(syn, synEntity, annoDict)
-    else:
-        logging.info("Input is a Synpase ID")
-        synEntity = syn.get(synId, downloadFile=False)
-        if not is_container(synEntity):
-            logging.info("%s is a File" % synId)
-            _helperUpdateAnnoByDict(syn, synEntity, annoDict, forceVersion)
-        else:
-            directory = synapseutils.walk(syn, synId)
-            for dirpath, dirname, filename in directory:
-                for i in filename:
-                    synEntity = syn.get(i[1], downloadFile=False)
-                    logging.info("Getting File %s ..." % i[1])
-                    _helperUpdateAnnoByDict(syn, synEntity, annoDict, forceVersion)
+    return bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _helperUpdateAnnoByDict,
+                        args=(annoDict, forceVersion), threads=threads, maxInFlight=maxInFlight,
+                        synFactory=synFactory, journal=journal)
 
 
 ## by idDict
@@ -74,35 +95,36 @@ def updateAnnoByIdDictFromDict(syn, idDict, annoDict, forceVersion=False):
         for synEntity in idDict[key]:
             logging.info(synEntity.id)
             synEntity[key] = annoDict[key]
-            synEntity = syn.store(synEntity, forceVersion=forceVersion)
+            synEntity = bulk.storeEntity(syn, synEntity, forceVersion=forceVersion)
         logging.info("")
 
 
-def _helperUpdateAnnoByMetadata(syn, synEntity, metaDf, refCol, cols2Add, fileExts, forceVersion):
+def _helperUpdateAnnoByMetadata(syn, synEntity, metaIndex, forceVersion):
     """
     This helper function is built for PsychENCODE project data release.
-    The entity name without extension is map to a column in the metadata data frame
+    The entity name without extension is map to a column in the metadata data frame,
+    prepared as a metadata.MetadataIndex.
 
     """
 
-    logging.info("Updating annotations by metadata...")
+    logging.info("Updating annotations of %s by metadata..." % synEntity.id)
 
-    exts = ')|('.join(fileExts)
-    exts = r'(' + exts + ')'
-    synEntityName = re.sub(exts, "", synEntity.name)
+    row = metaIndex.lookup(synEntity.name)
+    if row is None:
+        logging.warning("%s: missing metadata" % synEntity.id)
+        return "missingMetadata"
 
-    row = metaDf.loc[metaDf[refCol] == synEntityName]
-    if row.empty:
-        logging.warning("missing metadata")
-    else:
-        for colName in cols2Add:
-            logging.info("%s " % colName)
-            synEntity[colName] = map(str, row[colName])[0]
-        synEntity = syn.store(synEntity, forceVersion=forceVersion)
+    annoDict = {}
+    for colName in metaIndex.columns:
+        logging.info("%s " % colName)
+        annoDict[colName] = row[colName]
+    status = _storeIfChanged(syn, synEntity, annoDict, forceVersion)
     logging.info("")
+    return status
 
 
-def updateAnnoByMetadata(syn, synId, metaDf, refCol, cols2Add, fileExts, forceVersion=False):
+def updateAnnoByMetadata(syn, synId, metaDf, refCol, cols2Add, fileExts, forceVersion=False, threads=1,
+                         maxInFlight=None, synFactory=None, backend='walk', viewId=None, journal=None):
     """
     Audit entity annotations against metadata
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
@@ -112,6 +134,16 @@ def updateAnnoByMetadata(syn, synId, metaDf, refCol, cols2Add, fileExts, forceVe
     :param cols2Add        A list of columns in metaDf need to be added as entity annotations
     :param fileExts        A list of all file extensions (PsychENCODE ONLY!!!)
     :param forceVersion    Default is False
+    :param threads         Number of entities fetched and stored in parallel. Default is 1
+    :param maxInFlight     Maximum number of entities queued to the workers. Default is twice the threads
+    :param synFactory      A callable returning a logged in Synapse object, used to give each worker its own session
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view and stores annotations only
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param journal         A journal.Journal or the path of a journal file recording the processed entities. Rerunning
+                           with the same journal skips them without fetching them ("skipped" in the result)
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
 
     Example:
 
@@ -119,24 +151,10 @@ def updateAnnoByMetadata(syn, synId, metaDf, refCol, cols2Add, fileExts, forceVe
 
     """
 
-    if type(synId) is list:  # Output from audit functions
-        logging.info("Input is a list of Synapse Objects")
-        for synEntity in synId:
-            logging.info("Accessing File %s ..." % synEntity.id)
-            _helperUpdateAnnoByMetadata(syn, synEntity, metaDf, refCol, cols2Add, fileExts, forceVersion)
-    else:
-        logging.info("Input is a Synpase ID")
-        synEntity = syn.get(synId, downloadFile=False)
-        if not is_container(synEntity):
-            logging.info("%s is a File" % synId)
-            _helperUpdateAnnoByMetadata(syn, synEntity, metaDf, refCol, cols2Add, fileExts, forceVersion)
-        else:
-            directory = synapseutils.walk(syn, synId)
-            for dirpath, dirname, filename in directory:
-                for i in filename:
-                    synEntity = syn.get(i[1], downloadFile=False)
-                    logging.info("Getting File %s ..." % i[1])
-                    _helperUpdateAnnoByMetadata(syn, synEntity, metaDf, refCol, cols2Add, fileExts, forceVersion)
+    metaIndex = metadata.MetadataIndex(metaDf, refCol, cols2Add, fileExts)
+    return bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _helperUpdateAnnoByMetadata,
+                        args=(metaIndex, forceVersion), threads=threads,
+                        maxInFlight=maxInFlight, synFactory=synFactory, journal=journal)
 
 
 def updateAnnoByIdDictFromMeta(syn, idDict, metaDf, refCol, fileExts, forceVersion=False):
@@ -156,45 +174,53 @@ def updateAnnoByIdDictFromMeta(syn, idDict, metaDf, refCol, fileExts, forceVersi
 
     """
 
+    metaIndex = metadata.MetadataIndex(metaDf, refCol, list(idDict), fileExts)
     for key in idDict:
         logging.info("updating annotaion values for key: %s" % key)
         for synEntity in idDict[key]:
             logging.info(synEntity.id)
-            exts = ')|('.join(fileExts)
-            exts = r'(' + exts + ')'
-            synEntityName = re.sub(exts, "", synEntity.name)
-            row = metaDf.loc[metaDf[refCol] == synEntityName]
-            synEntity[key] = map(str, row[key])[0]
-            synEntity = syn.store(synEntity, forceVersion=forceVersion)
+            row = metaIndex.lookup(synEntity.name)
+            if row is None:
+                logging.warning("%s: missing metadata" % synEntity.id)
+                continue
+            synEntity[key] = row[key]
+            synEntity = bulk.storeEntity(syn, synEntity, forceVersion=forceVersion)
         logging.info("")
 
 
-def _helperUpdateFormatTypeByFileName(syn, synEntity, annoKey, annoDict, forceVersion):
-    logging.info("Updating %s..." % annoKey)
-    synEntityName = synEntity.name
-    synEntityType = ""
-    for ext in annoDict.keys():
-        if synEntityName.endswith(ext):
-            synEntityType = annoDict[ext]
-            synEntity[annoKey] = synEntityType
-            synEntity = syn.store(synEntity, forceVersion=forceVersion)
-            logging.info("Done!")
-            break
-
-    if synEntityType == "":
-        logging.warning("ERROR: File type not found in file types dictionary")
-    logging.info("")
+def _helperUpdateFormatTypeByFileName(syn, synEntity, annoKey, suffixIndex, forceVersion):
+    logging.info("Updating %s of %s..." % (annoKey, synEntity.id))
+    match = suffixIndex.match(synEntity.name)
+    if match is not None:
+        status = _storeIfChanged(syn, synEntity, {annoKey: match[1]}, forceVersion)
+        logging.info("Done!")
+        return status
 
+    logging.warning("ERROR: %s: File type not found in file types dictionary" % synEntity.id)
+    return "missingInDict"
 
-def updateFormatTypeByFileName(syn, synId, annoKey, annoDict, forceVersion=False):
+
+def updateFormatTypeByFileName(syn, synId, annoKey, annoDict, forceVersion=False, threads=1, maxInFlight=None,
+                               synFactory=None, backend='walk', viewId=None, journal=None):
     """
     Audit entity file type annotations
     :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
     :param synId:          A Synapse ID of Project, Folder, or File OR a list of Synapse Objects
     :param annoKey:        The annotation key for file type. (i.e. "fileType", "fileFormat", or "formatType")
     :param annoDict        A dict where key is the extension of the filename,
-                           value is the corresponding file type value in entity annotations
+                           value is the corresponding file type value in entity annotations.
+                           The longest extension matching the file name is used
     :param forceVersion    Default is False
+    :param threads         Number of entities fetched and stored in parallel. Default is 1
+    :param maxInFlight     Maximum number of entities queued to the workers. Default is twice the threads
+    :param synFactory      A callable returning a logged in Synapse object, used to give each worker its own session
+    :param backend         'walk' (default) walks a container and gets every File, 'view' reads the Files and their
+                           annotations in bulk from a file view and stores annotations only
+    :param viewId          A Synapse ID of a file view for the 'view' backend. Default creates a temporary one
+    :param journal         A journal.Journal or the path of a journal file recording the processed entities. Rerunning
+                           with the same journal skips them without fetching them ("skipped" in the result)
+    :return:               A dict with the number of "changed", "unchanged" and "failed" entities and the
+                           (Synapse ID, error) list of failures
 
     Example:
 
@@ -203,24 +229,10 @@ def updateFormatTypeByFileName(syn, synId, annoKey, annoDict, forceVersion=False
        updateFormatTypeByFileName(syn,["syn1","syn2"],"fileType",{".bam":"bam", ".doc":"word", "bw":"bigwig"})
 
     """
-    if type(synId) is list:  # Output from audit functions
-        logging.info("Input is a list of Synapse Objects")
-        for synEntity in synId:
-            logging.info("Accessing File %s ..." % synEntity.id)
-            _helperUpdateFormatTypeByFileName(syn, synEntity, annoKey, annoDict, forceVersion)
-    else:
-        logging.info("Input is a Synpase ID")
-        synEntity = syn.get(synId, downloadFile=False)
-        if not is_container(synEntity):
-            logging.info("%s is a File" % synId)
-            _helperUpdateFormatTypeByFileName(syn, synEntity, annoKey, annoDict, forceVersion)
-        else:
-            directory = synapseutils.walk(syn, synId)
-            for dirpath, dirname, filename in directory:
-                for i in filename:
-                    synEntity = syn.get(i[1], downloadFile=False)
-                    logging.info("Getting File %s ..." % i[1])
-                    _helperUpdateFormatTypeByFileName(syn, synEntity, annoKey, annoDict, forceVersion)
+    suffixIndex = extensions.SuffixIndex(annoDict)
+    return bulk.runBulk(syn, bulk.resolveEntities(syn, synId, backend, viewId), _helperUpdateFormatTypeByFileName,
+                        args=(annoKey, suffixIndex, forceVersion), threads=threads, maxInFlight=maxInFlight,
+                        synFactory=synFactory, journal=journal)
 
 
 def _makeIndex(df):
@@ -238,10 +250,8 @@ def _makeIndex(df):
     if not unique_id.isin(df.columns).all():
         logging.info('To update a file view the columns ROW_ID, ROW_VERSION, and etag must exist.')
     else:
-        index = df.apply(lambda x: '%s_%s' % (x['ROW_ID'], x['ROW_VERSION']), axis=1)
-        df.insert(0, 'index', index)
-        df.set_index(index, inplace=True, drop=True)
-        df.drop(['index'], axis=1, inplace=True)
+        index = df['ROW_ID'].astype(str) + '_' + df['ROW_VERSION'].astype(str)
+        df.index = pandas.Index(index.values)
 
         return df
 
@@ -262,27 +272,109 @@ def _csv2df(path):
     return df
 
 
-def _getView(syn, view_id, clause=None):
+ROW_ID_BATCH = 500
+
+# Row metadata columns of entity-view query results, which are not annotations
+ROW_COLUMNS = ('ROW_ID', 'ROW_VERSION', 'ROW_ETAG', 'etag')
+
+
+def _getView(syn, view_id, clause=None, columns=None):
     """
     Based on a user-defined query calls to synapse's tableQuery function and returns the entity-view generator object.
 
     :param syn:      A Synapse object: syn = synapseclient.login(username, password) - Must be logged into synapse
     :param view_id:  A Synapse ID of an entity-view (Note: Edit permission on its' files is required)
     :param clause:   A SQL clause to allow for sub-setting & row filtering in order to reduce the data-size
+    :param columns:  A list of column names to select instead of all columns
     :return:         An object of type synapse entity-view
     """
 
+    if columns is None:
+        select = 'select * from '
+    else:
+        select = 'select %s from ' % ', '.join('"%s"' % column for column in columns)
+
     if clause is None:
-        query = "".join(['select * from ', view_id])
+        query = "".join([select, view_id])
         view = syn.tableQuery(query)
     else:
-        query = "".join(['select * from ', view_id, ' ', clause])
+        query = "".join([select, view_id, ' ', clause])
         view = syn.tableQuery(query)
 
     return view
 
 
-def query2df(syn, view_id, clause):
+def _rowIdClauses(rowIds, clause=None, batchSize=ROW_ID_BATCH):
+    """
+    Yields one SQL clause per batch of ROW_IDs, restricting the user-defined clause to the ROW_IDs of the batch.
+
+    :param rowIds:     An iterable of entity-view ROW_IDs
+    :param clause:     A SQL clause starting with 'where' or an empty/None clause
+    :param batchSize:  Maximum number of ROW_IDs per clause
+    """
+    rowIds = sorted(set(int(rowId) for rowId in rowIds))
+
+    condition = None
+    if clause:
+        condition = re.sub(r'^\s*where\s+', '', clause, flags=re.IGNORECASE)
+        if condition == clause.strip():
+            raise ValueError("Only 'where' clauses can be combined with ROW_ID pushdown: %s" % clause)
+
+    for start in range(0, len(rowIds), batchSize):
+        rows = 'ROW_ID IN (%s)' % ', '.join(str(rowId) for rowId in rowIds[start:start + batchSize])
+        if condition is None:
+            yield 'where %s' % rows
+        else:
+            yield 'where %s AND (%s)' % (rows, condition)
+
+
+def _getViews(syn, view_id, clause=None, columns=None, rowIds=None):
+    """
+    Same as _getView, but when rowIds are given issues one query per batch of ROW_IDs and yields every result.
+    """
+    if rowIds is None:
+        yield _getView(syn=syn, view_id=view_id, clause=clause, columns=columns)
+    else:
+        for rowIdClause in _rowIdClauses(rowIds, clause, ROW_ID_BATCH):
+            yield _getView(syn=syn, view_id=view_id, clause=rowIdClause, columns=columns)
+
+
+def _viewCsv2df(path):
+    """
+    Reads an entity-view query csv file straight into a data frame. ROW_ID and ROW_VERSION are read as integers and
+    every other column as strings, with empty cells kept as '' (the values csv.DictReader would give).
+
+    :param path:    Path to the csv file downloaded by syn.tableQuery
+    :return:        A data frame containing synapse minimal schema with row index defined as ROW_ID, ROW_VERSION,
+                    and etag column values concatenated by '_'.
+    """
+    df = pandas.read_csv(path, dtype=_viewDtypes(path), keep_default_na=False, na_filter=False)
+    df = _makeIndex(df)
+
+    return df
+
+
+def _viewDtypes(path):
+    """
+    Reads the header of an entity-view query csv file and returns the dtypes used to load it: integers for ROW_ID
+    and ROW_VERSION, strings for every other column.
+    """
+    columns = pandas.read_csv(path, nrows=0).columns
+    return dict((column, 'int64' if column in ('ROW_ID', 'ROW_VERSION') else object) for column in columns)
+
+
+def _iterViewCsv(path, chunksize):
+    """
+    Same as _viewCsv2df but yields the entity-view in data frames of at most chunksize rows, all with the same
+    columns, dtypes and ROW_ID_ROW_VERSION index.
+    """
+    reader = pandas.read_csv(path, dtype=_viewDtypes(path), keep_default_na=False, na_filter=False,
+                             chunksize=chunksize)
+    for chunk in reader:
+        yield _makeIndex(chunk)
+
+
+def query2df(syn, view_id, clause, columns=None, rowIds=None):
     """
     Converts an entity-view query result into a pandas data frame, creates an index column by concatenating ROW_IDs,
     ROW_VERSION, and etags with an underscore ('_') symbol, and sets the index column as the data frames' index then
@@ -291,17 +383,41 @@ def query2df(syn, view_id, clause):
     :param syn:         A Synapse object: syn = synapseclient.login(username, password) - Must be logged into synapse
     :param view_id:     A Synapse ID of an entity-view (Note: Edit permission on its' files is required)
     :param clause:      A SQL clause to allow for sub-setting & row filtering in order to reduce the data-size
+    :param columns:     A list of column names to download instead of all columns
+    :param rowIds:      A list of ROW_IDs to download, queried in batches of ROW_ID_BATCH. The clause must then be
+                        a 'where' clause
     :return:            A data frame containing synapse minimal schema with row index defined as ROW_ID, ROW_VERSION,
                         and etag column values concatenated by '_'.
     """
 
-    view = _getView(syn=syn, view_id=view_id, clause=clause)
+    frames = [_viewCsv2df(view.filepath) for view in _getViews(syn, view_id, clause, columns, rowIds)]
+    if len(frames) == 1:
+        return frames[0]
 
-    f = csv.DictReader(file(view.filepath))
-    df = pandas.DataFrame(list(f))
-    df = _makeIndex(df)
+    return pandas.concat(frames)
 
-    return df
+
+def query2dfChunks(syn, view_id, clause, chunksize=50000, columns=None, rowIds=None):
+    """
+    Streaming version of query2df: yields the entity-view in data frames of at most chunksize rows so that only one
+    chunk is held in memory at a time. Every chunk has the same columns, dtypes and index as query2df.
+
+    :param syn:         A Synapse object: syn = synapseclient.login(username, password) - Must be logged into synapse
+    :param view_id:     A Synapse ID of an entity-view (Note: Edit permission on its' files is required)
+    :param clause:      A SQL clause to allow for sub-setting & row filtering in order to reduce the data-size
+    :param chunksize:   Number of rows per data frame. Default is 50000
+    :param columns:     A list of column names to download instead of all columns
+    :param rowIds:      A list of ROW_IDs to download, see query2df
+
+    Example:
+
+             for chunk in query2dfChunks(syn, 'syn12345', clause=None, chunksize=10000):
+                 print(chunk.shape)
+    """
+
+    for view in _getViews(syn, view_id, clause, columns, rowIds):
+        for chunk in _iterViewCsv(view.filepath, chunksize):
+            yield chunk
 
 
 def _dropSynapseIndices(df):
@@ -316,7 +432,198 @@ def _dropSynapseIndices(df):
     return df
 
 
-def _checkSave(syn, new_view, current_view, schema_id):
+def _normalizeCells(column):
+    """
+    Converts a data frame column to the strings Synapse writes in its query csv files, so that the same value read
+    by query2df and by pandas.read_csv compares equal (i.e. 1.0 and '1', True and 'true'). Missing values become ''.
+
+    :param column:  A pandas Series
+    :return:        A pandas Series of strings
+    """
+    if column.dtype.kind == 'f':
+        integral = column.notnull() & (column % 1 == 0)
+        text = column.astype(str)
+        text[integral] = column[integral].astype('int64').astype(str)
+    elif column.dtype.kind == 'b':
+        text = column.astype(str).str.lower()
+    else:
+        text = column.astype(str)
+    return text.where(column.notnull(), '')
+
+
+def _diffViews(current_view, user_df):
+    """
+    Compares the user's data frame with the current entity-view cell by cell. Empty user cells are ignored, the same
+    way DataFrame.update ignores them.
+
+    :param current_view:  An existing entity-view data frame
+    :param user_df:       A data frame with updated cells, indexed like current_view
+    :return:              A boolean data frame for the user rows found in the entity-view and the annotation columns
+                          shared by both, True where the user value differs from the current one
+    """
+    rows = user_df.index[user_df.index.isin(current_view.index)]
+    columns = [column for column in user_df.columns
+               if column in current_view.columns and column not in ROW_COLUMNS]
+
+    changed = pandas.DataFrame(False, index=rows, columns=columns)
+    for column in columns:
+        new = user_df.loc[rows, column]
+        old = current_view.loc[rows, column]
+        changed[column] = new.notnull().values & (_normalizeCells(new).values != _normalizeCells(old).values)
+
+    return changed
+
+
+def _splitBatches(df, batchRows=None, batchBytes=None):
+    """
+    Splits a data frame into consecutive row ranges holding at most batchRows rows and about batchBytes bytes of
+    csv each (a single row larger than batchBytes gets a batch of its own).
+
+    :return:  A list of [start, end) row positions
+    """
+    total = len(df)
+    if not total:
+        return []
+    if batchBytes is None:
+        step = batchRows or total
+        return [[start, min(start + step, total)] for start in range(0, total, step)]
+
+    # csv size of every row: the cell strings plus one delimiter per cell
+    row_bytes = pandas.Series(len(df.columns) + len(str(df.index[0])), index=df.index)
+    for column in df.columns:
+        row_bytes += df[column].astype(str).str.len().values
+    row_bytes = row_bytes.values
+
+    batches = []
+    start = 0
+    size = 0
+    for position in range(total):
+        full = batchRows is not None and position - start >= batchRows
+        if position > start and (full or size + row_bytes[position] > batchBytes):
+            batches.append([start, position])
+            start = position
+            size = 0
+        size += row_bytes[position]
+    batches.append([start, total])
+    return batches
+
+
+def _checkpointFingerprint(syn_id, path, clause, deltaOnly, pushdown):
+    """
+    Identifies an updateEntityView run so that a checkpoint is only resumed for the same view and user csv.
+    """
+    path = os.path.abspath(path)
+    source = json.dumps([syn_id, path, os.path.getsize(path), os.path.getmtime(path), clause, deltaOnly, pushdown])
+    return hashlib.md5(source.encode('utf-8')).hexdigest()
+
+
+def _writeCheckpoint(checkpoint, state):
+    tmp = checkpoint + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp, checkpoint)
+
+
+def _resumeCheckpoint(checkpoint, fingerprint):
+    """
+    Loads the upload state and the prepared upload data frame saved by a previous run with the same fingerprint.
+
+    :return:  (state, data frame), or (None, None) if there is nothing to resume
+    """
+    if not os.path.exists(checkpoint):
+        return None, None
+    with open(checkpoint) as f:
+        state = json.load(f)
+    if state['fingerprint'] != fingerprint or not os.path.exists(checkpoint + '.csv'):
+        logging.info("Checkpoint %s belongs to another update and is ignored." % checkpoint)
+        return None, None
+
+    df = pandas.read_csv(checkpoint + '.csv', index_col=0, dtype=object, keep_default_na=False, na_filter=False)
+    return state, df
+
+
+def _partialRowset(schema_id, df, nameToColumnId):
+    """
+    Converts entity-view rows holding only some of the view columns into a PartialRowset, which changes the given
+    cells only. A plain Table upload would replace the whole rows, clearing the columns that were not downloaded.
+    """
+    from synapseclient.table import PartialRow, PartialRowset
+
+    columns = [column for column in df.columns if column not in ROW_COLUMNS]
+    cells = df[columns].astype(object)
+    cells = cells.where(cells.notnull() & (cells != ''), None)
+
+    rows = []
+    for index, values in zip(df.index, cells.values):
+        rows.append(PartialRow(dict(zip(columns, values)), int(str(index).split('_')[0]),
+                               etag=df.at[index, 'etag'] if 'etag' in df.columns else None,
+                               nameToColumnId=nameToColumnId))
+    return PartialRowset(schema_id, rows)
+
+
+def _storeBatches(syn, schema_id, df, batchRows=None, batchBytes=None, threads=1, checkpoint=None, state=None,
+                  partial=False):
+    """
+    Uploads an updated entity-view data frame in batches. With a checkpoint file, the prepared data frame is saved
+    next to it (checkpoint + '.csv') and the index of every committed batch is recorded, so that a rerun continues
+    from the first uncommitted batch. The checkpoint files are removed once every batch is committed.
+
+    :param syn:         A Synapse object: syn = synapseclient.login(username, password) - Must be logged into synapse
+    :param schema_id:   The schemas' synapse id of the existing entity-view
+    :param df:          The entity-view data frame to upload, indexed by ROW_ID_ROW_VERSION
+    :param batchRows:   Maximum number of rows per batch
+    :param batchBytes:  Maximum csv size of a batch in bytes
+    :param threads:     Number of batches uploaded at the same time. Synapse applies the transactions of one table
+                        one after another, so more threads mostly overlap the csv uploads
+    :param checkpoint:  Path of the checkpoint file
+    :param state:       The checkpoint state of a resumed run
+    :param partial:     If True, df holds only some of the view columns and is uploaded as partial rows
+    """
+    if state is None:
+        state = {'fingerprint': None, 'committed': []}
+    if state.get('batches') is None:
+        state['batches'] = _splitBatches(df, batchRows, batchBytes)
+    if checkpoint is not None and not state['committed']:
+        df.to_csv(checkpoint + '.csv')
+        _writeCheckpoint(checkpoint, state)
+
+    batches = state['batches']
+    committed = set(state['committed'])
+    pending = [i for i in range(len(batches)) if i not in committed]
+    logging.info("Uploading %d of %d batches to entity-view %s." % (len(pending), len(batches), schema_id))
+    lock = threading.Lock()
+    if partial:
+        nameToColumnId = dict((column.name, column.id) for column in syn.getColumns(schema_id))
+
+    def _store(i):
+        start, end = batches[i]
+        if partial:
+            syn.store(_partialRowset(schema_id, df.iloc[start:end], nameToColumnId))
+        else:
+            syn.store(synapseclient.Table(schema_id, df.iloc[start:end]))
+        with lock:
+            state['committed'].append(i)
+            logging.info("Committed batch %d (rows %d-%d)." % (i, start, end - 1))
+            if checkpoint is not None:
+                _writeCheckpoint(checkpoint, state)
+
+    if threads <= 1:
+        for i in pending:
+            _store(i)
+    else:
+        pool = Pool(threads)
+        try:
+            pool.map(_store, pending)
+        finally:
+            pool.close()
+            pool.join()
+
+    if checkpoint is not None:
+        os.remove(checkpoint + '.csv')
+        os.remove(checkpoint)
+
+
+def _checkSave(syn, new_view, current_view, schema_id, **upload):
     """
     Checks if the user defined schema of updated entity-view matches the current entity-view.
     If and only if the schemas matches, then it stores the updated entity-view by passing the schema id
@@ -326,6 +633,7 @@ def _checkSave(syn, new_view, current_view, schema_id):
     :param new_view:      An entity-view data frame with updated cells
     :param current_view:  An existing entity-view data frame with updated cells
     :param schema_id:     The schemas' synapse id of the existing entity-view
+    :param upload:        Batching options passed on to _storeBatches
     :return:              None, with an updated entity-view on synapse or a logged info on which columns
                           caused the schema mismatch if no errors occurs.
     """
@@ -337,14 +645,15 @@ def _checkSave(syn, new_view, current_view, schema_id):
 
     if not schema_unmatch:
         logging.info("Updating annotations on entity-view %s." % schema_id)
-        view = syn.store(synapseclient.Table(schema_id, new_view))
+        _storeBatches(syn, schema_id, new_view, **upload)
     else:
         schema_unmatch_names = ''.join(map(str, schema_unmatch))
         logging.info(
             "Updated data frame and entity-view's %s schema names %s don't match." % (schema_id, schema_unmatch_names))
 
 
-def updateEntityView(syn, syn_id, path, clause=None):
+def updateEntityView(syn, syn_id, path, clause=None, deltaOnly=False, chunksize=None, batchRows=None, batchBytes=None,
+                     threads=1, checkpoint=None, pushdown=False):
     """
     Updates Entity-View annotations by giving a user-defined csv path with the same schema as the Entity-View.
 
@@ -359,21 +668,108 @@ def updateEntityView(syn, syn_id, path, clause=None):
                       df.apply(lambda x: '%s_%s' % (x['ROW_ID'], x['ROW_VERSION']), axis=1)
     :param clause:    A SQL clause to allow for sub-setting & row filtering in order to reduce the data-size on
                       download
+    :param deltaOnly: If True, only the rows with at least one changed cell are uploaded (with their ROW_ID,
+                      ROW_VERSION and etag) instead of the whole entity-view
+    :param chunksize: If given, the entity-view is read, merged and uploaded chunksize rows at a time so memory use
+                      stays bounded by the chunk size instead of the view size
+    :param batchRows: Maximum number of rows uploaded per table transaction. Default is all rows at once
+    :param batchBytes: Maximum csv size in bytes uploaded per table transaction
+    :param threads:   Number of batches uploaded in parallel. Default is 1
+    :param checkpoint: Path of a checkpoint file recording the committed batches. If the upload fails, calling
+                      updateEntityView again with the same arguments skips the download and uploads only the batches
+                      that were not committed. Cannot be combined with chunksize
+    :param pushdown:  If True, only the columns of the user csv (plus etag) and the ROW_IDs it lists are downloaded,
+                      using batched 'ROW_ID IN (...)' queries, and the changes are uploaded as partial rows so the
+                      other columns are left untouched. The clause, if any, must be a 'where' clause
+    :return:          With deltaOnly, a dict with the number of changed 'rows' and 'cells' and the list of changed
+                      'columns'
 
     Examples:
 
              updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv')
              updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv',
                               where assay = 'geneExpression')
+             summary = updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv', deltaOnly=True)
+             updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv', deltaOnly=True, chunksize=20000)
+             updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv', batchRows=5000,
+                              batchBytes=10 * 2 ** 20, checkpoint='myproject_update.checkpoint')
+             updateEntityView(syn, 'syn12345', 'myproject_annotation_updates.csv', deltaOnly=True, pushdown=True)
     """
+    if checkpoint is not None and chunksize is not None:
+        raise ValueError("A checkpoint cannot be used together with chunksize.")
+
+    upload = dict(batchRows=batchRows, batchBytes=batchBytes, threads=threads, partial=pushdown)
+    if checkpoint is not None:
+        fingerprint = _checkpointFingerprint(syn_id, path, clause, deltaOnly, pushdown)
+        state, prepared = _resumeCheckpoint(checkpoint, fingerprint)
+        if state is not None:
+            logging.info("Resuming upload to entity-view %s from %s." % (syn_id, checkpoint))
+            _storeBatches(syn, syn_id, prepared, checkpoint=checkpoint, state=state, **upload)
+            return state.get('summary')
+        upload['checkpoint'] = checkpoint
+        upload['state'] = {'fingerprint': fingerprint, 'batches': None, 'committed': []}
+
     user_df = _csv2df(path)
-    current_view = query2df(syn, syn_id, clause)
 
     if user_df.empty:
         logging.info("Uploaded data frame is empty with nothing to update!")
+        return
+
+    columns = None
+    rowIds = None
+    if pushdown:
+        columns = [column for column in user_df.columns if column not in ROW_COLUMNS]
+        columns.append('etag')
+        rowIds = user_df['ROW_ID']
+        logging.info("Downloading %d columns of %d rows from entity-view %s." % (len(columns), len(set(rowIds)),
+                                                                              syn_id))
+
+    if chunksize is None:
+        current_view = query2df(syn, syn_id, clause, columns=columns, rowIds=rowIds)
+        return _updateViewFrame(syn, syn_id, current_view, user_df, deltaOnly, upload)
+
+    summary = {'rows': 0, 'cells': 0, 'columns': []}
+    for current_view in query2dfChunks(syn, syn_id, clause, chunksize=chunksize, columns=columns, rowIds=rowIds):
+        if not user_df.index.isin(current_view.index).any():
+            continue
+        chunk_summary = _updateViewFrame(syn, syn_id, current_view, user_df, deltaOnly, upload)
+        if deltaOnly:
+            summary['rows'] += chunk_summary['rows']
+            summary['cells'] += chunk_summary['cells']
+            summary['columns'].extend(column for column in chunk_summary['columns']
+                                      if column not in summary['columns'])
+    if deltaOnly:
+        return summary
+
+
+def _updateViewFrame(syn, syn_id, current_view, user_df, deltaOnly, upload):
+    """
+    Applies the user's updates to one downloaded entity-view data frame (the whole view or one chunk of it) and
+    uploads the result. See updateEntityView.
+    """
+    if deltaOnly:
+        changed = _diffViews(current_view, user_df)
+        rows = changed.index[changed.any(axis=1).values]
+        summary = {'rows': len(rows),
+                   'cells': int(changed.values.sum()),
+                   'columns': [column for column in changed.columns if changed[column].any()]}
+        logging.info("%d rows and %d cells changed in columns: %s" %
+                     (summary['rows'], summary['cells'], ', '.join(summary['columns'])))
+
+        if summary['rows']:
+            view_df = current_view.loc[rows]
+            view_df.update(user_df)
+
+            if upload.get('state') is not None:
+                upload['state']['summary'] = summary
+            _checkSave(syn=syn, new_view=view_df, current_view=current_view, schema_id=syn_id, **upload)
+        else:
+            logging.info("Entity-view %s is already up to date." % syn_id)
+
+        return summary
 
     else:
         view_df = current_view
         view_df.update(user_df)
 
-        _checkSave(syn=syn, new_view=view_df, current_view=current_view, schema_id=syn_id)
+        _checkSave(syn=syn, new_view=view_df, current_view=current_view, schema_id=syn_id, **upload)
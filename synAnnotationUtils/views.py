@@ -0,0 +1,144 @@
+import uuid
+import logging
+import pandas
+import synapseclient
+import synapseutils
+from synapseclient.utils import from_unix_epoch_time
+from . import changes
+
+# Columns Synapse adds to every file view, everything else in a view is an annotation
+DEFAULT_VIEW_COLUMNS = {'ROW_ID', 'ROW_VERSION', 'ROW_ETAG', 'id', 'name', 'etag', 'type', 'concreteType',
+                        'createdOn', 'createdBy', 'modifiedOn', 'modifiedBy', 'currentVersion', 'parentId',
+                        'benefactorId', 'projectId', 'dataFileHandleId', 'dataFileSizeBytes', 'dataFileMD5Hex'}
+
+PARENT_ID_BATCH = 200
+
+
+class EntityRecord(object):
+    """
+    A lightweight stand-in for a File entity read from an entity-view row: its id, name, etag, parent and
+    annotations (as lists of values, like synapseclient returns them).
+
+    Annotations are read and set like on an Entity, i.e. record["dataType"]. Records are stored with
+    bulk.storeEntity, which writes only the annotations changed since the record was read, since a view may not
+    hold every annotation key of the entity.
+    """
+
+    def __init__(self, id, name, etag, parentId=None, annotations=None):
+        self.id = id
+        self.name = name
+        self.etag = etag
+        self.parentId = parentId
+        self.annotations = annotations if annotations is not None else {}
+        self._read = dict((key, changes.normalizeAnnoValue(value)) for key, value in self.annotations.items())
+
+    def changedAnnotations(self):
+        """
+        :return:   A dict of the annotations set or changed since the record was read, and a list of the removed keys
+        """
+        updated = dict((key, value) for key, value in self.annotations.items()
+                       if key not in self._read or changes.normalizeAnnoValue(value) != self._read[key])
+        removed = [key for key in self._read if key not in self.annotations]
+        return updated, removed
+
+    def markStored(self, etag):
+        self.etag = etag
+        self._read = dict((key, changes.normalizeAnnoValue(value)) for key, value in self.annotations.items())
+
+    def __getitem__(self, key):
+        return self.annotations[key]
+
+    def __setitem__(self, key, value):
+        self.annotations[key] = value
+
+    def __repr__(self):
+        return "EntityRecord(id=%r, name=%r, etag=%r)" % (self.id, self.name, self.etag)
+
+
+def _converter(columnType):
+    if columnType == 'INTEGER':
+        return int
+    if columnType == 'DOUBLE':
+        return float
+    if columnType == 'DATE':
+        return lambda value: from_unix_epoch_time(int(value))
+    if columnType == 'BOOLEAN':
+        return lambda value: value.lower() == 'true'
+    return lambda value: value
+
+
+def _iterQueryRecords(syn, query, chunksize):
+    """
+    Runs a view query and yields one EntityRecord per row, reading the downloaded csv chunksize rows at a time.
+    """
+    logging.info(query)
+    results = syn.tableQuery(query)
+    converters = dict((header.name, _converter(header.columnType)) for header in results.headers
+                      if header.name not in DEFAULT_VIEW_COLUMNS)
+
+    reader = pandas.read_csv(results.filepath, dtype=object, keep_default_na=False, na_filter=False,
+                             chunksize=chunksize)
+    for chunk in reader:
+        keys = [key for key in chunk.columns if key in converters]
+        for row in chunk.to_dict('records'):
+            annotations = dict((key, [converters[key](row[key])]) for key in keys if row[key] != '')
+            yield EntityRecord(row['id'], row['name'], row['etag'], row.get('parentId'), annotations)
+
+
+def _projectId(syn, container):
+    """
+    :return:   The Synapse ID of the Project holding a Project or Folder
+    """
+    if isinstance(container, synapseclient.Project):
+        return container.id
+    for header in syn.restGET('/entity/%s/path' % container.id)['path']:
+        if header['type'].endswith('.Project'):
+            return header['id']
+    raise ValueError("Cannot find the project of %s, give the viewId of a file view." % container.id)
+
+
+def iterViewRecords(syn, synId, viewId=None, chunksize=10000):
+    """
+    Enumerates the Files of a Project or Folder with entity-view queries instead of walking the container and
+    getting every File, yielding an EntityRecord per File.
+
+    :param syn:            A Synapse object: syn = synapseclient.login()- Must be logged into synapse
+    :param synId:          A Synapse ID of Project or Folder
+    :param viewId:         A Synapse ID of an existing file view whose scope includes synId. Only the annotation keys
+                           that are columns of the view are read. If None, a temporary file view scoped to synId with
+                           a column for every annotation key is created in the project of synId (Synapse only
+                           accepts views in a Project) and deleted afterwards. This needs create permission on the
+                           project and a synapseclient with EntityViewSchema(addAnnotationColumns=True)
+    :param chunksize:      Number of view rows converted to records at a time
+
+    Example:
+
+       for record in iterViewRecords(syn, "syn12345"):
+           print(record.id, record.annotations)
+
+    """
+    container = syn.get(synId, downloadFile=False)
+    if viewId is None:
+        view = synapseclient.EntityViewSchema(name="synAnnotationUtils-%s" % uuid.uuid4().hex,
+                                              parent=_projectId(syn, container), scopes=[synId],
+                                              addDefaultViewColumns=True, addAnnotationColumns=True)
+        view = syn.store(view)
+        logging.info("Created temporary file view %s." % view.id)
+        try:
+            for record in _iterQueryRecords(syn, "select * from %s" % view.id, chunksize):
+                yield record
+        finally:
+            syn.delete(view)
+        return
+
+    if isinstance(container, synapseclient.Project):
+        queries = ["select * from %s where projectId = '%s'" % (viewId, synId)]
+    else:
+        folderIds = [dirpath[1] for dirpath, dirname, filename in synapseutils.walk(syn, synId)]
+        queries = ["select * from %s where parentId IN (%s)" %
+                   (viewId, ", ".join("'%s'" % folderId for folderId in folderIds[start:start + PARENT_ID_BATCH]))
+                   for start in range(0, len(folderIds), PARENT_ID_BATCH)]
+
+    for query in queries:
+        for record in _iterQueryRecords(syn, query, chunksize):
+            yield record
@@ -0,0 +1,166 @@
+"""
+Runs the asyncio layer against a local stand-in for the Synapse entity endpoints, no Synapse login needed.
+"""
+import sys
+import json
+import time
+import threading
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_equals
+
+if sys.version_info < (3, 5):
+    raise SkipTest("synAnnotationUtils.aio requires Python 3.5+")
+
+import asyncio
+from urllib.request import Request, urlopen
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from synAnnotationUtils import aio
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves GET/PUT /entity/<id> from a dict, sleeping on each request and recording the peak number of
+    requests handled at the same time.
+    """
+    daemon_threads = True
+
+    def __init__(self, entities, delay):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.entities = entities
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.peak = 0
+        self.requests = 0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def _handle(self, body=None):
+        server = self.server
+        with server.lock:
+            server.inFlight += 1
+            server.requests += 1
+            server.peak = max(server.peak, server.inFlight)
+        try:
+            time.sleep(server.delay)
+            entityId = self.path.rsplit('/', 1)[-1]
+            if body is not None:
+                server.entities[entityId] = body
+            if entityId not in server.entities:
+                self.send_error(404)
+                return
+            payload = json.dumps(server.entities[entityId]).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with server.lock:
+                server.inFlight -= 1
+
+    def do_GET(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle(json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')))
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInEntity(object):
+
+    def __init__(self, id, name, annotations):
+        self.id = id
+        self.name = name
+        self.annotations = annotations
+
+
+class StandInSynapse(object):
+    """
+    The blocking get/store calls of a Synapse object, made over HTTP to a StandInServer.
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, entityId, downloadFile=True):
+        with urlopen('%s/entity/%s' % (self.url, entityId)) as response:
+            return StandInEntity(**json.loads(response.read().decode('utf-8')))
+
+    def store(self, entity, forceVersion=False):
+        body = json.dumps({'id': entity.id, 'name': entity.name, 'annotations': entity.annotations})
+        request = Request('%s/entity/%s' % (self.url, entity.id), data=body.encode('utf-8'), method='PUT',
+                          headers={'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            return StandInEntity(**json.loads(response.read().decode('utf-8')))
+
+
+def _serve(entities, delay=0.05):
+    server = StandInServer(entities, delay)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, StandInSynapse('http://127.0.0.1:%d' % server.server_address[1])
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_update_anno_by_dict_concurrency():
+    """
+    Updates 60 entities with at most 20 requests in flight and leaves up-to-date entities alone.
+    """
+    entities = dict(('syn%d' % i, {'id': 'syn%d' % i, 'name': 'file%d.bam' % i,
+                                   'annotations': {'dataType': ['testing' if i % 3 else 'old']}})
+                    for i in range(60))
+    server, syn = _serve(entities)
+    asyn = aio.AsyncSynapse(syn, limit=20)
+    try:
+        summary = _run(aio.updateAnnoByDict(asyn, sorted(entities), {'dataType': 'testing', 'center': 'TCGA'}))
+    finally:
+        asyn.close()
+        server.shutdown()
+        server.server_close()
+
+    assert_equals(summary, {'changed': 60, 'errors': []})
+    assert_equals(server.requests, 120)
+    assert server.peak <= 20, server.peak
+    assert server.peak > 1, server.peak
+    assert_equals(entities['syn0']['annotations'], {'dataType': 'testing', 'center': 'TCGA'})
+
+
+def test_del_anno_by_key_and_audit():
+    """
+    Deletes a key where present and audits the result, counting unknown ids as failures.
+    """
+    entities = dict(('syn%d' % i, {'id': 'syn%d' % i, 'name': 'file%d.bam' % i,
+                                   'annotations': {'dataType': ['testing'], 'tester': ['x']} if i % 2 else
+                                   {'dataType': ['testing']}})
+                    for i in range(10))
+    server, syn = _serve(entities, delay=0.01)
+    asyn = aio.AsyncSynapse(syn, limit=5)
+    try:
+        summary = _run(aio.delAnnoByKey(asyn, sorted(entities) + ['syn404'], ['tester']))
+        entityMissAllAnno, incorrect, missing = _run(aio.auditCommonDict(asyn, sorted(entities),
+                                                                         {'dataType': 'testing', 'tester': 'x'}))
+    finally:
+        asyn.close()
+        server.shutdown()
+        server.server_close()
+
+    assert_equals(summary['changed'], 5)
+    assert_equals(summary['unchanged'], 5)
+    assert_equals(summary['failed'], 1)
+    assert_equals([entityId for entityId, error in summary['errors']], ['syn404'])
+    assert_equals(entityMissAllAnno, [])
+    assert_equals(dict(incorrect), {})
+    assert_equals(sorted(synEntity.id for synEntity in missing['tester']), sorted(entities))
@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import pandas
+from synAnnotationUtils import annotationsYaml, views
+from nose.tools import assert_equals
+
+
+class FakeEntity(object):
+
+    def __init__(self, id, annotations=None, path=None):
+        self.id = id
+        self.annotations = annotations if annotations is not None else {}
+        self.path = path
+
+
+class FakeSynapse(object):
+    """
+    Serves the annotation dictionary and the annotations of a few Files.
+    """
+
+    def __init__(self, dictionaryPath, files):
+        self.dictionaryPath = dictionaryPath
+        self.files = files
+
+    def get(self, entityId, downloadFile=True):
+        return FakeEntity(entityId, path=self.dictionaryPath)
+
+    def getAnnotations(self, entityId):
+        return dict(self.files[entityId], id=entityId, etag='etag-%s' % entityId)
+
+
+FILES = {'syn1': {'dataType': ['bam'], 'assay': ['rnaSeq', 'wgs']},
+         'syn2': {'dataType': ['bam'], 'assay': ['wgs'], 'readLength': [100]},
+         'syn3': {'dataType': ['csv'], 'tester': ['x']}}
+
+
+def _withDictionary(test):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'dictionary.yaml')
+        with open(path, 'w') as f:
+            f.write('dataType: [bam, csv, fastq]\nassay: [rnaSeq, wgs]\nreadLength: 100\n')
+        test(FakeSynapse(path, FILES))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_count_per_annot_frame():
+    """
+    Every dictionary pair is counted, pairs not in use with 0, and the grouped counts are a cross-tab.
+    """
+    def _test(syn):
+        entities = [FakeEntity(entityId, annotations) for entityId, annotations in sorted(FILES.items())]
+        counts = annotationsYaml.countPerAnnotFrame('syn9', entities, syn)
+        assert_equals(dict(counts['count']), {('dataType', 'bam'): 2, ('dataType', 'csv'): 1,
+                                              ('dataType', 'fastq'): 0, ('assay', 'rnaSeq'): 1,
+                                              ('assay', 'wgs'): 2, ('readLength', '100'): 1})
+
+        grouped = annotationsYaml.countPerAnnotFrame('syn9', entities, syn, grouping='dataType')
+        assert_equals(list(grouped.columns), ['bam', 'csv', 'fastq'])
+        assert_equals(list(grouped.loc[('assay', 'wgs')]), [2, 0, 0])
+        assert_equals(list(grouped.loc[('dataType', 'csv')]), [0, 1, 0])
+        assert_equals(list(grouped.loc[('dataType', 'fastq')]), [0, 0, 0])
+    _withDictionary(_test)
+
+
+class FakeRowset(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def asDataFrame(self):
+        return pandas.DataFrame(self.rows)
+
+
+class CountingSynapse(object):
+    """
+    Has 5 matching rows in a view and 7 entities in the query service, and can refuse to count on the server.
+    """
+
+    def __init__(self, serverCounts=True):
+        self.serverCounts = serverCounts
+        self.queries = []
+
+    def tableQuery(self, query, resultsAs='csv'):
+        self.queries.append(query)
+        if query.startswith('select count(*)'):
+            if not self.serverCounts:
+                raise ValueError("count not supported")
+            return FakeRowset({'COUNT(*)': [5]})
+        return FakeRowset({'id': ['syn%d' % i for i in range(5)]})
+
+    def query(self, query):
+        self.queries.append(query)
+        if not self.serverCounts:
+            raise ValueError("count not supported")
+        return {'totalNumberOfResults': 7, 'results': []}
+
+    def chunkedQuery(self, query):
+        self.queries.append(query)
+        return iter(range(7))
+
+
+def test_count_query_results():
+    """
+    Plain queries are counted on the server, others and refused counts are paged through.
+    """
+    syn = CountingSynapse()
+    assert_equals(annotationsYaml.countQueryResults("select id, name from syn123 where dataType = 'bam'", syn), 5)
+    assert_equals(syn.queries, ["select count(*) from syn123 where dataType = 'bam'"])
+    assert_equals(annotationsYaml.countQueryResults('select id from file where projectId=="syn1"', syn), 7)
+    assert_equals(syn.queries[-1], 'select id from file where projectId=="syn1" limit 1 offset 1')
+
+    for sql in ["select distinct dataType from syn123", "select dataType, count(*) from syn123 group by dataType",
+                "select id from syn123 where dataType = 'bam' limit 2 offset 1"]:
+        syn = CountingSynapse()
+        assert_equals(annotationsYaml.countQueryResults(sql, syn), 5)
+        assert_equals(syn.queries, [sql])
+
+    syn = CountingSynapse(serverCounts=False)
+    assert_equals(annotationsYaml.countQueryResults("select id from syn123", syn), 5)
+    assert_equals(syn.queries, ["select count(*) from syn123", "select id from syn123"])
+    assert_equals(annotationsYaml.countQueryResults('select id from file where projectId=="syn1"', syn), 7)
+    assert_equals(syn.queries[-1], 'select id from file where projectId=="syn1"')
+
+
+def test_count_query_results_batch():
+    """
+    A batch of queries is counted concurrently, the counts in the order of the queries.
+    """
+    sqls = ["select id from syn123", 'select id from file where projectId=="syn1"'] * 5
+    assert_equals(annotationsYaml.countQueryResultsBatch(sqls, CountingSynapse(), threads=4), [5, 7] * 5)
+    assert_equals(annotationsYaml.countQueryResultsBatch(sqls, CountingSynapse(serverCounts=False), threads=1),
+                  [5, 7] * 5)
+
+
+def test_collect_annotations():
+    """
+    The key and value sets merged from several worker threads equal the serial ones, without the system keys.
+    """
+    files = dict(('syn%d' % i, {'dataType': ['type%d' % (i % 7)], 'key%d' % (i % 11): [i % 3]}) for i in range(200))
+    syn = FakeSynapse(None, files)
+    ids = sorted(files)
+
+    keys, values = annotationsYaml.collectAnnotations(syn, ids, progressEvery=50)
+    assert_equals(keys, set(['dataType'] + ['key%d' % i for i in range(11)]))
+    assert_equals(values, set(['type%d' % i for i in range(7)] + ['0', '1', '2']))
+    assert_equals(annotationsYaml.collectAnnotations(syn, ids, threads=4), (keys, values))
+
+    records = [views.EntityRecord(entityId, '%s.bam' % entityId, 'etag', 'syn1', annotations)
+               for entityId, annotations in sorted(files.items())]
+    assert_equals(annotationsYaml.collectAnnotations(None, records, threads=4), (keys, values))
+
+
+def test_collect_annotations_error():
+    """
+    A File whose annotations cannot be read fails the collection instead of leaving it incomplete.
+    """
+    syn = FakeSynapse(None, FILES)
+    try:
+        annotationsYaml.collectAnnotations(syn, ['syn1', 'syn4', 'syn2'], threads=2)
+        raise AssertionError("the missing File should have failed the collection")
+    except KeyError:
+        pass
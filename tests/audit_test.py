@@ -0,0 +1,150 @@
+import pandas
+from synAnnotationUtils import audit
+from nose.tools import assert_equals
+
+
+class FakeEntity(object):
+
+    def __init__(self, id, annotations):
+        self.id = id
+        self.annotations = annotations
+
+    def __getitem__(self, key):
+        return self.annotations[key]
+
+
+ENTITIES = [FakeEntity('syn1', {'dataType': ['bam'], 'center': ['TCGA']}),
+            FakeEntity('syn2', {'dataType': ['csv'], 'assay': ['rnaSeq']}),
+            FakeEntity('syn3', {}),
+            FakeEntity('syn4', {'center': ['TCGA']})]
+
+COMMON_DICT = {'dataType': 'bam', 'center': 'TCGA', 'species': 'Human'}
+
+
+def test_audit_common_dict_frame():
+    """
+    The vectorized audit finds the same entities as auditCommonDict.
+    """
+    annoDf = audit.annotationFrame(None, ENTITIES)
+    assert_equals(list(annoDf.index), ['syn1', 'syn2', 'syn3', 'syn4'])
+
+    result = audit.auditCommonDictFrame(annoDf, COMMON_DICT)
+    assert_equals(audit.maskIds(result['entityMissAllAnno']), ['syn3'])
+    assert_equals(audit.maskIds(result['missing']), {'dataType': ['syn4'], 'center': ['syn2'],
+                                                     'species': ['syn1', 'syn2', 'syn4']})
+    assert_equals(audit.maskIds(result['incorrect']), {'dataType': ['syn2']})
+    assert_equals(audit.maskIds(result['novel']), {'assay': ['syn2']})
+
+    entityMissAllAnno, incorrect, missing = next(audit.auditCommonDict(None, ENTITIES, COMMON_DICT))
+    assert_equals([synEntity.id for synEntity in entityMissAllAnno], audit.maskIds(result['entityMissAllAnno']))
+    assert_equals(dict((key, [synEntity.id for synEntity in incorrect[key]]) for key in incorrect),
+                  audit.maskIds(result['incorrect']))
+    assert_equals(dict((key, sorted(synEntity.id for synEntity in missing[key])) for key in missing),
+                  audit.maskIds(result['missing']))
+
+
+def test_audit_common_dict_frame_view():
+    """
+    Entity-view data frames use '' for missing values.
+    """
+    viewDf = pandas.DataFrame({'dataType': ['bam', '', 'csv'], 'center': ['TCGA', 'TCGA', '']},
+                              index=pandas.Index(['syn1', 'syn2', 'syn3'], name='id'))
+    result = audit.auditCommonDictFrame(viewDf, {'dataType': 'bam', 'center': 'TCGA'})
+    assert_equals(audit.maskIds(result['missing']), {'dataType': ['syn2'], 'center': ['syn3']})
+    assert_equals(audit.maskIds(result['incorrect']), {'dataType': ['syn3']})
+    assert_equals(audit.maskIds(result['entityMissAllAnno']), [])
+
+
+class FakeFile(FakeEntity):
+
+    def __init__(self, id, name, annotations):
+        FakeEntity.__init__(self, id, annotations)
+        self.name = name
+
+
+def test_streaming_records():
+    """
+    The iterAudit* generators yield one record per entity, and the aggregate results are built from them.
+    """
+    files = [FakeFile('syn1', 's1.bam', {'fileType': ['bam'], 'tester': ['a']}),
+             FakeFile('syn2', 's2.bam', {'fileType': ['sam']}),
+             FakeFile('syn3', 's3.txt', {'tester': ['b']}),
+             FakeFile('syn4', 's4.bam', {})]
+
+    records = list(audit.iterAuditFormatTypeByFileName(None, files, 'fileType', {'.bam': 'bam'}))
+    assert_equals([(record.id, record.status) for record in records],
+                  [('syn1', 'pass'), ('syn2', 'fail'), ('syn3', 'missingInDict'), ('syn4', 'fail')])
+    assert_equals(audit.auditRecordRow(records[1]), {'id': 'syn2', 'status': 'fail', 'incorrect': 'fileType',
+                                                     'missing': ''})
+    result = next(audit.auditFormatTypeByFileName(None, files, 'fileType', {'.bam': 'bam'}))
+    assert_equals(dict((key, [synEntity.id for synEntity in result[key]]) for key in result),
+                  {'incorrect': ['syn2'], 'missingInAnno': ['syn4'], 'missingInDict': ['syn3']})
+
+    metaDf = pandas.DataFrame({'id': ['s1', 's2', 's4'], 'tester': ['a', 'c', 'd']})
+    records = list(audit.iterAuditAgainstMetadata(None, files, metaDf, 'id', ['tester'], ['.bam', '.txt']))
+    assert_equals([(record.id, record.status, record.incorrect, record.missing) for record in records],
+                  [('syn1', 'pass', (), ()), ('syn2', 'fail', (), ('tester',)),
+                   ('syn3', 'missingMetadata', (), ()), ('syn4', 'missingAllAnno', (), ())])
+    entityMissMetadata, incorrect, missing = next(audit.auditAgainstMetadata(None, files, metaDf, 'id', ['tester'],
+                                                                             ['.bam', '.txt']))
+    assert_equals([synEntity.id for synEntity in entityMissMetadata], ['syn3'])
+    assert_equals(dict(incorrect), {})
+    assert_equals(dict((key, [synEntity.id for synEntity in missing[key]]) for key in missing), {'tester': ['syn2']})
+
+
+class FakeSynapse(object):
+
+    def __init__(self, entities):
+        self.entities = dict((synEntity.id, synEntity) for synEntity in entities)
+        self.gets = []
+
+    def get(self, synId, downloadFile=True):
+        self.gets.append(synId)
+        return self.entities[synId]
+
+
+def test_compact_result():
+    """
+    A compact result holds numeric ids per key and gets entities back only when iterated over.
+    """
+    result = next(audit.auditCommonDict(None, ENTITIES, COMMON_DICT, compact=True))
+    assert_equals(result.audited, 4)
+    assert_equals(result.ids('missingAllAnno'), ['syn3'])
+    assert_equals(result.keys('missing'), ['center', 'dataType', 'species'])
+    assert_equals(result.idDict('incorrect'), {'dataType': ['syn2']})
+    assert_equals(result.ids('missing', 'species'), ['syn1', 'syn2', 'syn4'])
+
+    syn = FakeSynapse(ENTITIES)
+    missing = result.rehydrate(syn, 'missing')
+    assert_equals(len(missing['species']), 3)
+    assert_equals(syn.gets, [])
+    assert_equals([synEntity.id for synEntity in missing['center']], ['syn2'])
+    assert_equals(syn.gets, ['syn2'])
+
+
+def test_audit_rules():
+    """
+    The fused audit gets each entity once and returns the result of every rule in its own audit's shape.
+    """
+    files = [FakeFile('syn1', 's1.bam', {'dataType': ['bam'], 'fileType': ['bam'], 'assay': ['rnaSeq']}),
+             FakeFile('syn2', 's2.bam', {'dataType': ['csv'], 'fileType': ['sam'], 'assay': ['wgs', 'chip']}),
+             FakeFile('syn3', 's3.txt', {})]
+    syn = FakeSynapse(files)
+    rules = [audit.CommonDictRule({'dataType': 'bam'}),
+             audit.FormatTypeRule('fileType', {'.bam': 'bam'}),
+             audit.VocabularyRule({'assay': ['rnaSeq', 'wgs']})]
+    commonResult, formatResult, vocabularyResult = next(audit.auditRules(syn, ['syn1', 'syn2', 'syn3'], rules))
+    assert_equals(syn.gets, ['syn1', 'syn2', 'syn3'])
+
+    entityMissAllAnno, incorrect, missing = commonResult
+    assert_equals([synEntity.id for synEntity in entityMissAllAnno], ['syn3'])
+    assert_equals(dict((key, [synEntity.id for synEntity in incorrect[key]]) for key in incorrect),
+                  {'dataType': ['syn2']})
+    assert_equals(dict((key, [synEntity.id for synEntity in formatResult[key]]) for key in formatResult),
+                  dict((key, [synEntity.id for synEntity in value]) for key, value in
+                       next(audit.auditFormatTypeByFileName(None, files, 'fileType', {'.bam': 'bam'})).items()))
+    assert_equals([synEntity.id for synEntity in vocabularyResult[1]['assay']], ['syn2'])
+
+    results = next(audit.auditRules(None, files, rules, compact=True))
+    assert_equals(results[2].idDict('incorrect'), {'assay': ['syn2']})
+    assert_equals(results[0].ids('missingAllAnno'), ['syn3'])
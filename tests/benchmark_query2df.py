@@ -0,0 +1,106 @@
+"""Benchmark of the entity-view csv ingestion used by update.query2df.
+
+Compares the previous csv.DictReader -> list -> DataFrame path with a row-wise apply index against
+update._viewCsv2df on synthetic entity-view csv files, reporting load time and peak memory.
+
+Usage:
+
+    python tests/benchmark_query2df.py [--rows 10000 100000 1000000] [--legacy-max 1000000]
+
+Peak memory is measured with tracemalloc (Python 3), which numpy and pandas report their buffers to.
+"""
+
+from __future__ import print_function
+
+import os
+import csv
+import time
+import random
+import tempfile
+import argparse
+
+import pandas
+
+from synAnnotationUtils import update
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+ANNOTATION_COLUMNS = ['assay', 'dataType', 'fileFormat', 'center', 'species', 'tissue', 'individualID',
+                      'specimenID', 'platform', 'consortium']
+
+
+def writeView(path, rows):
+    """
+    Writes a synthetic entity-view csv with the minimal Synapse columns and ten annotation columns.
+    """
+    vocab = dict((column, ['%s%d' % (column, i) for i in range(20)] + ['']) for column in ANNOTATION_COLUMNS)
+    header = ['ROW_ID', 'ROW_VERSION', 'etag', 'id', 'name'] + ANNOTATION_COLUMNS
+    rng = random.Random(0)
+
+    with open(path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            writer.writerow([i + 1, rng.randint(1, 5), '%032x' % rng.getrandbits(128), 'syn%d' % (i + 1000000),
+                             'file%d.bam' % i] + [rng.choice(vocab[column]) for column in ANNOTATION_COLUMNS])
+
+
+def legacyLoad(path):
+    """
+    The previous query2df body: csv.DictReader into a list of dicts and a row-wise apply to build the index.
+    """
+    with open(path) as f:
+        df = pandas.DataFrame(list(csv.DictReader(f)))
+    index = df.apply(lambda x: '%s_%s' % (x['ROW_ID'], x['ROW_VERSION']), axis=1)
+    df.insert(0, 'index', index)
+    df.set_index(index, inplace=True, drop=True)
+    df.drop(['index'], axis=1, inplace=True)
+    return df
+
+
+def measure(load, path):
+    if tracemalloc is not None:
+        tracemalloc.start()
+    start = time.time()
+    df = load(path)
+    elapsed = time.time() - start
+    peak = None
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return df, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entity-view csv ingestion.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--legacy-max', type=int, default=1000000,
+                        help='Largest view size the legacy path is run on [default: %(default)s]')
+    args = parser.parse_args()
+
+    print('%10s  %-10s  %10s  %12s' % ('rows', 'path', 'seconds', 'peak MiB'))
+    for rows in args.rows:
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            writeView(path, rows)
+            loaders = [('columnar', update._viewCsv2df)]
+            if rows <= args.legacy_max:
+                loaders.insert(0, ('legacy', legacyLoad))
+            indices = []
+            for name, load in loaders:
+                df, elapsed, peak = measure(load, path)
+                indices.append(list(df.index))
+                del df
+                print('%10d  %-10s  %10.2f  %12s' % (rows, name, elapsed,
+                                                      'n/a' if peak is None else '%.1f' % (peak / 2.0 ** 20)))
+            assert all(index == indices[0] for index in indices)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Microbenchmark of the file extension lookup used by updateFormatTypeByFileName and auditFormatTypeByFileName.
+
+Compares the previous scan over the extension dictionary with str.endswith against extensions.SuffixIndex.
+
+Usage:
+
+    python tests/benchmark_suffix.py [--extensions 300] [--names 1000000]
+"""
+
+from __future__ import print_function
+
+import time
+import random
+import argparse
+
+from synAnnotationUtils.extensions import SuffixIndex
+
+
+def makeExtensions(count, rng):
+    """
+    Builds count extensions, a third of them compound (i.e. ".vcf.gz") to create overlapping suffixes.
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    simple = set()
+    while len(simple) < count - count // 3:
+        simple.add('.' + ''.join(rng.choice(letters) for _ in range(rng.randint(2, 5))))
+    simple = sorted(simple)
+    compound = ['%s%s' % (rng.choice(simple), rng.choice(simple)) for _ in range(count // 3)]
+    return dict((ext, ext.lstrip('.').replace('.', '_')) for ext in simple + compound)
+
+
+def scan(annoDict, name):
+    """
+    The previous lookup: first extension in dict order the name ends with.
+    """
+    for ext in annoDict.keys():
+        if name.endswith(ext):
+            return ext, annoDict[ext]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file extension lookup.")
+    parser.add_argument('--extensions', type=int, default=300)
+    parser.add_argument('--names', type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    annoDict = makeExtensions(args.extensions, rng)
+    exts = list(annoDict) + ['.unknown']
+    names = ['file%d%s' % (i, rng.choice(exts)) for i in range(args.names)]
+
+    start = time.time()
+    suffixIndex = SuffixIndex(annoDict)
+    build = time.time() - start
+
+    start = time.time()
+    scanned = [scan(annoDict, name) for name in names]
+    scanTime = time.time() - start
+
+    start = time.time()
+    indexed = [suffixIndex.match(name) for name in names]
+    indexTime = time.time() - start
+
+    differ = sum(1 for a, b in zip(scanned, indexed) if a != b)
+    print('%d extensions, %d file names' % (len(annoDict), len(names)))
+    print('endswith scan:  %8.2f s' % scanTime)
+    print('SuffixIndex:    %8.2f s (built in %.4f s)' % (indexTime, build))
+    print('names where the first dict match was not the longest: %d' % differ)
+
+
+if __name__ == '__main__':
+    main()
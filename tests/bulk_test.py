@@ -0,0 +1,76 @@
+import threading
+import time
+from synAnnotationUtils import bulk
+from nose.tools import assert_equals
+from bulkfakes import FakeEntity, FakeSynapse
+
+
+def test_errors_are_collected():
+    """
+    A failing entity is counted and reported without stopping the others.
+    """
+    def _helper(syn, synEntity):
+        if synEntity.id == 'syn2':
+            raise ValueError("conflict")
+        return "changed" if synEntity.id != 'syn3' else None
+
+    syn = FakeSynapse()
+    summary = bulk.runBulk(syn, ['syn1', 'syn2', 'syn3', FakeEntity('syn4')], _helper, threads=2)
+    assert_equals(summary['changed'], 2)
+    assert_equals(summary['processed'], 1)
+    assert_equals(summary['failed'], 1)
+    assert_equals([(entityId, str(error)) for entityId, error in summary['errors']], [('syn2', 'conflict')])
+    assert_equals(sorted(syn.fetched), ['syn1', 'syn2', 'syn3'])
+
+
+def test_max_in_flight_bounds_pending_items():
+    """
+    No more than maxInFlight items are handed to the workers at a time, and items are read lazily.
+    """
+    lock = threading.Lock()
+    state = {'inFlight': 0, 'peak': 0, 'read': 0}
+
+    def _items():
+        for i in range(40):
+            with lock:
+                state['read'] += 1
+            yield FakeEntity('syn%d' % i)
+
+    def _helper(syn, synEntity):
+        with lock:
+            state['inFlight'] += 1
+            state['peak'] = max(state['peak'], state['inFlight'])
+        time.sleep(0.005)
+        with lock:
+            state['inFlight'] -= 1
+
+    summary = bulk.runBulk(None, _items(), _helper, threads=8, maxInFlight=3)
+    assert_equals(summary['processed'], 40)
+    assert state['peak'] <= 3, state
+
+
+def test_syn_factory_gives_one_session_per_thread():
+    """
+    With synFactory, every worker thread logs in once and uses its own session.
+    """
+    sessions = []
+    lock = threading.Lock()
+
+    def _factory():
+        syn = FakeSynapse()
+        with lock:
+            sessions.append(syn)
+        return syn
+
+    used = {}
+
+    def _helper(syn, synEntity):
+        used.setdefault(threading.current_thread().name, set()).add(id(syn))
+        time.sleep(0.001)
+
+    summary = bulk.runBulk(None, ['syn%d' % i for i in range(30)], _helper, threads=3, synFactory=_factory)
+    assert_equals(summary['processed'], 30)
+    assert len(sessions) <= 3, len(sessions)
+    assert all(len(synIds) == 1 for synIds in used.values()), used
+    assert_equals(sorted(entityId for syn in sessions for entityId in syn.fetched),
+                  sorted('syn%d' % i for i in range(30)))
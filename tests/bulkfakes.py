@@ -0,0 +1,23 @@
+"""
+Fakes shared by the tests of bulk.runBulk and its journal.
+"""
+
+
+class FakeEntity(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.annotations = {}
+
+
+class FakeSynapse(object):
+    """
+    Gets a FakeEntity for any Synapse ID and records the ids it was asked for.
+    """
+
+    def __init__(self):
+        self.fetched = []
+
+    def get(self, entityId, downloadFile=True):
+        self.fetched.append(entityId)
+        return FakeEntity(entityId)
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import pandas
+import synapseclient
+from synapseclient.utils import id_of
+from synAnnotationUtils.cache import EntityCache
+from nose.tools import assert_equals
+
+
+class FakeSynapse(object):
+    """
+    Serves Files from a dict of Synapse ID to (etag, annotations), counting the get and restGET calls.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.gets = 0
+        self.restGETs = 0
+
+    def restGET(self, uri):
+        self.restGETs += 1
+        entityId = uri.rsplit('/', 1)[-1]
+        return {'id': entityId, 'etag': self.files[entityId][0]}
+
+    def get(self, entityId, downloadFile=True):
+        self.gets += 1
+        etag, annotations = self.files[entityId]
+        return synapseclient.File(id=entityId, name='%s.bam' % entityId, parentId='syn1', etag=etag,
+                                  **dict((key, list(value)) for key, value in annotations.items()))
+
+    def store(self, entity, forceVersion=False):
+        etag = self.files[entity.id][0] + '+'
+        self.files[entity.id] = (etag, dict(entity.annotations))
+        return self.get(entity.id, downloadFile=False)
+
+    def tableQuery(self, query):
+        return FakeQueryResult(pandas.DataFrame({'id': sorted(self.files),
+                                                 'etag': [self.files[i][0] for i in sorted(self.files)]}))
+
+    def setAnnotations(self, entity, annotations):
+        entityId = id_of(entity)
+        etag = self.files[entityId][0] + '+'
+        annotations = dict((key, value) for key, value in annotations.items() if key not in ('id', 'etag'))
+        self.files[entityId] = (etag, annotations)
+        return dict(annotations, id=entityId, etag=etag)
+
+
+class FakeQueryResult(object):
+
+    def __init__(self, df):
+        self.df = df
+
+    def asDataFrame(self):
+        return self.df
+
+
+def _files(n):
+    return dict(('syn%d' % i, ('etag%d' % i, {'dataType': ['testing']})) for i in range(10, 10 + n))
+
+
+def test_cached_get_across_runs():
+    """
+    A second run against the same cache file only gets the entities whose etag changed.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'entities.db')
+        fake = FakeSynapse(_files(5))
+        cache = EntityCache(path)
+        syn = cache.wrap(fake)
+        for entityId in sorted(fake.files):
+            syn.get(entityId, downloadFile=False)
+        assert_equals(fake.gets, 5)
+        assert_equals(len(cache), 5)
+        cache.close()
+
+        fake.files['syn10'] = ('changed', {'dataType': ['other']})
+        cache = EntityCache(path)
+        syn = cache.wrap(fake)
+        entities = [syn.get(entityId, downloadFile=False) for entityId in sorted(fake.files)]
+        assert_equals(fake.gets, 6)
+        assert_equals(cache.hits, 4)
+        assert_equals(entities[0].annotations['dataType'], ['other'])
+        assert_equals(entities[1].annotations['dataType'], ['testing'])
+        assert_equals(entities[1].etag, 'etag11')
+        cache.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_own_writes_and_primed_etags():
+    """
+    Writes made through the cache refresh or invalidate it, and primed etags avoid the etag lookups.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fake = FakeSynapse(_files(2))
+        cache = EntityCache(os.path.join(tmpdir, 'entities.db'))
+        syn = cache.wrap(fake)
+
+        entity = syn.get('syn10', downloadFile=False)
+        entity.annotations['center'] = ['TCGA']
+        syn.store(entity)
+        assert_equals(syn.get('syn10', downloadFile=False).annotations['center'], ['TCGA'])
+        assert_equals(fake.gets, 2)
+
+        syn.setAnnotations('syn10', {'dataType': ['x']})
+        assert_equals(syn.get('syn10', downloadFile=False).annotations['dataType'], ['x'])
+        assert_equals(fake.gets, 3)
+
+        syn.get('syn11', downloadFile=False)
+        fake.restGET = None
+        syn.setEtags({'syn11': 'etag11'})
+        assert_equals(syn.get('syn11', downloadFile=False).etag, 'etag11')
+        assert_equals(fake.gets, 4)
+        cache.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_lru_eviction():
+    """
+    The least recently used entities are evicted first once the cache is over its size.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fake = FakeSynapse(_files(10))
+        cache = EntityCache(os.path.join(tmpdir, 'entities.db'))
+        syn = cache.wrap(fake)
+        syn.get('syn10', downloadFile=False)
+        cache.maxBytes = cache.size * 4
+
+        for entityId in ['syn11', 'syn12', 'syn13']:
+            syn.get(entityId, downloadFile=False)
+        syn.get('syn10', downloadFile=False)
+        syn.get('syn14', downloadFile=False)
+
+        assert_equals(len(cache), 4)
+        assert cache.size <= cache.maxBytes
+        assert_equals(cache.get('syn11', 'etag11'), None)
+        assert cache.get('syn10', 'etag10') is not None
+        cache.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_annotation_updates_across_runs():
+    """
+    With etags primed from a view, rerunning get, getAnnotations and setAnnotations on the same entities only
+    writes: the entities and their annotations come from the cache, refreshed by the previous setAnnotations.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'entities.db')
+        fake = FakeSynapse(_files(2))
+        for center in ['TCGA', 'labA']:
+            cache = EntityCache(path)
+            syn = cache.wrap(fake)
+            syn.primeEtags('syn99')
+            for entityId in sorted(fake.files):
+                entity = syn.get(entityId, downloadFile=False)
+                annotations = syn.getAnnotations(entity)
+                annotations['center'] = [center]
+                syn.setAnnotations(entity, annotations)
+            cache.close()
+        assert_equals(fake.gets, 2)
+        assert_equals(fake.restGETs, 0)
+        assert_equals(cache.hits, 4)
+        assert_equals(fake.files['syn10'], ('etag10++', {'dataType': ['testing'], 'center': ['labA']}))
+
+        cache = EntityCache(path)
+        entity = cache.get('syn10', 'etag10++')
+        assert_equals(entity.annotations['center'], ['labA'])
+        assert_equals(entity.name, 'syn10.bam')
+        cache.close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,14 @@
+from synAnnotationUtils import changes
+from nose.tools import assert_equals
+
+
+def test_diff_annotations():
+    """
+    Scalar requested values match the list values Synapse returns, only real differences are reported.
+    """
+    current = {"dataType": ["bam"], "center": ["labA"], "count": [3]}
+
+    assert_equals(changes.diffAnnotations(current, {"dataType": "bam", "count": 3}), {})
+    assert_equals(changes.diffAnnotations(current, {"center": "labB"}), {"center": "labB"})
+    assert_equals(changes.diffAnnotations(current, {"count": "3"}), {"count": "3"})
+    assert_equals(changes.diffAnnotations(current, {"assay": ["rnaSeq"]}), {"assay": ["rnaSeq"]})
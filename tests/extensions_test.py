@@ -0,0 +1,17 @@
+from synAnnotationUtils.extensions import SuffixIndex
+from nose.tools import assert_equals
+
+
+def test_suffix_index_longest_match():
+    """
+    The longest extension wins for overlapping suffixes, whatever the order of the dictionary.
+    """
+    suffixIndex = SuffixIndex({".gz": "gzip", ".vcf.gz": "vcf", ".bam": "bam", "bw": "bigwig"})
+
+    assert_equals(len(suffixIndex), 4)
+    assert_equals(suffixIndex.match("calls.vcf.gz"), (".vcf.gz", "vcf"))
+    assert_equals(suffixIndex.match("reads.fastq.gz"), (".gz", "gzip"))
+    assert_equals(suffixIndex.match("sample.bam"), (".bam", "bam"))
+    assert_equals(suffixIndex.match("signal.bw"), ("bw", "bigwig"))
+    assert_equals(suffixIndex.match("notes.txt"), None)
+    assert_equals(suffixIndex.match("gz"), None)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import pandas
+from synAnnotationUtils import audit
+from synAnnotationUtils.incremental import AuditState, iterAuditAgainstMetadataIncremental
+from nose.tools import assert_equals
+
+
+class FakeFile(object):
+    """
+    Reads like a synapseclient File: properties and annotations by key, with the concreteType is_container checks.
+    """
+
+    concreteType = 'org.sagebionetworks.repo.model.FileEntity'
+
+    def __init__(self, id, name, etag, annotations):
+        self.id = id
+        self.name = name
+        self.etag = etag
+        self.annotations = annotations
+
+    def __contains__(self, key):
+        return key in self.annotations or key == 'concreteType'
+
+    def __getitem__(self, key):
+        if key == 'concreteType':
+            return self.concreteType
+        return self.annotations[key]
+
+
+def _audit(files, metaDf, statePath):
+    records = list(iterAuditAgainstMetadataIncremental(None, files, metaDf, 'id', ['tester'], ['.bam'], statePath))
+    return dict((record.id, (record.status, record.missing, record.entity is not None)) for record in records)
+
+
+def test_only_changed_entities_are_audited():
+    """
+    A second run carries verdicts of unchanged entities forward and audits again the ones whose etag or metadata
+    row changed.
+    """
+    tmpDir = tempfile.mkdtemp()
+    try:
+        statePath = os.path.join(tmpDir, 'audit.db')
+        files = [FakeFile('syn1', 's1.bam', 'e1', {'tester': ['a']}),
+                 FakeFile('syn2', 's2.bam', 'e2', {'other': ['x']}),
+                 FakeFile('syn3', 's3.bam', 'e3', {'tester': ['c']}),
+                 FakeFile('syn4', 's4.bam', 'e4', {'tester': ['d']})]
+        metaDf = pandas.DataFrame({'id': ['s1', 's2', 's3'], 'tester': ['a', 'b', 'c']})
+
+        assert_equals(_audit(files, metaDf, statePath),
+                      {'syn1': ('pass', (), True), 'syn2': ('fail', ('tester',), True),
+                       'syn3': ('pass', (), True), 'syn4': ('missingMetadata', (), True)})
+
+        files[1] = FakeFile('syn2', 's2.bam', 'e2b', {'tester': ['b']})
+        metaDf = pandas.DataFrame({'id': ['s1', 's2', 's3'], 'tester': ['a', 'b', 'z']})
+        assert_equals(_audit(files[:3], metaDf, statePath),
+                      {'syn1': ('pass', (), False), 'syn2': ('pass', (), True), 'syn3': ('fail', (), True)})
+
+        state = AuditState(statePath, '')
+        assert_equals(len(state), 4)
+        etag, rowHash, record = state.get('syn2')
+        assert_equals((etag, record.status), ('e2b', 'pass'))
+        state.close()
+
+        result = audit.CompactAuditResult.fromRecords(
+            iterAuditAgainstMetadataIncremental(None, files[:3], metaDf, 'id', ['tester'], ['.bam'], statePath))
+        assert_equals(result.audited, 3)
+
+    finally:
+        shutil.rmtree(tmpDir)
+
+
+class FakeSynapse(object):
+
+    def __init__(self, files):
+        self.files = dict((synEntity.id, synEntity) for synEntity in files)
+
+    def get(self, entityId, downloadFile=True):
+        return self.files[entityId]
+
+
+def test_roots_share_a_state_file():
+    """
+    Auditing another root with the same state file leaves the saved audits of the first root alone.
+    """
+    tmpDir = tempfile.mkdtemp()
+    try:
+        statePath = os.path.join(tmpDir, 'audit.db')
+        files = [FakeFile('syn1', 's1.bam', 'e1', {'tester': ['a']}),
+                 FakeFile('syn2', 's2.bam', 'e2', {'tester': ['b']})]
+        metaDf = pandas.DataFrame({'id': ['s1', 's2'], 'tester': ['a', 'b']})
+        syn = FakeSynapse(files)
+
+        for synId in ['syn1', 'syn2', 'syn1']:
+            records = list(iterAuditAgainstMetadataIncremental(syn, synId, metaDf, 'id', ['tester'], ['.bam'],
+                                                               statePath))
+            assert_equals([record.status for record in records], ['pass'])
+
+        for root in ['syn1', 'syn2']:
+            state = AuditState(statePath, root)
+            assert_equals(len(state), 1)
+            state.close()
+    finally:
+        shutil.rmtree(tmpDir)
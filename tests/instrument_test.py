@@ -0,0 +1,90 @@
+import time
+from synAnnotationUtils.instrument import instrument, instrumented
+from nose.tools import assert_equals
+
+
+class FakeRequest(object):
+
+    def __init__(self, body):
+        self.body = body
+
+
+class FakeResponse(object):
+
+    def __init__(self, sent, received):
+        self.request = FakeRequest(b'x' * sent)
+        self.headers = {'Content-Length': str(received)}
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.hooks = {'response': []}
+
+    def send(self, sent, received):
+        for hook in self.hooks['response']:
+            hook(FakeResponse(sent, received))
+
+
+class FakeSynapse(object):
+    """
+    Stands in for the Synapse methods, sending fake HTTP responses through its requests session.
+    """
+
+    def __init__(self):
+        self._requests_session = FakeSession()
+        self.username = "tester"
+
+    def get(self, entityId, downloadFile=True):
+        time.sleep(0.02)
+        self._requests_session.send(0, 1000)
+        return entityId
+
+    def getChildren(self, parent):
+        for i in range(3):
+            time.sleep(0.01)
+            self._requests_session.send(10, 100)
+            yield {'id': 'syn%d' % i}
+
+    def store(self, obj):
+        raise ValueError("conflict")
+
+
+def test_counts_latency_bytes_and_errors():
+    """
+    Calls, errors, bytes and latencies are recorded per method, generators are timed until exhausted.
+    """
+    syn = instrument(FakeSynapse())
+    syn.get("syn1")
+    syn.get("syn2")
+    assert_equals([child['id'] for child in syn.getChildren("syn3")], ['syn0', 'syn1', 'syn2'])
+    try:
+        syn.store("syn1")
+    except ValueError:
+        pass
+    assert_equals(syn.username, "tester")
+
+    summary = syn.summary()
+    assert_equals(summary['get']['calls'], 2)
+    assert_equals(summary['get']['bytesReceived'], 2000)
+    assert summary['get']['p50'] >= 0.02, summary['get']
+    assert_equals(sum(summary['get']['histogram'].values()), 2)
+    assert_equals(summary['getChildren']['calls'], 1)
+    assert summary['getChildren']['seconds'] >= 0.03, summary['getChildren']
+    assert_equals(summary['getChildren']['bytesSent'], 30)
+    assert_equals(summary['store']['errors'], 1)
+    assert 'getChildren' in syn.report()
+
+
+def test_disabled_returns_syn():
+    """
+    Disabled instrumentation hands back syn itself and installs no hook.
+    """
+    fake = FakeSynapse()
+    assert instrument(fake, enabled=False) is fake
+
+    reports = []
+    with instrumented(fake, log=reports.append) as syn:
+        syn.get("syn1")
+    assert_equals(len(reports), 1)
+    assert_equals(fake._requests_session.hooks['response'], [])
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+from synAnnotationUtils import bulk
+from synAnnotationUtils.journal import Journal
+from nose.tools import assert_equals
+from bulkfakes import FakeSynapse
+
+
+def _crashAt(crashed):
+    def _helper(syn, synEntity):
+        if synEntity.id in crashed:
+            raise RuntimeError("crash")
+        return "changed"
+    return _helper
+
+
+def test_resume_skips_journaled_entities():
+    """
+    A rerun with the same journal only fetches the entities that were not processed successfully.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'update.journal')
+        ids = ['syn%d' % i for i in range(20)]
+
+        syn = FakeSynapse()
+        summary = bulk.runBulk(syn, ids, _crashAt({'syn3', 'syn17'}), threads=4, journal=path)
+        assert_equals(summary['changed'], 18)
+        assert_equals(summary['failed'], 2)
+
+        syn = FakeSynapse()
+        summary = bulk.runBulk(syn, ids, _crashAt(set()), journal=path)
+        assert_equals(summary, {'changed': 2, 'skipped': 18, 'errors': []})
+        assert_equals(sorted(syn.fetched), ['syn17', 'syn3'])
+
+        assert_equals(len(Journal(path)), 20)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_torn_line_and_batched_sync():
+    """
+    A line cut by a crash is not taken as processed, and records are readable after sync.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'update.journal')
+        with open(path, 'w') as f:
+            f.write('syn1\tchanged\nsyn2\tchan')
+
+        journal = Journal(path, syncEvery=100, syncInterval=3600)
+        assert 'syn1' in journal
+        assert 'syn2' not in journal
+        journal.record('syn3', 'unchanged')
+        journal.sync()
+        assert 'syn3' in Journal(path)
+        journal.close()
+        with open(path) as f:
+            assert_equals(f.read(), 'syn1\tchanged\nsyn3\tunchanged\n')
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,20 @@
+import pandas
+from synAnnotationUtils.metadata import MetadataIndex
+from nose.tools import assert_equals
+
+
+def test_metadata_index():
+    """
+    Entity names are matched without their extensions and duplicated reference values are reported.
+    """
+    metaDf = pandas.DataFrame({"id": ["s1", "s2", "s2", 4],
+                               "dataType": ["rnaSeq", "wgs", "wes", "chipSeq"],
+                               "count": [1, 2, 3, 4]})
+    metaIndex = MetadataIndex(metaDf, "id", ["dataType", "count"], [".bam", ".bai"])
+
+    assert_equals(len(metaIndex), 3)
+    assert_equals(metaIndex.duplicates, ["s2"])
+    assert_equals(metaIndex.lookup("s1.bam"), {"dataType": "rnaSeq", "count": "1"})
+    assert_equals(metaIndex.lookup("s2.bai"), {"dataType": "wgs", "count": "2"})
+    assert_equals(metaIndex.lookup("4.bam"), {"dataType": "chipSeq", "count": "4"})
+    assert_equals(metaIndex.lookup("s3.bam"), None)
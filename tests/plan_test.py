@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+from synAnnotationUtils import plan
+from nose.tools import assert_equals
+
+
+class FakeEntity(object):
+
+    def __init__(self, id, etag, annotations):
+        self.id = id
+        self.etag = etag
+        self.annotations = annotations
+
+
+class FakeSynapse(object):
+    """
+    Keeps annotations in a dict of Synapse ID to annotations, with the etag, like getAnnotations returns them.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.writes = 0
+
+    def entities(self):
+        return [FakeEntity(entityId, annotations['etag'],
+                           dict((k, v) for k, v in annotations.items() if k not in ('id', 'etag')))
+                for entityId, annotations in sorted(self.files.items())]
+
+    def getAnnotations(self, entityId):
+        return dict(self.files[entityId])
+
+    def setAnnotations(self, entityId, annotations):
+        if annotations['etag'] != self.files[entityId]['etag']:
+            raise ValueError("conflict")
+        self.writes += 1
+        annotations = dict(annotations, etag=annotations['etag'] + '+')
+        self.files[entityId] = annotations
+        return annotations
+
+
+def _fake():
+    return FakeSynapse({'syn1': {'id': 'syn1', 'etag': 'a', 'dataType': ['bam'], 'tester': ['x']},
+                        'syn2': {'id': 'syn2', 'etag': 'b', 'dataType': ['csv']},
+                        'syn3': {'id': 'syn3', 'etag': 'c', 'dataType': ['bam'], 'assay': ['rnaSeq']}})
+
+
+def test_plan_apply_reapply():
+    """
+    A plan lists only the changes, survives a round trip to a gzip file and can be applied twice.
+    """
+    syn = _fake()
+    changes = plan.planAnnoByDict(syn, syn.entities(), {'dataType': 'bam', 'center': 'TCGA'})
+    assert_equals(list(changes.columns), plan.PLAN_COLUMNS)
+    assert_equals(sorted(zip(changes['id'], changes['key'].astype(str), changes['old'], changes['new'])),
+                  [('syn1', 'center', '', '["TCGA"]'),
+                   ('syn2', 'center', '', '["TCGA"]'),
+                   ('syn2', 'dataType', '["csv"]', '["bam"]'),
+                   ('syn3', 'center', '', '["TCGA"]')])
+    assert_equals(syn.writes, 0)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'changes.plan.csv.gz')
+        plan.writePlan(changes, path)
+        summary = plan.applyPlan(syn, path, threads=2)
+        assert_equals(summary, {'changed': 3, 'errors': []})
+        assert_equals(syn.files['syn2']['dataType'], ['bam'])
+        assert_equals(syn.files['syn2']['center'], ['TCGA'])
+
+        summary = plan.applyPlan(syn, path)
+        assert_equals(summary, {'unchanged': 3, 'errors': []})
+        assert_equals(syn.writes, 3)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_conflicts_and_deletes():
+    """
+    Entities changed after planning are not overwritten, and removed keys are planned with an empty new value.
+    """
+    syn = _fake()
+    changes = plan.planDelAnnoByKey(syn, syn.entities(), ['tester', 'assay'])
+    assert_equals(sorted(zip(changes['id'], changes['new'])), [('syn1', ''), ('syn3', '')])
+
+    syn.files['syn3'] = dict(syn.files['syn3'], etag='changed', assay=['wgs'])
+    summary = plan.applyPlan(syn, changes)
+    assert_equals(summary['changed'], 1)
+    assert_equals(summary['failed'], 1)
+    assert_equals([entityId for entityId, error in summary['errors']], ['syn3'])
+    assert 'tester' not in syn.files['syn1']
+    assert_equals(syn.files['syn3']['assay'], ['wgs'])
+
+
+def test_plan_corrections():
+    """
+    Key renames and value replacements of a corrections file are planned in one pass.
+    """
+    syn = _fake()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'corrections.txt')
+        with open(path, 'w') as f:
+            f.write('tester\ttesterName\n')
+            f.write('dataType\tbam\tBAM\n')
+        changes = plan.planCorrectAnnot(syn, syn.entities(), path)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    assert_equals(sorted(zip(changes['id'], changes['key'].astype(str), changes['new'])),
+                  [('syn1', 'dataType', '["BAM"]'), ('syn1', 'tester', ''), ('syn1', 'testerName', '["x"]'),
+                   ('syn3', 'dataType', '["BAM"]')])
+    plan.applyPlan(syn, changes)
+    assert_equals(syn.files['syn1']['testerName'], ['x'])
+    assert_equals(syn.files['syn3']['dataType'], ['BAM'])
+
+
+def test_rewrite_table():
+    """
+    The compiled rewrite table gives the same result as applying every correction in order.
+    """
+    corrections = [('tester', 'testerName'), ('dataType', 'bam', ['BAM']), ('testerName', 'x', ['y', 'z']),
+                   ('assay', 'format'), ('format', 'rnaSeq', ['RNA-seq']), ('dataType', 'BAM', ['aligned'])]
+    table = plan.RewriteTable(corrections)
+    for annotations in [{'tester': ['x'], 'dataType': ['bam']}, {'assay': ['rnaSeq'], 'format': ['wgs']},
+                        {'testerName': ['w'], 'dataType': ['csv']}, {'other': ['a']}]:
+        assert_equals(table.apply(annotations), plan.correctAnnotations(annotations, corrections))
+    assert_equals(table.apply({'tester': ['x'], 'dataType': ['bam']}), {'testerName': ['y', 'z'],
+                                                                      'dataType': ['aligned']})
+    unchanged = {'other': ['a']}
+    assert table.apply(unchanged) is unchanged
@@ -0,0 +1,113 @@
+import time
+import threading
+from multiprocessing.dummy import Pool
+from synAnnotationUtils.scheduler import RequestScheduler
+from nose.tools import assert_equals
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeHTTPError(Exception):
+
+    def __init__(self, status_code, headers=None):
+        Exception.__init__(self, "HTTP %d" % status_code)
+        self.response = FakeResponse(status_code, headers)
+
+
+class FakeSynapse(object):
+    """
+    Answers get calls, throttling the first ones and recording the peak number of calls in flight.
+    """
+
+    def __init__(self, throttle=0, status=429):
+        self.throttle = throttle
+        self.status = status
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.peak = 0
+        self.username = "tester"
+
+    def get(self, entityId, downloadFile=True):
+        with self.lock:
+            self.inFlight += 1
+            self.peak = max(self.peak, self.inFlight)
+            throttled = self.throttle > 0
+            self.throttle -= 1
+        try:
+            time.sleep(0.01)
+            if throttled:
+                raise FakeHTTPError(self.status)
+            return entityId
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+
+
+def test_retry_throttled_calls():
+    """
+    Throttled calls are retried and lower the concurrency limit, other attributes are passed through.
+    """
+    scheduler = RequestScheduler(concurrency=8, baseDelay=0.01)
+    syn = scheduler.wrap(FakeSynapse(throttle=3, status=503))
+
+    assert_equals(syn.get("syn1", downloadFile=False), "syn1")
+    assert_equals(syn.username, "tester")
+
+    stats = scheduler.stats()
+    assert_equals(stats['calls'], 4)
+    assert_equals(stats['retries'], 3)
+    assert_equals(stats['throttled'], 3)
+    assert_equals(stats['errors'], 0)
+    assert stats['concurrency'] < 8, stats
+
+
+def test_give_up_and_other_errors():
+    """
+    A call still throttled after maxRetries raises, as do errors that are not throttling.
+    """
+    scheduler = RequestScheduler(maxRetries=2, baseDelay=0.01)
+    syn = scheduler.wrap(FakeSynapse(throttle=5))
+    try:
+        syn.get("syn1")
+        raise AssertionError("expected a FakeHTTPError")
+    except FakeHTTPError as e:
+        assert_equals(e.response.status_code, 429)
+
+    syn = scheduler.wrap(FakeSynapse(throttle=1, status=404))
+    try:
+        syn.get("syn1")
+        raise AssertionError("expected a FakeHTTPError")
+    except FakeHTTPError as e:
+        assert_equals(e.response.status_code, 404)
+
+    stats = scheduler.stats()
+    assert_equals(stats['retries'], 2)
+    assert_equals(stats['errors'], 2)
+
+
+def test_concurrency_and_rate_limits():
+    """
+    Sixteen threads never have more than the concurrency limit in flight, and a rate of 200 calls per second
+    paces 40 calls over about 0.2 seconds.
+    """
+    fake = FakeSynapse()
+    scheduler = RequestScheduler(rate=200, burst=1, concurrency=3)
+    syn = scheduler.wrap(fake)
+
+    start = time.time()
+    pool = Pool(16)
+    try:
+        results = pool.map(syn.get, ["syn%d" % i for i in range(40)])
+    finally:
+        pool.close()
+        pool.join()
+
+    assert_equals(results, ["syn%d" % i for i in range(40)])
+    assert fake.peak <= 3, fake.peak
+    assert time.time() - start >= 0.19
+    assert_equals(scheduler.stats()['calls'], 40)
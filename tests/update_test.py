@@ -1,4 +1,7 @@
 import os
+import re
+import shutil
+import tempfile
 import pandas
 import synapseclient
 import synAnnotationUtils
@@ -45,3 +48,238 @@ def test_update_entityview():
 
     # delete created file
     os.remove("changed_view_test.csv")
+
+
+class FakeQueryResult(object):
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+
+class FakeSynapse(object):
+    """
+    Serves an entity-view from a csv file and records the uploaded tables and the ROW_IDs of each of them, failing
+    the upload number failAt.
+    """
+
+    def __init__(self, viewPath, failAt=None):
+        self.viewPath = viewPath
+        self.failAt = failAt
+        self.queries = []
+        self.stored = []
+        self.tables = []
+
+    def tableQuery(self, query):
+        self.queries.append(query)
+        return FakeQueryResult(self.viewPath)
+
+    def store(self, table):
+        if len(self.stored) == self.failAt:
+            self.failAt = None
+            raise RuntimeError("upload failed")
+        self.stored.append([int(index.split('_')[0]) for index in table.df.index])
+        self.tables.append(table)
+        return table
+
+
+class FakeTable(object):
+    """
+    Stands in for synapseclient.Table, which writes the data frame to a temporary csv file.
+    """
+
+    def __init__(self, schema, df):
+        self.schema = schema
+        self.df = df
+
+
+def test_checkpoint_resumes_uncommitted_batches():
+    """
+    After a batch fails, a rerun with the same checkpoint does not download the view again and uploads only the
+    batches that were not committed.
+    """
+    tmpdir = tempfile.mkdtemp()
+    Table = update.synapseclient.Table
+    update.synapseclient.Table = FakeTable
+    try:
+        viewPath = os.path.join(tmpdir, 'view.csv')
+        userPath = os.path.join(tmpdir, 'user.csv')
+        checkpoint = os.path.join(tmpdir, 'update.checkpoint')
+        rows = dict(ROW_ID=list(range(1, 8)), ROW_VERSION=[1] * 7, etag=['e%d' % i for i in range(1, 8)])
+        pandas.DataFrame(dict(rows, center=['labA'] * 7)).to_csv(viewPath, index=False)
+        pandas.DataFrame(dict(rows, center=['TCGA'] * 7)).to_csv(userPath, index=False)
+
+        syn = FakeSynapse(viewPath, failAt=2)
+        try:
+            update.updateEntityView(syn, 'syn123', userPath, batchRows=2, checkpoint=checkpoint)
+            raise AssertionError("the upload should have failed")
+        except RuntimeError:
+            pass
+        assert_equals(syn.stored, [[1, 2], [3, 4]])
+        assert os.path.exists(checkpoint)
+
+        syn = FakeSynapse(viewPath)
+        update.updateEntityView(syn, 'syn123', userPath, batchRows=2, checkpoint=checkpoint)
+        assert_equals(syn.queries, [])
+        assert_equals(syn.stored, [[5, 6], [7]])
+        assert not os.path.exists(checkpoint)
+    finally:
+        update.synapseclient.Table = Table
+        shutil.rmtree(tmpdir)
+
+
+def test_delta_only_uploads_changed_rows():
+    """
+    With deltaOnly, empty user cells and numbers read back as floats do not count as changes, and only the changed
+    rows are uploaded with their ROW_ID, ROW_VERSION and etag.
+    """
+    tmpdir = tempfile.mkdtemp()
+    Table = update.synapseclient.Table
+    update.synapseclient.Table = FakeTable
+    try:
+        viewPath = os.path.join(tmpdir, 'view.csv')
+        userPath = os.path.join(tmpdir, 'user.csv')
+        rows = dict(ROW_ID=[1, 2, 3, 4], ROW_VERSION=[1] * 4, etag=['e1', 'e2', 'e3', 'e4'])
+        pandas.DataFrame(dict(rows, center=['labA'] * 4, readLength=[100, 100, 150, 150],
+                              score=[0.5, 1.5, 2.5, 3.5])).to_csv(viewPath, index=False)
+        pandas.DataFrame(dict(rows, center=['labA', 'TCGA', None, 'labA'], readLength=[100, 100, None, 150],
+                              score=[0.5, 1.5, 2.5, 3.5])).to_csv(userPath, index=False)
+
+        syn = FakeSynapse(viewPath)
+        summary = update.updateEntityView(syn, 'syn123', userPath, deltaOnly=True)
+        assert_equals(summary, {'rows': 1, 'cells': 1, 'columns': ['center']})
+        assert_equals(len(syn.tables), 1)
+        uploaded = syn.tables[0].df
+        assert_equals(list(uploaded.index), ['2_1'])
+        assert_equals(uploaded.at['2_1', 'etag'], 'e2')
+        assert_equals(uploaded.at['2_1', 'center'], 'TCGA')
+
+        syn = FakeSynapse(viewPath)
+        summary = update.updateEntityView(syn, 'syn123', viewPath, deltaOnly=True)
+        assert_equals(summary, {'rows': 0, 'cells': 0, 'columns': []})
+        assert_equals(syn.tables, [])
+    finally:
+        update.synapseclient.Table = Table
+        shutil.rmtree(tmpdir)
+
+
+def test_chunked_update_skips_chunks_without_user_rows():
+    """
+    query2dfChunks yields the view chunksize rows at a time, indexed like query2df, and updateEntityView with a
+    chunksize uploads only the chunks holding user rows and sums their summaries.
+    """
+    tmpdir = tempfile.mkdtemp()
+    Table = update.synapseclient.Table
+    update.synapseclient.Table = FakeTable
+    try:
+        viewPath = os.path.join(tmpdir, 'view.csv')
+        userPath = os.path.join(tmpdir, 'user.csv')
+        rows = dict(ROW_ID=[1, 2, 3, 4, 5], ROW_VERSION=[1, 1, 1, 1, 2], etag=['e1', 'e2', 'e3', 'e4', 'e5'])
+        pandas.DataFrame(dict(rows, center=['labA'] * 5, assay=['rnaSeq'] * 5)).to_csv(viewPath, index=False)
+        user = dict(ROW_ID=[1, 2, 5], ROW_VERSION=[1, 1, 2], etag=['e1', 'e2', 'e5'])
+        pandas.DataFrame(dict(user, center=['TCGA', 'labA', 'TCGA'],
+                              assay=['rnaSeq', 'rnaSeq', 'wgs'])).to_csv(userPath, index=False)
+
+        syn = FakeSynapse(viewPath)
+        chunks = list(update.query2dfChunks(syn, 'syn123', None, chunksize=2))
+        assert_equals([list(chunk.index) for chunk in chunks], [['1_1', '2_1'], ['3_1', '4_1'], ['5_2']])
+        assert_equals([list(chunk['ROW_ID']) for chunk in chunks], [[1, 2], [3, 4], [5]])
+        assert_equals(list(chunks[2].columns), list(update.query2df(syn, 'syn123', None).columns))
+
+        syn = FakeSynapse(viewPath)
+        summary = update.updateEntityView(syn, 'syn123', userPath, deltaOnly=True, chunksize=2)
+        assert_equals(summary, {'rows': 2, 'cells': 3, 'columns': ['center', 'assay']})
+        assert_equals(syn.stored, [[1], [5]])
+        assert_equals(syn.tables[1].df.at['5_2', 'assay'], 'wgs')
+
+        syn = FakeSynapse(viewPath)
+        update.updateEntityView(syn, 'syn123', userPath, chunksize=2)
+        assert_equals(syn.stored, [[1, 2], [5]])
+    finally:
+        update.synapseclient.Table = Table
+        shutil.rmtree(tmpdir)
+
+
+class FakeColumn(object):
+
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+
+class FakePushdownSynapse(FakeSynapse):
+    """
+    Answers 'select "a", "b" from ... where ROW_ID IN (...)' queries with the row metadata columns and the selected
+    columns of the listed rows, and records the uploaded PartialRowsets.
+    """
+
+    def __init__(self, viewPath, tmpdir):
+        super(FakePushdownSynapse, self).__init__(viewPath)
+        self.tmpdir = tmpdir
+
+    def tableQuery(self, query):
+        self.queries.append(query)
+        view = pandas.read_csv(self.viewPath)
+        rowIds = [int(rowId) for rowId in re.search(r'ROW_ID IN \(([^)]*)\)', query).group(1).split(', ')]
+        columns = ['ROW_ID', 'ROW_VERSION', 'ROW_ETAG'] + re.findall(r'"([^"]+)"', query)
+        path = os.path.join(self.tmpdir, 'query%d.csv' % len(self.queries))
+        view.loc[view['ROW_ID'].isin(rowIds), columns].to_csv(path, index=False)
+        return FakeQueryResult(path)
+
+    def getColumns(self, schema_id):
+        return [FakeColumn(name, 'col_' + name) for name in ['center', 'assay', 'etag']]
+
+    def store(self, rowset):
+        self.tables.append(rowset)
+        return rowset
+
+
+def test_rowid_clauses():
+    """
+    ROW_IDs are deduplicated, sorted and split in batches, each restricting the user's where clause.
+    """
+    clauses = list(update._rowIdClauses([3, 1, 2, 3], "where assay = 'rnaSeq'", batchSize=2))
+    assert_equals(clauses, ["where ROW_ID IN (1, 2) AND (assay = 'rnaSeq')",
+                            "where ROW_ID IN (3) AND (assay = 'rnaSeq')"])
+    assert_equals(list(update._rowIdClauses(['2', '1'])), ['where ROW_ID IN (1, 2)'])
+    try:
+        list(update._rowIdClauses([1], 'limit 10'))
+        raise AssertionError("a clause that is not a 'where' clause should be refused")
+    except ValueError:
+        pass
+
+
+def test_pushdown_uploads_partial_rows():
+    """
+    With pushdown, only the user's columns and ROW_IDs are queried, ROW_ID_BATCH at a time, and the changed cells
+    are uploaded as partial rows without the row metadata columns.
+    """
+    tmpdir = tempfile.mkdtemp()
+    batch = update.ROW_ID_BATCH
+    update.ROW_ID_BATCH = 2
+    try:
+        viewPath = os.path.join(tmpdir, 'view.csv')
+        userPath = os.path.join(tmpdir, 'user.csv')
+        rows = dict(ROW_ID=[1, 2, 3, 4], ROW_VERSION=[1] * 4, ROW_ETAG=['r1', 'r2', 'r3', 'r4'],
+                    etag=['e1', 'e2', 'e3', 'e4'])
+        pandas.DataFrame(dict(rows, center=['labA'] * 4, assay=['rnaSeq'] * 4)).to_csv(viewPath, index=False)
+        user = pandas.DataFrame(rows).iloc[[0, 1, 3]]
+        user['center'] = ['TCGA', 'labA', 'TCGA']
+        user.to_csv(userPath, index=False)
+
+        syn = FakePushdownSynapse(viewPath, tmpdir)
+        summary = update.updateEntityView(syn, 'syn123', userPath, clause="where assay = 'rnaSeq'", deltaOnly=True,
+                                          pushdown=True)
+        assert_equals(summary, {'rows': 2, 'cells': 2, 'columns': ['center']})
+        assert_equals(syn.queries,
+                      ['select "center", "etag" from syn123 where ROW_ID IN (1, 2) AND (assay = \'rnaSeq\')',
+                       'select "center", "etag" from syn123 where ROW_ID IN (4) AND (assay = \'rnaSeq\')'])
+
+        assert_equals(len(syn.tables), 1)
+        rowset = syn.tables[0]
+        assert_equals(rowset.tableId, 'syn123')
+        assert_equals([(row.rowId, row.etag, row.values) for row in rowset.rows],
+                      [(1, 'e1', [{'key': 'col_center', 'value': 'TCGA'}]),
+                       (4, 'e4', [{'key': 'col_center', 'value': 'TCGA'}])])
+    finally:
+        update.ROW_ID_BATCH = batch
+        shutil.rmtree(tmpdir)
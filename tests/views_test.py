@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import synapseclient
+from synAnnotationUtils import bulk, views
+from nose.tools import assert_equals
+
+
+class FakeHeader(object):
+
+    def __init__(self, name, columnType):
+        self.name = name
+        self.columnType = columnType
+
+
+class FakeQueryResult(object):
+
+    def __init__(self, headers, filepath):
+        self.headers = headers
+        self.filepath = filepath
+
+
+class FakeSynapse(object):
+    """
+    Answers every view query with the same csv file and records the views created and deleted.
+    """
+
+    def __init__(self, entities, filepath):
+        self.entities = entities
+        self.filepath = filepath
+        self.queries = []
+        self.stored = []
+        self.deleted = []
+
+    def get(self, entityId, downloadFile=True):
+        return self.entities[entityId]
+
+    def restGET(self, uri):
+        assert_equals(uri, '/entity/syn2/path')
+        return {'path': [{'id': 'syn4489', 'type': 'org.sagebionetworks.repo.model.Folder'},
+                         {'id': 'syn1', 'type': 'org.sagebionetworks.repo.model.Project'},
+                         {'id': 'syn2', 'type': 'org.sagebionetworks.repo.model.Folder'}]}
+
+    def store(self, view):
+        view.id = 'syn99'
+        self.stored.append(view)
+        return view
+
+    def delete(self, view):
+        self.deleted.append(view.id)
+
+    def tableQuery(self, query):
+        self.queries.append(query)
+        headers = [FakeHeader(name, columnType) for name, columnType in
+                   [('id', 'ENTITYID'), ('name', 'STRING'), ('etag', 'STRING'), ('parentId', 'ENTITYID'),
+                    ('dataType', 'STRING'), ('readLength', 'INTEGER')]]
+        return FakeQueryResult(headers, self.filepath)
+
+
+def _records(test):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filepath = os.path.join(tmpdir, 'view.csv')
+        with open(filepath, 'w') as f:
+            f.write('id,name,etag,parentId,dataType,readLength\n')
+            f.write('syn10,s1.bam,e1,syn2,bam,100\n')
+            f.write('syn11,s2.csv,e2,syn2,,\n')
+        syn = FakeSynapse({'syn1': synapseclient.Project('project', id='syn1'),
+                           'syn2': synapseclient.Folder('folder', parentId='syn1', id='syn2')}, filepath)
+        test(syn)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_temporary_view_in_project():
+    """
+    The temporary view of a Folder is created in its Project, scoped to the Folder, and deleted afterwards.
+    """
+    def _test(syn):
+        records = list(views.iterViewRecords(syn, 'syn2'))
+        assert_equals([(record.id, record.name, record.etag, record.parentId) for record in records],
+                      [('syn10', 's1.bam', 'e1', 'syn2'), ('syn11', 's2.csv', 'e2', 'syn2')])
+        assert_equals(records[0].annotations, {'dataType': ['bam'], 'readLength': [100]})
+        assert_equals(records[1].annotations, {})
+        assert_equals([(view.parentId, view.scopeIds) for view in syn.stored], [('syn1', ['syn2'])])
+        assert_equals(syn.queries, ['select * from syn99'])
+        assert_equals(syn.deleted, ['syn99'])
+    _records(_test)
+
+
+def test_resolve_entities_with_view():
+    """
+    The 'view' backend of bulk.resolveEntities queries an existing view for the Files of a Project.
+    """
+    def _test(syn):
+        records = list(bulk.resolveEntities(syn, 'syn1', backend='view', viewId='syn50'))
+        assert_equals([record.id for record in records], ['syn10', 'syn11'])
+        assert_equals(syn.queries, ["select * from syn50 where projectId = 'syn1'"])
+        assert_equals(syn.stored, [])
+    _records(_test)